@@ -115,25 +115,31 @@ def setup(bot):
 
     API_BASE = "https://api.jikan.moe/v4"
 
+    async def jikan_get(path: str, params: Optional[dict] = None, ttl: int = 900) -> Optional[dict]:
+        """GET к Jikan через кэш ядра (память + диск); None — ошибка API"""
+        async def fetch():
+            async with bot.http.get(f"{API_BASE}{path}", params=params,
+                                    timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status != 200:
+                    logger.error(f"Jikan API error: {resp.status}")
+                    return None
+                return await resp.json()
+
+        return await bot.cache.get_or_fetch(
+            ("jikan", path, params), fetch, ttl=ttl, stale=ttl * 4, disk=True
+        )
+
     async def search_anime(query: str, limit: int = 5) -> Optional[List[dict]]:
         """Поиск аниме через Jikan API"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{API_BASE}/anime"
-                params = {
-                    "q": query,
-                    "limit": limit,
-                    "order_by": "popularity",
-                    "sort": "asc"
-                }
-
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return data.get("data", [])
-                    else:
-                        logger.error(f"Jikan API error: {resp.status}")
-                        return None
+            params = {
+                "q": query.strip().lower(),
+                "limit": limit,
+                "order_by": "popularity",
+                "sort": "asc"
+            }
+            data = await jikan_get("/anime", params)
+            return data.get("data", []) if data else None
         except Exception as e:
             logger.error(f"Anime search error: {e}")
             return None
@@ -141,15 +147,8 @@ def setup(bot):
     async def get_anime_by_id(anime_id: int) -> Optional[dict]:
         """Получить детальную информацию об аниме"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{API_BASE}/anime/{anime_id}"
-
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return data.get("data")
-                    else:
-                        return None
+            data = await jikan_get(f"/anime/{anime_id}", ttl=6 * 3600)
+            return data.get("data") if data else None
         except Exception as e:
             logger.error(f"Get anime error: {e}")
             return None
@@ -345,37 +344,36 @@ def setup(bot):
         status = await event.edit("🎲 Выбираю случайное аниме...")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{API_BASE}/random/anime"
-
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        anime = data.get("data")
-
-                        if not anime:
-                            await status.edit("❌ Ошибка получения случайного аниме")
-                            return
-
-                        text = format_anime_full(anime)
-                        image_url = anime.get("images", {}).get("jpg", {}).get("large_image_url")
-
-                        if image_url:
-                            try:
-                                await status.delete()
-                                await bot.client.send_file(
-                                    event.chat_id,
-                                    image_url,
-                                    caption=text,
-                                    parse_mode='markdown'
-                                )
-                            except Exception as e:
-                                logger.error(f"Failed to send image: {e}")
-                                await status.edit(text, link_preview=False)
-                        else:
+            url = f"{API_BASE}/random/anime"
+
+            async with bot.http.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    anime = data.get("data")
+
+                    if not anime:
+                        await status.edit("❌ Ошибка получения случайного аниме")
+                        return
+
+                    text = format_anime_full(anime)
+                    image_url = anime.get("images", {}).get("jpg", {}).get("large_image_url")
+
+                    if image_url:
+                        try:
+                            await status.delete()
+                            await bot.client.send_file(
+                                event.chat_id,
+                                image_url,
+                                caption=text,
+                                parse_mode='markdown'
+                            )
+                        except Exception as e:
+                            logger.error(f"Failed to send image: {e}")
                             await status.edit(text, link_preview=False)
                     else:
-                        await status.edit("❌ Ошибка API")
+                        await status.edit(text, link_preview=False)
+                else:
+                    await status.edit("❌ Ошибка API")
 
         except Exception as e:
             logger.error(f"Random anime error: {e}")
@@ -388,33 +386,28 @@ def setup(bot):
         status = await event.edit("📊 Загружаю топ аниме...")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{API_BASE}/top/anime"
-                params = {"limit": max_results}
-
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        results = data.get("data", [])
+            data = await jikan_get("/top/anime", {"limit": max_results}, ttl=3600)
+            if data is None:
+                await status.edit("❌ Ошибка API")
+                return
 
-                        if not results:
-                            await status.edit("❌ Не удалось получить топ")
-                            return
+            results = data.get("data", [])
+            if not results:
+                await status.edit("❌ Не удалось получить топ")
+                return
 
-                        text = f"📊 **Топ-{len(results)} аниме**\n{'━' * 30}\n\n"
+            text = f"📊 **Топ-{len(results)} аниме**\n{'━' * 30}\n\n"
 
-                        for i, anime in enumerate(results):
-                            text += format_anime_short(anime, i)
-                            text += "\n"
+            for i, anime in enumerate(results):
+                text += format_anime_short(anime, i)
+                text += "\n"
 
-                        text += f"\n💡 Подробнее: `{p}animeinfo <номер>`"
+            text += f"\n💡 Подробнее: `{p}animeinfo <номер>`"
 
-                        mod.settings["last_search"] = results
-                        mod.settings["last_search_chat"] = event.chat_id
+            mod.settings["last_search"] = results
+            mod.settings["last_search_chat"] = event.chat_id
 
-                        await status.edit(text, link_preview=False)
-                    else:
-                        await status.edit("❌ Ошибка API")
+            await status.edit(text, link_preview=False)
 
         except Exception as e:
             logger.error(f"Top anime error: {e}")
@@ -619,17 +619,12 @@ def setup(bot):
 
     # Watcher для авто-ответов
     async def gauto_watcher(event):
-        # Проверки
-        if not hasattr(event, 'chat_id'):
-            return
-
+        # Чат и направление уже отфильтрованы диспетчером
         chat_id = event.chat_id
-        if chat_id not in state["gauto_chats"]:
-            return
 
         # Не реагируем на свои сообщения
         user = await get_me()
-        if not user or event.sender_id == user.id or event.out:
+        if not user or event.sender_id == user.id:
             return
 
         # Проверяем вероятность
@@ -663,7 +658,7 @@ def setup(bot):
 
     # Регистрируем обработчики
     callback_h = bot.client.on(events.CallbackQuery(pattern=b"gem_"))(callback_handler)
-    watcher_h = bot.client.on(events.NewMessage(incoming=True))(gauto_watcher)
+    bot.add_watcher(MOD_NAME, gauto_watcher, incoming=True, chats=lambda: state["gauto_chats"])
 
     # ==================== СБОРКА МОДУЛЯ ====================
 
@@ -735,7 +730,7 @@ def setup(bot):
         "ginfo": Command("ginfo", cmd_ginfo, "Информация о модуле", MOD_NAME, f"{p}ginfo", "ai"),
     }
 
-    mod.handlers = [callback_h, watcher_h]
+    mod.handlers = [callback_h]
 
     async def on_unload():
         await save_data()
@@ -6,7 +6,6 @@
 # requires: googlesearch-python, duckduckgo-search
 
 import uuid
-import time
 import logging
 from dataclasses import dataclass, field
 from typing import Dict, List, Callable, Any, Optional
@@ -85,19 +84,28 @@ def setup(bot):
     mod.requirements = ["googlesearch-python", "duckduckgo-search"]
 
     # ==================== ХРАНИЛИЩЕ ====================
-    cache = {}
+    # Выдача для пагинации и сами запросы живут в общем кэше ядра (LRU + TTL);
+    # одинаковые одновременные запросы склеиваются в один поиск.
 
     def set_cache(key: str, value: Any, ttl: int = 600):
-        cache[key] = {"value": value, "expires": time.time() + ttl}
+        bot.cache.set((MOD_NAME, key), value, ttl)
 
     def get_cache(key: str) -> Any:
-        entry = cache.get(key)
-        if not entry:
-            return None
-        if time.time() > entry["expires"]:
-            del cache[key]
-            return None
-        return entry["value"]
+        return bot.cache.get((MOD_NAME, key))
+
+    async def cached_search(kind: str, query: str, max_res: int) -> list:
+        """Поиск в пуле sdk (библиотеки синхронные) через кэш ядра"""
+        def run():
+            if kind == "google":
+                return list(search(query, num_results=max_res, advanced=True))
+            with DDGS() as ddgs:
+                return list(ddgs.images(query, max_results=max_res))
+
+        return await bot.cache.get_or_fetch(
+            (MOD_NAME, kind, query.strip().lower(), max_res),
+            lambda: offload(run, pool="sdk"),
+            ttl=module_config(MOD_NAME, "cache_ttl", 600),
+        )
 
     # ==================== ИКОНКИ ====================
     ICON_G = "https://kappa.lol/HCIjwW"
@@ -145,7 +153,7 @@ def setup(bot):
         await event.edit(f"🔍 Поиск: **{query}**...")
 
         try:
-            results = list(search(query, num_results=max_res, advanced=True))
+            results = await cached_search("google", query, max_res)
 
             if not results:
                 await event.edit("❌ Ничего не найдено")
@@ -169,7 +177,7 @@ def setup(bot):
 
             # Подсказка про inline
             if bot.inline_panel and bot.inline_panel.active:
-                ib = await bot.inline_panel.inline_bot.get_me()
+                ib = await bot.identity.inline_me()
                 text += f"\n💡 Пагинация: `@{ib.username} google {query}`"
 
             await event.edit(text, link_preview=False)
@@ -198,8 +206,7 @@ def setup(bot):
         await event.edit(f"🖼 Поиск: **{query}**...")
 
         try:
-            with DDGS() as ddgs:
-                results = list(ddgs.images(query, max_results=max_res))
+            results = await cached_search("img", query, max_res)
 
             if not results:
                 await event.edit("❌ Ничего не найдено")
@@ -215,7 +222,7 @@ def setup(bot):
                 text += f"_Найдено {len(results)} изображений_\n"
 
             if bot.inline_panel and bot.inline_panel.active:
-                ib = await bot.inline_panel.inline_bot.get_me()
+                ib = await bot.identity.inline_me()
                 text += f"\n💡 Пагинация: `@{ib.username} img {query}`"
 
             await event.edit(text, link_preview=True)
@@ -259,7 +266,7 @@ def setup(bot):
                 uid = str(uuid.uuid4())[:8]
 
                 if mode == "google":
-                    results = list(search(query, num_results=max_res, advanced=True))
+                    results = await cached_search("google", query, max_res)
                     if not results:
                         raise Exception("Ничего не найдено")
 
@@ -291,8 +298,7 @@ def setup(bot):
                     if not DDG_OK:
                         raise Exception("duckduckgo-search не установлена")
 
-                    with DDGS() as ddgs:
-                        results = list(ddgs.images(query, max_results=max_res))
+                    results = await cached_search("img", query, max_res)
 
                     if not results:
                         raise Exception("Ничего не найдено")
@@ -419,7 +425,6 @@ def setup(bot):
     # ==================== LIFECYCLE ====================
 
     async def on_unload():
-        cache.clear()
         logger.info(f"{MOD_NAME}: выгружен")
 
     mod.on_unload = on_unload
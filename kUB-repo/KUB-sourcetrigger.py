@@ -11,8 +11,6 @@ import asyncio
 import json
 import os
 
-from telethon import events
-
 logger = logging.getLogger("KUB.sourcetrigger")
 
 TRIGGERS_FILE = "sourcetrigger_triggers.json"
@@ -174,8 +172,9 @@ def setup(bot):
 
         if event:
             status_msg = await event.edit("💎 Индексация...")
+            live = LiveMessage(status_msg, interval=2.0)
         else:
-            status_msg = None
+            status_msg = live = None
 
         triggers.clear()
         counts = {"exact": 0, "contains": 0, "exact_delete": 0, "regex": 0, "regex_delete": 0}
@@ -203,11 +202,8 @@ def setup(bot):
                         counts[ttype] += 1
                     tasks.clear()
 
-                    if status_msg and processed % (BATCH_SIZE * 5) == 0:
-                        try:
-                            await status_msg.edit(f"💎 Обработано {processed}...")
-                        except Exception:
-                            pass
+                    if live:
+                        live.update(f"💎 Обработано {processed}...")
 
             # Остаток
             if tasks:
@@ -227,7 +223,7 @@ def setup(bot):
 
             if event:
                 total = sum(counts.values())
-                await status_msg.edit(
+                await live.close(
                     f"✅ **Индексация завершена!**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
                     f"📊 Всего: **{total}** триггеров\n"
                     f"  🎯 Точных: {counts['exact']}\n"
@@ -239,8 +235,8 @@ def setup(bot):
                 )
         except Exception as e:
             logger.error(f"parse error: {e}")
-            if event:
-                await event.edit(f"❌ Ошибка: {str(e)[:200]}")
+            if live:
+                await live.close(f"❌ Ошибка: {str(e)[:200]}")
 
     # ─── Авто-парсинг при загрузке ───
 
@@ -258,9 +254,6 @@ def setup(bot):
     async def _source_watcher(event):
         """Следит за новыми сообщениями в канале-источнике."""
         try:
-            source_id = get_source_id()
-            if not source_id or event.chat_id != source_id:
-                return
             result = await process_message_for_triggers(event.message)
             if not result:
                 return
@@ -277,7 +270,7 @@ def setup(bot):
     async def _trigger_watcher(event):
         """Следит за исходящими — срабатывание триггеров."""
         try:
-            if not event.out or not event.text:
+            if not event.text:
                 return
 
             source_id = get_source_id()
@@ -354,9 +347,9 @@ def setup(bot):
         except Exception as e:
             logger.error(f"trigger watcher: {e}")
 
-    client.add_event_handler(_source_watcher, events.NewMessage())
-    client.add_event_handler(_trigger_watcher, events.NewMessage(outgoing=True))
-    mod.handlers.extend([_source_watcher, _trigger_watcher])
+    # Канал-источник меняется из настроек — chats передаётся как callable
+    bot.add_watcher("sourcetrigger", _source_watcher, incoming=True, outgoing=True, chats=get_source_id)
+    bot.add_watcher("sourcetrigger", _trigger_watcher, incoming=False, outgoing=True)
 
     # ─── Команды ───
 
@@ -545,14 +538,5 @@ def setup(bot):
         "stinfo": Command("stinfo", cmd_stinfo, "Инфо и справка", "sourcetrigger", f"{p}stinfo"),
     }
 
-    def _unload():
-        try:
-            client.remove_event_handler(_source_watcher)
-            client.remove_event_handler(_trigger_watcher)
-        except Exception:
-            pass
-
-    mod.on_unload = _unload
-
     bot.module_manager.register_module(mod)
     bot.register_commands(mod)
@@ -4,7 +4,7 @@ Grid 3x3 for stories.
 Splits a photo into a 3x3 grid and posts each part as a pinned story.
 
 Author: @ke_mods (fixed for KUB)
-Version: 1.1.1
+Version: 1.2.0
 License: CC BY-ND 4.0
 """
 # requires: pillow
@@ -42,13 +42,63 @@ class Module:
     requirements: List[str] = field(default_factory=list)
 
 
+UPLOAD_PARALLEL = 3  # одновременных загрузок плиток
+TARGET_ASPECT = 0.8  # пропорции сетки, как у профиля в Telegram
+
+
+def prepare_image(photo_bytes: bytes):
+    """Декодирует фото и подгоняет пропорции под сетку (выполняется в пуле)"""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(photo_bytes))
+    img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    w, h = img.size
+    if abs(w / h - TARGET_ASPECT) > 0.05:
+        resample = getattr(Image, "Resampling", Image).LANCZOS
+        img = img.resize((w, int(w / TARGET_ASPECT)), resample)
+    return img
+
+
+def grid_boxes(w: int, h: int) -> List[tuple]:
+    """Рамки 9 плиток в порядке публикации (последняя история — левая верхняя)"""
+    piece_w = w / 3
+    piece_h = h / 3
+    boxes = []
+    for r in range(3):
+        for c in range(3):
+            left = math.floor(c * piece_w)
+            upper = math.floor(r * piece_h)
+            right = math.floor((c + 1) * piece_w) if c < 2 else w
+            lower = math.floor((r + 1) * piece_h) if r < 2 else h
+            boxes.append((left, upper, right, lower))
+    boxes.reverse()
+    return boxes
+
+
+def encode_tile(img, box: tuple) -> bytes:
+    out = io.BytesIO()
+    img.crop(box).save(out, "JPEG", quality=95)
+    return out.getvalue()
+
+
+def story_id_from(result) -> Optional[int]:
+    for update in getattr(result, "updates", None) or ():
+        if isinstance(update, types.UpdateStory):
+            return update.story.id
+        if isinstance(update, types.UpdateStoryID):
+            return update.id
+    return None
+
+
 def setup(bot):
     MOD_NAME = "photostories"
     mod = Module(
         name=MOD_NAME,
         description="Grid 3x3 for stories — splits a photo into 9 parts and posts them as pinned stories",
         author="@ke_mods (fixed)",
-        version="1.1.1",
+        version="1.2.0",
         requirements=["pillow"],
     )
     p = bot.config.prefix
@@ -65,8 +115,8 @@ def setup(bot):
             "key": "delay",
             "label": "Delay (sec)",
             "type": "int",
-            "default": 2,
-            "description": "Delay between uploads to prevent FloodWait",
+            "default": 0,
+            "description": "Extra pause between stories (pacing and FloodWait are handled by the core scheduler)",
         }
     ]
 
@@ -78,6 +128,7 @@ def setup(bot):
             "flood": "⏳ Жду {}с из-за флуда...",
             "done": "✅ Готово! Сетка 3x3 опубликована в профиле.",
             "err": "❌ Ошибка: {}",
+            "pin_err": "⚠️ Не удалось закрепить истории ({} шт.): {}",
         },
         "en": {
             "no_rep": "❗️ Reply to an image!",
@@ -86,16 +137,14 @@ def setup(bot):
             "flood": "⏳ Waiting {}s due to flood...",
             "done": "✅ Done! 3x3 grid posted to profile.",
             "err": "❌ Error: {}",
+            "pin_err": "⚠️ Failed to pin stories ({}): {}",
         },
     }
 
     async def cmd_pts(event):
         """Split a photo into a 3x3 grid and post as pinned stories."""
-        from PIL import Image
-
-        # ИСПРАВЛЕНО: Убран аргумент 'bot' из вызова module_config
         lang = module_config(MOD_NAME, "language", "ru")
-        delay = module_config(MOD_NAME, "delay", 2)
+        delay = module_config(MOD_NAME, "delay", 0)
 
         t = strings.get(lang, strings["en"])
 
@@ -104,93 +153,82 @@ def setup(bot):
             await event.edit(t["no_rep"])
             return
 
+        status = await event.edit(t["work"])
         try:
-            await event.edit(t["work"])
             photo_bytes = await reply.download_media(bytes)
-            img = Image.open(io.BytesIO(photo_bytes))
+            # декодирование и ресайз — один раз, JPEG-кодирование плиток — параллельно;
+            # PIL отпускает GIL, так что пул cpu цикл не задерживает
+            img = await offload(prepare_image, photo_bytes, pool="cpu")
+            parts = await asyncio.gather(*(
+                offload(encode_tile, img, box, pool="cpu") for box in grid_boxes(*img.size)
+            ))
         except Exception as e:
             await event.edit(t["err"].format(str(e)))
             return
 
-        w, h = img.size
-
-        # Корректируем размер, если нужно (используем безопасный доступ к Resampling)
-        target_aspect = 0.8
-        if abs(w / h - target_aspect) > 0.05:
-            new_h = int(w / target_aspect)
-            resample = getattr(Image, "Resampling", Image).LANCZOS
-            try:
-                img = img.resize((w, new_h), resample)
-            except Exception:
-                img = img.resize((w, new_h), Image.LANCZOS)
-            w, h = img.size
+        live = LiveMessage(status)
 
-        parts = []
-        piece_w = w / 3
-        piece_h = h / 3
+        async def on_flood(seconds):
+            live.update(t["flood"].format(seconds))
 
-        for r in range(3):
-            for c in range(3):
-                left = math.floor(c * piece_w)
-                upper = math.floor(r * piece_h)
-                right = math.floor((c + 1) * piece_w) if c < 2 else w
-                lower = math.floor((r + 1) * piece_h) if r < 2 else h
+        def rpc(fn, kind):
+            # темп и повтор после FloodWait — на стороне планировщика ядра
+            return bot.scheduler.run(fn, kind=kind, priority=bot.scheduler.BACKGROUND,
+                                     on_flood=on_flood)
 
-                parts.append(img.crop((left, upper, right, lower)))
+        upload_slots = asyncio.Semaphore(UPLOAD_PARALLEL)
 
-        parts.reverse()
+        async def upload(i, data):
+            async with upload_slots:
+                return await rpc(lambda: bot.client.upload_file(
+                    io.BytesIO(data), file_name=f"story_{i}.jpg"), "upload")
 
+        # загрузки идут параллельно, а истории публикуются строго по порядку
+        # по мере готовности своих файлов
+        uploads = [asyncio.ensure_future(upload(i, data)) for i, data in enumerate(parts)]
+        story_ids = []
         total = len(parts)
-        for i, part in enumerate(parts):
-            await event.edit(t["uploading"].format(i + 1))
-
-            out = io.BytesIO()
-            part.save(out, "JPEG", quality=95)
-            out.seek(0)
-
-            try:
-                uploaded_file = await bot.client.upload_file(out, file_name=f"story_{i}.jpg")
-
-                result = await bot.client(functions.stories.SendStoryRequest(
+        result_text = t["done"]
+        try:
+            for i, fut in enumerate(uploads):
+                live.update(t["uploading"].format(i + 1))
+                uploaded_file = await fut
+                result = await rpc(lambda: bot.client(functions.stories.SendStoryRequest(
                     peer=types.InputPeerSelf(),
                     media=types.InputMediaUploadedPhoto(uploaded_file),
                     privacy_rules=[types.InputPrivacyValueAllowAll()],
                     period=86400,
-                ))
-
-                story_id = None
-                if result.updates:
-                    for update in result.updates:
-                        if isinstance(update, types.UpdateStory):
-                            story_id = update.story.id
-                            break
-                        elif isinstance(update, types.UpdateStoryID):
-                            story_id = update.id
-                            break
-
+                )), "story")
+                story_id = story_id_from(result)
                 if story_id:
-                    try:
-                        await bot.client(functions.stories.TogglePinnedRequest(
-                            peer=types.InputPeerSelf(),
-                            id=[story_id],
-                            pinned=True,
-                        ))
-                    except Exception:
-                        pass
-
-                if i < total - 1:
+                    story_ids.append(story_id)
+                if delay and i < total - 1:
                     await asyncio.sleep(delay)
-
-            except errors.FloodWaitError as e:
-                await event.edit(t["flood"].format(e.seconds))
-                await asyncio.sleep(e.seconds + 1)
-                await event.edit(t["err"].format("FloodWait."))
-                return
-            except Exception as e:
-                await event.edit(t["err"].format(str(e)))
-                return
-
-        await event.edit(t["done"])
+        except errors.FloodWaitError as e:
+            # планировщик уже подождал сколько мог — дальше не продолжаем
+            result_text = t["err"].format(f"FloodWait {e.seconds}s.")
+        except Exception as e:
+            result_text = t["err"].format(str(e))
+        finally:
+            for fut in uploads:
+                if not fut.done():
+                    fut.cancel()
+                elif not fut.cancelled():
+                    fut.exception()  # забрать ошибку, чтобы не было «never retrieved»
+            # уже опубликованные истории закрепляем при любом исходе —
+            # иначе они исчезнут через сутки
+            if story_ids:
+                try:
+                    await rpc(lambda: bot.client(functions.stories.TogglePinnedRequest(
+                        peer=types.InputPeerSelf(),
+                        id=story_ids,
+                        pinned=True,
+                    )), "story")
+                except Exception as e:
+                    pin_err = t["pin_err"].format(len(story_ids), e)
+                    result_text = pin_err if result_text == t["done"] else f"{result_text}\n{pin_err}"
+
+        await live.close(result_text)
 
     mod.commands = {
         "pts": Command(
@@ -72,10 +72,17 @@ def setup(bot):
         }
         return g
 
+    async def _get_me(bot_ref):
+        """get_me() через кэш идентичности ядра (если есть)."""
+        ident = getattr(bot_ref, "identity", None)
+        if ident is not None:
+            return await ident.me()
+        return await bot_ref.client.get_me()
+
     async def _enrich_globals(g, event, bot_ref):
         """Добавляет асинхронные переменные в globals."""
         try:
-            g["me"] = await bot_ref.client.get_me()
+            g["me"] = await _get_me(bot_ref)
         except Exception:
             pass
         try:
@@ -323,7 +330,7 @@ def setup(bot):
         interactive_ns["config"] = bot.config
 
         try:
-            interactive_ns["me"] = await bot.client.get_me()
+            interactive_ns["me"] = await _get_me(bot)
         except Exception:
             pass
         try:
@@ -652,7 +659,7 @@ def setup(bot):
         """Подробная информация о системе."""
         import struct
 
-        me = await bot.client.get_me()
+        me = await _get_me(bot)
         up = time.time() - bot.start_time
 
         # Память процесса
@@ -48,13 +48,11 @@ def setup(bot):
             "img": "✅ Ваша аниме-картинка\n🔗 [Ссылка]({})",
             "loading": "✨ Загрузка изображения...",
             "error": "🚫 Произошла ошибка...",
-            "no_aiohttp": "❌ Установите aiohttp: `pip install aiohttp`",
         },
         "en": {
             "img": "✅ Your anime pic\n🔗 [URL]({})",
             "loading": "✨ Loading image...",
             "error": "🚫 An unexpected error occurred...",
-            "no_aiohttp": "❌ Install aiohttp: `pip install aiohttp`",
         },
     }
 
@@ -64,12 +62,6 @@ def setup(bot):
 
     async def cmd_rapic(event):
         """Случайная аниме-картинка."""
-        try:
-            import aiohttp
-        except ImportError:
-            await event.edit(get_strings()["no_aiohttp"])
-            return
-
         s = get_strings()
         await event.edit(s["loading"])
 
@@ -77,11 +69,10 @@ def setup(bot):
             category = mc(bot, "rapic", "api_category", "cute")
             url = f"https://api.nekosia.cat/api/v1/images/{category}?count=1"
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as res:
-                    res.raise_for_status()
-                    data = await res.json()
-                    image_url = data["image"]["original"]["url"]
+            async with bot.http.get(url) as res:
+                res.raise_for_status()
+                data = await res.json()
+                image_url = data["image"]["original"]["url"]
 
             await event.delete()
             await client.send_file(
@@ -65,8 +65,8 @@ def setup(bot):
             "key": "delay",
             "label": "Задержка (сек)",
             "type": "float",
-            "default": 0.1,
-            "description": "Задержка между отправками",
+            "default": 0.0,
+            "description": "Дополнительная пауза между отправками (темп и FloodWait держит планировщик ядра)",
         },
         {
             "key": "auto_delete",
@@ -77,6 +77,15 @@ def setup(bot):
         },
     ]
 
+    # ==================== ОТПРАВКА ====================
+
+    def send(fn, chat_id, live, i, count):
+        """Отправка через планировщик ядра: фоновый приоритет, ожидание FloodWait"""
+        def on_flood(seconds):
+            live.update(f"⏳ FloodWait {seconds}с, продолжу сам: {i}/{count}...")
+        return bot.scheduler.run(fn, chat=chat_id, kind="send",
+                                 priority=bot.scheduler.BACKGROUND, on_flood=on_flood)
+
     # ==================== КОМАНДЫ ====================
 
     async def cmd_spam(event):
@@ -110,7 +119,7 @@ def setup(bot):
 
         # Читаем настройки
         max_limit = module_config(MOD_NAME, "max_limit", 100)
-        delay = module_config(MOD_NAME, "delay", 0.1)
+        delay = module_config(MOD_NAME, "delay", 0.0)
         auto_del = module_config(MOD_NAME, "auto_delete", True)
 
         if count > max_limit:
@@ -118,24 +127,23 @@ def setup(bot):
             return
 
         status = await event.edit(f"🚀 Отправка {count} сообщений...")
+        live = LiveMessage(status, interval=2.0)
 
         try:
             chat_id = event.chat_id
 
             for i in range(count):
-                await bot.client.send_message(chat_id, text)
+                await send(lambda: bot.client.send_message(chat_id, text), chat_id, live, i, count)
 
-                # Обновляем прогресс каждые 10 сообщений
-                if (i + 1) % 10 == 0:
-                    try:
-                        await status.edit(f"🚀 Отправка: {i+1}/{count}...")
-                    except:
-                        pass
+                # Прогресс: правки схлопываются LiveMessage
+                live.update(f"🚀 Отправка: {i+1}/{count}...")
 
-                await asyncio.sleep(delay)
+                if delay > 0:
+                    await asyncio.sleep(delay)
 
             # Завершение
             if auto_del:
+                live.cancel()
                 await status.delete()
                 confirm = await event.respond(f"✅ Отправлено **{count}** сообщений")
                 await asyncio.sleep(3)
@@ -144,11 +152,11 @@ def setup(bot):
                 except:
                     pass
             else:
-                await status.edit(f"✅ Отправлено **{count}** сообщений")
+                await live.close(f"✅ Отправлено **{count}** сообщений")
 
         except Exception as e:
             logger.error(f"Spam error: {e}")
-            await status.edit(f"❌ Ошибка: {e}")
+            await live.close(f"❌ Ошибка: {e}")
 
     async def cmd_rspam(event):
         """Спам ответами на сообщение"""
@@ -185,7 +193,7 @@ def setup(bot):
             return
 
         max_limit = module_config(MOD_NAME, "max_limit", 100)
-        delay = module_config(MOD_NAME, "delay", 0.1)
+        delay = module_config(MOD_NAME, "delay", 0.0)
         auto_del = module_config(MOD_NAME, "auto_delete", True)
 
         if count > max_limit:
@@ -193,20 +201,19 @@ def setup(bot):
             return
 
         status = await event.edit(f"🚀 Отправка {count} ответов...")
+        live = LiveMessage(status, interval=2.0)
 
         try:
             for i in range(count):
-                await reply.reply(text)
+                await send(lambda: reply.reply(text), event.chat_id, live, i, count)
 
-                if (i + 1) % 10 == 0:
-                    try:
-                        await status.edit(f"🚀 Отправка: {i+1}/{count}...")
-                    except:
-                        pass
+                live.update(f"🚀 Отправка: {i+1}/{count}...")
 
-                await asyncio.sleep(delay)
+                if delay > 0:
+                    await asyncio.sleep(delay)
 
             if auto_del:
+                live.cancel()
                 await status.delete()
                 confirm = await event.respond(f"✅ Отправлено **{count}** ответов")
                 await asyncio.sleep(3)
@@ -215,11 +222,11 @@ def setup(bot):
                 except:
                     pass
             else:
-                await status.edit(f"✅ Отправлено **{count}** ответов")
+                await live.close(f"✅ Отправлено **{count}** ответов")
 
         except Exception as e:
             logger.error(f"Reply spam error: {e}")
-            await status.edit(f"❌ Ошибка: {e}")
+            await live.close(f"❌ Ошибка: {e}")
 
     async def cmd_delayspam(event):
         """Спам с большой задержкой"""
@@ -277,24 +284,24 @@ def setup(bot):
             f"Общее время: ~{time_str.strip()}"
         )
 
+        live = LiveMessage(status)
+
         try:
             chat_id = event.chat_id
 
             for i in range(count):
-                await bot.client.send_message(chat_id, text)
+                await send(lambda: bot.client.send_message(chat_id, text), chat_id, live, i, count)
 
-                try:
-                    await status.edit(
-                        f"⏳ Отправлено: {i+1}/{count}\n"
-                        f"Следующее через: {delay_sec}с"
-                    )
-                except:
-                    pass
+                live.update(
+                    f"⏳ Отправлено: {i+1}/{count}\n"
+                    f"Следующее через: {delay_sec}с"
+                )
 
                 if i < count - 1:
                     await asyncio.sleep(delay_sec)
 
             if auto_del:
+                live.cancel()
                 await status.delete()
                 confirm = await event.respond(f"✅ Завершено: {count} сообщений")
                 await asyncio.sleep(3)
@@ -303,11 +310,11 @@ def setup(bot):
                 except:
                     pass
             else:
-                await status.edit(f"✅ Завершено: {count} сообщений")
+                await live.close(f"✅ Завершено: {count} сообщений")
 
         except Exception as e:
             logger.error(f"Delay spam error: {e}")
-            await status.edit(f"❌ Ошибка: {e}")
+            await live.close(f"❌ Ошибка: {e}")
 
     # ==================== РЕГИСТРАЦИЯ ====================
 
@@ -13,7 +13,6 @@ import os
 import random
 import time as _time
 
-from telethon import events
 from telethon.tl.types import ReactionEmoji, ReactionCustomEmoji
 from telethon.tl.functions.messages import SendReactionRequest
 
@@ -210,9 +209,16 @@ def setup(bot):
             else:  # all
                 chosen = formatted
 
-            await client(SendReactionRequest(
-                peer=message.chat_id, msg_id=message.id, reaction=chosen
-            ))
+            # реакции не критичны: при FloodWait/заторе не ждём, а пропускаем
+            await bot.scheduler.run(
+                lambda: client(SendReactionRequest(
+                    peer=message.chat_id, msg_id=message.id, reaction=chosen
+                )),
+                chat=message.chat_id, kind="react", priority=bot.scheduler.BACKGROUND,
+                retries=0, max_delay=5,
+            )
+        except bot.scheduler.Backpressure:
+            logger.debug("react skipped: rate limited")
         except Exception as e:
             logger.error(f"react error: {e}")
 
@@ -227,11 +233,6 @@ def setup(bot):
             if not msg or not msg.text:
                 return
 
-            # int сравнение — оба int
-            chat_id = int(event.chat_id)
-            if chat_id in ignored_chats:
-                return
-
             if msg.out and not cfg_bool("on_own", False):
                 return
 
@@ -252,8 +253,12 @@ def setup(bot):
         except Exception as e:
             logger.error(f"autoreact handler: {e}")
 
-    client.add_event_handler(_autoreact_handler, events.NewMessage())
-    mod.handlers.append(_autoreact_handler)
+    # Игнор-лист фильтрует диспетчер (callable — множество пересоздаётся при загрузке)
+    bot.add_watcher(
+        "autoreact", _autoreact_handler,
+        incoming=True, outgoing=True,
+        exclude_chats=lambda: ignored_chats,
+    )
 
     # ─── Команды ───
 
@@ -500,13 +505,5 @@ def setup(bot):
         "helpreact": Command("helpreact", cmd_helpreact, "Помощь", "autoreact", f"{p}helpreact"),
     }
 
-    def _unload():
-        try:
-            client.remove_event_handler(_autoreact_handler)
-        except Exception:
-            pass
-
-    mod.on_unload = _unload
-
     bot.module_manager.register_module(mod)
     bot.register_commands(mod)
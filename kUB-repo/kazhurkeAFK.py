@@ -14,7 +14,6 @@ from collections import defaultdict
 from dataclasses import dataclass, field
 from typing import Dict, List, Callable, Any, Optional
 
-from telethon import events
 from telethon.tl import types, functions
 
 
@@ -406,8 +405,6 @@ def setup(bot):
     # ─── Watcher ───
 
     async def watcher_handler(event):
-        if event.out:
-            return
         if not _state.is_afk:
             return
 
@@ -415,7 +412,7 @@ def setup(bot):
         if not isinstance(message, types.Message):
             return
 
-        me = await bot.client.get_me()
+        me = await identity.me()
         is_mentioned = message.mentioned
         is_pm = event.is_private
 
@@ -456,8 +453,7 @@ def setup(bot):
         except Exception as e:
             logger.error(f"Ошибка при отправке AFK-ответа: {e}")
 
-    handler = bot.client.on(events.NewMessage(incoming=True))(watcher_handler)
-    mod.handlers.append(handler)
+    bot.add_watcher(MOD_NAME, watcher_handler, incoming=True)
 
     # ─── on_unload ───
 
@@ -2,16 +2,20 @@
 """
 🎵 Spotify — слушай музыку, тексты, карточки треков
 authors: @LoLpryvet, port: @Hairpin00 (конвертировано для kazhurkeUserBot)
-version: 1.0.2
+version: 1.2.0
 requires: spotipy, aiohttp, pillow
 """
 
 import asyncio
+import collections
+import functools
+import hashlib
 import logging
-import tempfile
 import os
 import re
 import textwrap
+import threading
+import time
 from io import BytesIO
 
 logger = logging.getLogger("KUB.spots")
@@ -36,6 +40,304 @@ try:
 except ImportError:
     HAS_PIL = False
 
+# ─── Рендер карточек ───
+# Чистые функции без сети: вызываются в пуле cpu ядра и возвращают PNG в памяти.
+
+CARD_ART_CACHE = 32  # обложек в LRU (по id альбома)
+CARD_CACHE = 16  # готовых live-карточек (по id трека)
+FONT_DIR = os.path.join(".kub_cache", "spots")
+FONT_FALLBACKS = ["/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", "arial.ttf", "DejaVuSans-Bold.ttf"]
+
+_font_local = threading.local()
+
+
+def _card_font(font_data, size):
+    # FreeType-шрифт нельзя делить между потоками — у каждого рабочего свой набор
+    fonts = getattr(_font_local, "fonts", None)
+    if fonts is None:
+        fonts = _font_local.fonts = {}
+    key = (hash(font_data) if font_data else None, size)
+    font = fonts.get(key)
+    if font is None:
+        font = None
+        if font_data:
+            try:
+                font = ImageFont.truetype(BytesIO(font_data), size)
+            except Exception:
+                font = None
+        for fallback in ([] if font else FONT_FALLBACKS):
+            try:
+                font = ImageFont.truetype(fallback, size)
+                break
+            except Exception:
+                continue
+        font = fonts[key] = font or ImageFont.load_default()
+    return font
+
+
+def is_font(data):
+    """Годится ли содержимое как шрифт (а не страница ошибки с кодом 200)"""
+    try:
+        ImageFont.truetype(BytesIO(data), 12)
+        return True
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=4)
+def _gradient_mask(w, h):
+    # затемнение к низу до 20%: маска смешивания с чёрным, без цикла по строкам
+    return Image.linear_gradient("L").resize((w, h)).point(lambda v: v // 5)
+
+
+@functools.lru_cache(maxsize=4)
+def _round_mask(size, radius):
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).rounded_rectangle([0, 0, size, size], radius=radius, fill=255)
+    return mask
+
+
+def render_card(track_info, art_bytes, font_data=None, with_time=True):
+    """Карточка трека → BytesIO с PNG (имя файла задано для send_file)"""
+    W = 600
+    H = 250 if with_time else 200
+    title_font = _card_font(font_data, 34)
+    artist_font = _card_font(font_data, 22)
+
+    art_orig = Image.open(BytesIO(art_bytes)).convert("RGB")
+    stat = ImageStat.Stat(art_orig.resize((50, 50)))
+    dr, dg, db = [int(x) for x in stat.mean[:3]]
+
+    h, sv, v = colorsys.rgb_to_hsv(dr / 255, dg / 255, db / 255)
+    v = max(0.15, v * 0.4)
+    sv = min(1.0, sv * 1.1)
+    bg_color = tuple(int(x * 255) for x in colorsys.hsv_to_rgb(h, sv, v))
+
+    card = Image.composite(Image.new("RGB", (W, H), 0), Image.new("RGB", (W, H), bg_color),
+                           _gradient_mask(W, H))
+    draw = ImageDraw.Draw(card)
+
+    asize = 180 if with_time else 160
+    art = art_orig.resize((asize, asize), Image.Resampling.LANCZOS)
+    ax = 20 if with_time else 15
+    ay = (H - asize) // 2
+    card.paste(art, (ax, ay), _round_mask(asize, 15))
+
+    tx = ax + asize + 20 if with_time else ax + asize + 15
+    name = track_info["track_name"]
+    if len(name) > 25:
+        name = name[:25] + "..."
+    wrapped = textwrap.wrap(name, width=18)
+    ty = ay + 5
+    for i, line in enumerate(wrapped[:2]):
+        draw.text((tx, ty + i * 40), line, font=title_font, fill="white")
+
+    aname = track_info["artist_name"]
+    if len(aname) > 30:
+        aname = aname[:30] + "..."
+    aty = ty + (len(wrapped) * 40 if wrapped else 40)
+    draw.text((tx, aty), aname, font=artist_font, fill="#A0A0A0")
+
+    if with_time:
+        time_font = _card_font(font_data, 18)
+        py = H - 45
+        pw = W - tx - 20
+        ph = 5
+        draw.rounded_rectangle([tx, py, tx + pw, py + ph], radius=2, fill="#555555")
+        cur = track_info.get("current_time", "0:00")
+        dur = track_info["duration"]
+        try:
+            cp = cur.split(":")
+            cs = int(cp[0]) * 60 + int(cp[1])
+            dp = dur.split(":")
+            ds = int(dp[0]) * 60 + int(dp[1])
+            ratio = cs / ds if ds > 0 else 0
+        except Exception:
+            ratio = 0
+        fill = int(pw * ratio)
+        draw.rounded_rectangle([tx, py, tx + fill, py + ph], radius=2, fill="#1DB954")
+        draw.text((tx, py + 10), cur, font=time_font, fill="#A0A0A0")
+        tb = draw.textbbox((0, 0), dur, font=time_font)
+        draw.text((tx + pw - (tb[2] - tb[0]), py + 10), dur, font=time_font, fill="#A0A0A0")
+    else:
+        live_font = _card_font(font_data, 16)
+        ltxt = "LIVE"
+        lb = draw.textbbox((0, 0), ltxt, font=live_font)
+        lx = W - (lb[2] - lb[0]) - 20
+        draw.ellipse([lx - 20, 20, lx - 8, 32], fill="#FF0000")
+        draw.text((lx, 18), ltxt, font=live_font, fill="#FF0000")
+
+    out = BytesIO()
+    card.save(out, "PNG")
+    out.name = f"spots_{track_info['track_id']}.png"
+    out.seek(0)
+    return out
+
+
+# ─── Опрос воспроизведения ───
+# Один опросчик на модуль: realtime-текст и live-карточка подписываются на него,
+# а не ходят в Spotify каждый своим клиентом раз в секунду.
+
+PLAYER_URL = "https://api.spotify.com/v1/me/player"
+QUEUE_URL = "https://api.spotify.com/v1/me/player/queue"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+POLL_MIN = 1.0  # сек. — у конца трека
+POLL_MAX = 5.0  # сек. — середина трека: прогресс досчитывается локально
+POLL_IDLE = 3.0  # сек. — пауза, тишина или ошибка
+NOTHING_MAX = 30  # сек. без трека — сеанс закрывается
+PAUSE_MAX = 120  # сек. на паузе — сеанс закрывается
+
+
+class Playback:
+    """Снимок /me/player; прогресс экстраполируется от момента запроса"""
+    __slots__ = ("raw", "item", "track_id", "is_playing", "progress_ms", "duration_ms", "fetched_at")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.item = (raw or {}).get("item")
+        self.track_id = (self.item or {}).get("id", "")
+        self.is_playing = bool((raw or {}).get("is_playing"))
+        self.progress_ms = (raw or {}).get("progress_ms") or 0
+        self.duration_ms = (self.item or {}).get("duration_ms") or 0
+        self.fetched_at = time.monotonic()
+
+    def progress(self, now=None):
+        if not self.is_playing:
+            return self.progress_ms
+        now = time.monotonic() if now is None else now
+        ms = self.progress_ms + int((now - self.fetched_at) * 1000)
+        return min(ms, self.duration_ms) if self.duration_ms else ms
+
+    def remaining(self):
+        return max(0, self.duration_ms - self.progress()) if self.duration_ms else None
+
+
+class PlaybackSubscription:
+    __slots__ = ("poller", "callback", "wake")
+
+    def __init__(self, poller, callback, wake):
+        self.poller = poller
+        self.callback = callback
+        self.wake = wake
+
+    def close(self):
+        self.poller._subs.discard(self)
+
+
+class PlaybackPoller:
+    """
+    fetch() — корутина, возвращающая JSON /me/player или None. Пока есть
+    подписчики, опрос идёт сам: раз в POLL_MAX в середине трека, сразу
+    после его ожидаемого конца, POLL_IDLE на паузе. Между запросами
+    подписчики будятся к своим моментам (wake(state) → monotonic-время,
+    например граница следующей строки текста) с экстраполированным
+    прогрессом — без лишних HTTP-запросов.
+    """
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._subs = set()
+        self._task = None
+        self._kick = asyncio.Event()
+        self._next_fetch = 0.0
+        self.state = None
+        self.requests = 0
+
+    async def fetch(self):
+        """Свежий снимок (обновляет и общее состояние)"""
+        self.requests += 1
+        self.state = Playback(await self._fetch())
+        self._next_fetch = time.monotonic() + self._interval(self.state)
+        return self.state
+
+    @staticmethod
+    def _interval(st):
+        if not st.item or not st.is_playing:
+            return POLL_IDLE
+        rem = st.remaining()
+        if rem is not None and rem < POLL_MAX * 1000:
+            return max(POLL_MIN, rem / 1000 + 0.3)
+        return POLL_MAX
+
+    def subscribe(self, callback, wake=None):
+        """callback(state) — корутина; wake(state) → когда разбудить раньше (monotonic) или None"""
+        sub = PlaybackSubscription(self, callback, wake)
+        self._subs.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        self._kick.set()
+        return sub
+
+    def stop(self):
+        self._subs.clear()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while self._subs:
+            self._kick.clear()
+            now = time.monotonic()
+            if self.state is None or now >= self._next_fetch:
+                try:
+                    await self.fetch()
+                except Exception as e:
+                    logger.error(f"playback poll: {e}")
+                    self.state = Playback(None)
+                    self._next_fetch = time.monotonic() + POLL_IDLE
+            st = self.state
+            wake_at = self._next_fetch
+            for sub in list(self._subs):
+                try:
+                    await sub.callback(st)
+                    w = sub.wake(st) if sub.wake else None
+                except Exception as e:
+                    logger.error(f"playback subscriber: {e}")
+                    continue
+                if w is not None:
+                    wake_at = min(wake_at, w)
+            delay = max(0.05, wake_at - time.monotonic())
+            try:
+                await asyncio.wait_for(self._kick.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def next_line_at(lyrics_data, st):
+    """Monotonic-время начала следующей строки синхронного текста (или None)"""
+    if not lyrics_data or not st or not st.is_playing:
+        return None
+    now = time.monotonic()
+    progress = st.progress(now)
+    for line in lyrics_data:
+        if line["time_ms"] > progress:
+            return now + (line["time_ms"] - progress) / 1000
+    return None
+
+
+# ─── Ключ кэша текстов ───
+
+LYRICS_DEADLINE = 6.0  # сек. на гонку провайдеров
+LYRICS_TTL = 30 * 24 * 3600  # тексты не меняются — держим месяц на диске
+LYRICS_RETRY_TTL = 10 * 60  # lrclib не ответил — plain держим недолго, потом спрашиваем снова
+LYRICS_ORDER = ("lrclib", "genius", "ovh")  # синхронный LRC бывает только у lrclib
+
+_LYRICS_NOISE = re.compile(
+    r"\([^)]*\)|\[[^\]]*\]|\s+-\s+.*(remaster|version|edit|mix|live|mono|stereo).*$|\bfeat\..*$",
+    re.IGNORECASE,
+)
+
+
+def lyrics_key(artist, title, duration_ms=None):
+    """
+    Нормализованный ключ трека: регистр, скобки, «- Remastered 2011»,
+    «feat.» и пунктуация не важны; длительность — с точностью до 2 с,
+    чтобы разные издания одной песни не делили тайминги LRC.
+    """
+    def norm(s):
+        s = _LYRICS_NOISE.sub("", s or "").lower()
+        return " ".join(re.sub(r"[^\w\s]", " ", s).split())
+    return f"{norm(artist)}|{norm(title)}|{(duration_ms or 0) // 2000}"
+
 
 def setup(bot):
     import sys
@@ -50,7 +352,7 @@ def setup(bot):
         name="spots",
         description="Spotify: треки, тексты, карточки",
         author="@LoLpryvet & @Hairpin00",
-        version="1.0.2",
+        version="1.2.0",
         settings_schema=[
             {"key": "client_id", "label": "Spotify Client ID", "type": "str", "default": "",
              "description": "Из developer.spotify.com/dashboard"},
@@ -66,6 +368,8 @@ def setup(bot):
              "description": "Для поиска текстов на Genius (опционально)"},
             {"key": "font_url", "label": "URL шрифта", "type": "str",
              "default": "https://raw.githubusercontent.com/kamekuro/assets/master/fonts/Onest-Bold.ttf"},
+            {"key": "session_minutes", "label": "Лимит live-сеанса (мин)", "type": "int", "default": 30,
+             "description": "Сколько минут максимум работают rlyrics и playnow"},
         ],
     )
 
@@ -77,11 +381,51 @@ def setup(bot):
 
     # ─── Утилиты ───
 
-    def _get_sp():
+    def _expired():
+        return spotipy.exceptions.SpotifyException(401, -1, "The access token expired")
+
+    async def _refresh_token():
+        cid = mc(bot, "spots", "client_id", "")
+        csec = mc(bot, "spots", "client_secret", "")
+        refresh = mc(bot, "spots", "refresh_token", "")
+        if not (cid and csec and refresh):
+            return False
+        async with bot.http.post(TOKEN_URL, auth=aiohttp.BasicAuth(cid, csec),
+                                 data={"grant_type": "refresh_token", "refresh_token": refresh}) as r:
+            if r.status != 200:
+                return False
+            tok = await r.json()
+        mc_set(bot, "spots", "auth_token", tok["access_token"])
+        if tok.get("refresh_token"):
+            mc_set(bot, "spots", "refresh_token", tok["refresh_token"])
+        return True
+
+    async def _api_get(url, retry=True):
+        """GET к Web API через общий HTTP-клиент; 204 → None"""
         token = mc(bot, "spots", "auth_token", "")
         if not token:
-            return None
-        return spotipy.Spotify(auth=token)
+            raise _expired()
+        async with bot.http.get(url, headers={"Authorization": f"Bearer {token}"}) as r:
+            if r.status == 204:
+                return None
+            if r.status == 200:
+                return await r.json()
+            if r.status != 401:
+                raise spotipy.exceptions.SpotifyException(r.status, -1, f"HTTP {r.status}")
+        if retry and await _refresh_token():
+            return await _api_get(url, retry=False)
+        raise _expired()
+
+    async def _fetch_playback():
+        return await _api_get(PLAYER_URL)
+
+    _poller = PlaybackPoller(_fetch_playback)
+
+    async def _current_playback():
+        return (await _poller.fetch()).raw
+
+    def _session_limit():
+        return max(1, int(mc(bot, "spots", "session_minutes", 30) or 30)) * 60
 
     def _check_deps():
         missing = []
@@ -93,99 +437,149 @@ def setup(bot):
             missing.append("pillow")
         return missing
 
-    async def _load_font(size):
+    # шрифт и обложки живут всё время работы процесса; шрифт ещё и на диске
+    _card_state = {"font_url": None, "font": None, "art": collections.OrderedDict(),
+                   "cards": collections.OrderedDict()}
+
+    def _font_path(url):
+        return os.path.join(FONT_DIR, hashlib.sha1(url.encode()).hexdigest() + ".ttf")
+
+    def _read_file(path):
         try:
-            font_url = mc(bot, "spots", "font_url",
-                          "https://raw.githubusercontent.com/kamekuro/assets/master/fonts/Onest-Bold.ttf")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(font_url) as resp:
-                    if resp.status == 200:
-                        data = await resp.read()
-                        return ImageFont.truetype(BytesIO(data), size)
-        except Exception:
-            pass
-        for fallback in ["/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                         "arial.ttf", "DejaVuSans-Bold.ttf"]:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_file(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    async def _font_data():
+        font_url = mc(bot, "spots", "font_url",
+                      "https://raw.githubusercontent.com/kamekuro/assets/master/fonts/Onest-Bold.ttf")
+        if _card_state["font_url"] == font_url:
+            return _card_state["font"]
+        data = await offload(_read_file, _font_path(font_url))
+        if data is not None and not await offload(is_font, data, pool="cpu"):
+            data = None  # битый файл в кэше — скачаем заново
+        if data is None:
             try:
-                return ImageFont.truetype(fallback, size)
-            except Exception:
-                continue
-        return ImageFont.load_default()
+                async with bot.http.get(font_url) as resp:
+                    if resp.status != 200:
+                        raise ValueError(f"HTTP {resp.status}")
+                    data = await resp.read()
+                if not await offload(is_font, data, pool="cpu"):
+                    data = None
+                    raise ValueError("not a font file")
+                await offload(_write_file, _font_path(font_url), data)
+            except Exception as e:
+                logger.debug(f"font: {e}")
+        if data is not None:
+            # неудачную загрузку не запоминаем — попробуем при следующей карточке
+            _card_state["font_url"], _card_state["font"] = font_url, data
+        return data
+
+    async def _album_art(key, url):
+        art = _card_state["art"]
+        data = art.get(key)
+        if data is not None:
+            art.move_to_end(key)
+            return data
+        async with bot.http.get(url) as r:
+            # ошибку или HTML не кэшируем — иначе каждая карточка альбома падала бы в Image.open
+            if r.status != 200 or not r.content_type.startswith("image/"):
+                raise ValueError(f"album art: HTTP {r.status} {r.content_type}")
+            data = await r.read()
+        art[key] = data
+        while len(art) > CARD_ART_CACHE:
+            art.popitem(last=False)
+        return data
 
     # ─── Тексты песен ───
-
-    async def _get_lyrics_lrclib(artist, title, duration_ms=None):
+    # Провайдеры опрашиваются одновременно, победитель — синхронный LRC.
+    # В кэш ядра (память + диск) кладётся уже разобранная запись, так что
+    # повторное прослушивание не трогает ни сеть, ни парсер.
+
+    def _clean(s):
+        return re.sub(r'\([^)]*\)', '', s).strip()
+
+    async def _lrclib(artist, title, duration_ms=None):
+        """None — lrclib точно ничего не знает; сбой (сеть, не 200) — исключение"""
+        params = {"artist_name": _clean(artist), "track_name": _clean(title)}
+        if duration_ms:
+            params["duration"] = duration_ms // 1000
         try:
-            clean_t = re.sub(r'\([^)]*\)', '', title).strip()
-            clean_a = re.sub(r'\([^)]*\)', '', artist).strip()
-            params = {"artist_name": clean_a, "track_name": clean_t}
-            if duration_ms:
-                params["duration"] = duration_ms // 1000
-            async with aiohttp.ClientSession() as s:
-                async with s.get("https://lrclib.net/api/search", params=params) as r:
-                    if r.status == 200:
-                        data = await r.json()
-                        if data:
-                            d = data[0]
-                            synced = d.get("syncedLyrics")
-                            plain = d.get("plainLyrics")
-                            if synced:
-                                return {"type": "synced", "lyrics": synced, "plain": plain}
-                            elif plain:
-                                return {"type": "plain", "lyrics": plain}
+            async with bot.http.get("https://lrclib.net/api/search", params=params) as r:
+                if r.status != 200:
+                    raise RuntimeError(f"HTTP {r.status}")
+                data = await r.json()
         except Exception as e:
             logger.error(f"lrclib: {e}")
+            raise
+        if not data:
+            return None
+        synced = data[0].get("syncedLyrics")
+        plain = data[0].get("plainLyrics")
+        if synced:
+            return {"type": "synced", "lyrics": synced, "plain": plain}
+        if plain:
+            return {"type": "plain", "lyrics": plain}
         return None
 
-    async def _get_lyrics_genius(artist, title):
+    async def _genius(artist, title):
         token = mc(bot, "spots", "genius_token", "")
         if not token:
             return None
         try:
-            clean_t = re.sub(r'\([^)]*\)', '', title).strip()
-            clean_a = re.sub(r'\([^)]*\)', '', artist).strip()
-            headers = {"Authorization": f"Bearer {token}"}
-            params = {"q": f"{clean_a} {clean_t}"}
-            async with aiohttp.ClientSession() as s:
-                async with s.get("https://api.genius.com/search", headers=headers, params=params) as r:
-                    if r.status != 200:
-                        return None
-                    data = await r.json()
-                    hits = data.get("response", {}).get("hits", [])
-                    if not hits:
-                        return None
-                    url = hits[0].get("result", {}).get("url")
-                    if not url:
-                        return None
-                async with s.get(url) as r2:
-                    if r2.status != 200:
-                        return None
-                    html = await r2.text()
-                    pat = r'<div[^>]*data-lyrics-container="true"[^>]*>(.*?)</div>'
-                    matches = re.findall(pat, html, re.DOTALL | re.IGNORECASE)
-                    if matches:
-                        lyrics = re.sub(r'<br[^>]*>', '\n', matches[0])
-                        lyrics = re.sub(r'<[^>]+>', '', lyrics).strip()
-                        for old, new in [("&amp;", "&"), ("&lt;", "<"), ("&gt;", ">"),
-                                         ("&quot;", '"'), ("&#x27;", "'")]:
-                            lyrics = lyrics.replace(old, new)
-                        return lyrics if lyrics else None
+            lyrics = await _fetch_genius(token, _clean(artist), _clean(title))
         except Exception as e:
             logger.error(f"genius: {e}")
+            return None
+        return {"type": "plain", "lyrics": lyrics} if lyrics else None
+
+    async def _fetch_genius(token, clean_a, clean_t):
+        headers = {"Authorization": f"Bearer {token}"}
+        params = {"q": f"{clean_a} {clean_t}"}
+        async with bot.http.get("https://api.genius.com/search", headers=headers, params=params) as r:
+            if r.status != 200:
+                return None
+            data = await r.json()
+            hits = data.get("response", {}).get("hits", [])
+            if not hits:
+                return None
+            url = hits[0].get("result", {}).get("url")
+            if not url:
+                return None
+        async with bot.http.get(url) as r2:
+            if r2.status != 200:
+                return None
+            html = await r2.text()
+            pat = r'<div[^>]*data-lyrics-container="true"[^>]*>(.*?)</div>'
+            matches = re.findall(pat, html, re.DOTALL | re.IGNORECASE)
+            if matches:
+                lyrics = re.sub(r'<br[^>]*>', '\n', matches[0])
+                lyrics = re.sub(r'<[^>]+>', '', lyrics).strip()
+                for old, new in [("&amp;", "&"), ("&lt;", "<"), ("&gt;", ">"),
+                                 ("&quot;", '"'), ("&#x27;", "'")]:
+                    lyrics = lyrics.replace(old, new)
+                return lyrics if lyrics else None
         return None
 
-    async def _get_lyrics_ovh(artist, title):
+    async def _ovh(artist, title):
         try:
-            async with aiohttp.ClientSession() as s:
-                async with s.get(f"https://api.lyrics.ovh/v1/{artist}/{title}") as r:
-                    if r.status == 200:
-                        data = await r.json()
-                        lyr = data.get("lyrics")
-                        if lyr:
-                            return {"type": "plain", "lyrics": lyr}
+            async with bot.http.get(f"https://api.lyrics.ovh/v1/{artist}/{title}") as r:
+                if r.status != 200:
+                    return None
+                data = await r.json()
         except Exception as e:
             logger.error(f"lyrics.ovh: {e}")
-        return None
+            return None
+        lyr = data.get("lyrics")
+        return {"type": "plain", "lyrics": lyr} if lyr else None
 
     def _parse_synced(synced):
         if not synced:
@@ -201,25 +595,102 @@ def setup(bot):
                     parsed.append({"time_ms": ms, "text": txt})
         return parsed
 
-    async def _get_synced_data(artist, title, duration_ms=None):
+    def _record(rec, source):
+        rec = dict(rec, source=source)
+        if rec["type"] == "synced":
+            rec["synced"] = _parse_synced(rec["lyrics"])
+        return rec
+
+    def _winner(found, tasks):
+        """Лучший найденный источник, если ни один более приоритетный уже не ответит лучше"""
+        if found.get("lrclib", {}).get("type") == "synced":
+            return "lrclib"
+        for source in LYRICS_ORDER:
+            if source in found:
+                return source
+            if not tasks[source].done():
+                return None  # более приоритетный ещё думает — ждём его до дедлайна
+        return None
+
+    async def _race_lyrics(key, artist, title, duration_ms, outcome):
+        loop = asyncio.get_event_loop()
+        tasks = {
+            "lrclib": asyncio.ensure_future(_lrclib(artist, title, duration_ms)),
+            "genius": asyncio.ensure_future(_genius(artist, title)),
+            "ovh": asyncio.ensure_future(_ovh(artist, title)),
+        }
+        deadline = loop.time() + LYRICS_DEADLINE
+        pending, found = set(tasks.values()), {}
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for source, t in tasks.items():
+                if t in done and not t.exception() and t.result():
+                    found[source] = t.result()
+            if _winner(found, tasks):
+                break
+        source = _winner(found, tasks) or next((s for s in LYRICS_ORDER if s in found), None)
+        best = _record(found[source], source) if source else None
+        lrclib = tasks["lrclib"]
+        # надолго кэшируем, только если lrclib ответил по существу: иначе
+        # случайный сбой закрепил бы plain без тайминга на месяц
+        outcome["final"] = best is not None and (
+            best["type"] == "synced" or (lrclib.done() and not lrclib.exception()))
+        for t in pending:
+            if t is lrclib:
+                # опоздавший lrclib не теряем: если он лучше отданного — перезапишет кэш
+                t.add_done_callback(lambda t: _store_late(key, t, best))
+            else:
+                t.cancel()
+        return best
+
+    def _store_late(key, task, best):
+        if task.cancelled() or task.exception() or not task.result():
+            return
+        rec = _record(task.result(), "lrclib")
+        if best is None or rec["type"] == "synced":
+            asyncio.ensure_future(bot.cache.put(("spots", "lyrics", key), rec, LYRICS_TTL, disk=True))
+
+    async def _resolve_lyrics(artist, title, duration_ms=None):
+        """Разобранная запись {type, lyrics, synced?, source} или None"""
+        key = lyrics_key(artist, title, duration_ms)
+        ck = ("spots", "lyrics", key)
+        outcome = {}
         try:
-            clean_t = re.sub(r'\([^)]*\)', '', title).strip()
-            clean_a = re.sub(r'\([^)]*\)', '', artist).strip()
-            params = {"artist_name": clean_a, "track_name": clean_t}
-            if duration_ms:
-                params["duration"] = duration_ms // 1000
-            async with aiohttp.ClientSession() as s:
-                async with s.get("https://lrclib.net/api/search", params=params) as r:
-                    if r.status == 200:
-                        data = await r.json()
-                        if data:
-                            synced = data[0].get("syncedLyrics")
-                            if synced:
-                                return _parse_synced(synced)
+            # сначала — с коротким TTL; окончательный ответ переписывается на месяц
+            rec = await bot.cache.get_or_fetch(
+                ck, lambda: _race_lyrics(key, artist, title, duration_ms, outcome),
+                ttl=LYRICS_RETRY_TTL, disk=True,
+            )
+            if outcome.get("final"):
+                await bot.cache.put(ck, rec, LYRICS_TTL, disk=True)
+            return rec
         except Exception as e:
-            logger.error(f"synced: {e}")
+            logger.error(f"lyrics: {e}")
         return None
 
+    async def _get_synced_data(artist, title, duration_ms=None):
+        rec = await _resolve_lyrics(artist, title, duration_ms)
+        return rec.get("synced") if rec else None
+
+    _prefetched = {"track_id": None}
+
+    async def _prefetch_next(current_id):
+        """Пока играет текущий трек — прогреваем кэш текстом следующего в очереди"""
+        if _prefetched["track_id"] == current_id:
+            return
+        _prefetched["track_id"] = current_id
+        try:
+            data = await _api_get(QUEUE_URL)
+            nxt = ((data or {}).get("queue") or [None])[0]
+            if nxt and nxt.get("type") == "track" and nxt.get("artists"):
+                await _resolve_lyrics(nxt["artists"][0].get("name", "?"), nxt.get("name", "?"),
+                                      nxt.get("duration_ms", 0))
+        except Exception as e:
+            logger.debug(f"lyrics prefetch: {e}")
+
     def _get_current_line(lyrics_data, progress_ms):
         if not lyrics_data:
             return None, -1
@@ -280,150 +751,94 @@ def setup(bot):
     # ─── Карточки ───
 
     async def _create_card(track_info, with_time=True):
+        """PNG-карточка в памяти (BytesIO) или None; рендер — в пуле cpu ядра"""
         if not HAS_PIL or not HAS_AIOHTTP:
             return None
+        cards = _card_state["cards"]
+        ckey = track_info["track_id"]
+        if not with_time and ckey in cards:
+            cards.move_to_end(ckey)
+            out = BytesIO(cards[ckey])
+            out.name = f"spots_{ckey}.png"
+            return out
         try:
-            W = 600
-            H = 250 if with_time else 200
-            title_font = await _load_font(34)
-            artist_font = await _load_font(22)
-            time_font = await _load_font(18) if with_time else None
-
-            async with aiohttp.ClientSession() as s:
-                async with s.get(track_info["album_art"]) as r:
-                    art_orig = Image.open(BytesIO(await r.read()))
-
-            small = art_orig.resize((50, 50))
-            stat = ImageStat.Stat(small)
-            dr, dg, db = [int(x) for x in stat.mean[:3]]
-
-            h, sv, v = colorsys.rgb_to_hsv(dr / 255, dg / 255, db / 255)
-            v = max(0.15, v * 0.4)
-            sv = min(1.0, sv * 1.1)
-            br, bg, bb = [int(x * 255) for x in colorsys.hsv_to_rgb(h, sv, v)]
-
-            card = Image.new("RGB", (W, H), (br, bg, bb))
-            draw = ImageDraw.Draw(card)
-            for y in range(H):
-                f = y / H
-                draw.line([(0, y), (W, y)], fill=(
-                    int(br * (1 - f * 0.2)), int(bg * (1 - f * 0.2)), int(bb * (1 - f * 0.2))
-                ))
-
-            asize = 180 if with_time else 160
-            art = art_orig.resize((asize, asize), Image.Resampling.LANCZOS)
-            mask = Image.new("L", (asize, asize), 0)
-            ImageDraw.Draw(mask).rounded_rectangle([0, 0, asize, asize], radius=15, fill=255)
-            art.putalpha(mask)
-
-            ax = 20 if with_time else 15
-            ay = (H - asize) // 2
-            card.paste(art, (ax, ay), art)
-
-            tx = ax + asize + 20 if with_time else ax + asize + 15
-            name = track_info["track_name"]
-            if len(name) > 25:
-                name = name[:25] + "..."
-            wrapped = textwrap.wrap(name, width=18)
-            ty = ay + 5
-            for i, line in enumerate(wrapped[:2]):
-                draw.text((tx, ty + i * 40), line, font=title_font, fill="white")
-
-            aname = track_info["artist_name"]
-            if len(aname) > 30:
-                aname = aname[:30] + "..."
-            aty = ty + (len(wrapped) * 40 if wrapped else 40)
-            draw.text((tx, aty), aname, font=artist_font, fill="#A0A0A0")
-
-            if with_time and time_font:
-                py = H - 45
-                pw = W - tx - 20
-                ph = 5
-                draw.rounded_rectangle([tx, py, tx + pw, py + ph], radius=2, fill="#555555")
-                cur = track_info.get("current_time", "0:00")
-                dur = track_info["duration"]
-                try:
-                    cp = cur.split(":")
-                    cs = int(cp[0]) * 60 + int(cp[1])
-                    dp = dur.split(":")
-                    ds = int(dp[0]) * 60 + int(dp[1])
-                    ratio = cs / ds if ds > 0 else 0
-                except Exception:
-                    ratio = 0
-                fill = int(pw * ratio)
-                draw.rounded_rectangle([tx, py, tx + fill, py + ph], radius=2, fill="#1DB954")
-                draw.text((tx, py + 10), cur, font=time_font, fill="#A0A0A0")
-                tb = draw.textbbox((0, 0), dur, font=time_font)
-                draw.text((tx + pw - (tb[2] - tb[0]), py + 10), dur, font=time_font, fill="#A0A0A0")
-            elif not with_time:
-                live_font = await _load_font(16)
-                ltxt = "LIVE"
-                lb = draw.textbbox((0, 0), ltxt, font=live_font)
-                lx = W - (lb[2] - lb[0]) - 20
-                draw.ellipse([lx - 20, 20, lx - 8, 32], fill="#FF0000")
-                draw.text((lx, 18), ltxt, font=live_font, fill="#FF0000")
-
-            path = os.path.join(tempfile.gettempdir(), f"kub_spots_{track_info['track_id']}.png")
-            card.save(path, "PNG")
-            return path
+            font_data, art_bytes = await asyncio.gather(
+                _font_data(),
+                _album_art(track_info.get("album_id") or track_info["album_art"], track_info["album_art"]),
+            )
+            out = await offload(render_card, track_info, art_bytes, font_data, with_time, pool="cpu")
         except Exception as e:
             logger.error(f"card: {e}")
             return None
+        if not with_time:
+            # live-карточка от времени не зависит — повторная смена на тот же трек бесплатна
+            cards[ckey] = out.getvalue()
+            while len(cards) > CARD_CACHE:
+                cards.popitem(last=False)
+        return out
 
     # ─── Realtime loops ───
 
+    async def _watch_session(data, on_track, idle_text):
+        """
+        Общий каркас live-сеанса: подписка на опросчик, пределы по паузе,
+        тишине и длительности. on_track(state) → False завершает сеанс.
+        """
+        stop = data["stop"]
+        started = time.monotonic()
+        limit = _session_limit()
+        quiet = {"since": None}
+
+        async def on_state(st):
+            now = time.monotonic()
+            if not data["active"] or now - started > limit:
+                stop.set()
+                return
+            if not st.item or not st.is_playing:
+                quiet["since"] = quiet["since"] or now
+                if now - quiet["since"] >= (PAUSE_MAX if st.item else NOTHING_MAX):
+                    stop.set()
+                return
+            quiet["since"] = None
+            if _prefetched["track_id"] != st.track_id:
+                asyncio.ensure_future(_prefetch_next(st.track_id))
+            if await on_track(st) is False or data["live"].error:
+                stop.set()
+
+        sub = _poller.subscribe(on_state, lambda st: next_line_at(data.get("lyrics_data"), st))
+        try:
+            await stop.wait()
+        finally:
+            sub.close()
+            data["active"] = False
+            await data["live"].close(idle_text)
+
+    def _end(data):
+        """Остановить сеанс (будит его сразу, а не на следующем опросе)"""
+        if data and data.get("active"):
+            data["active"] = False
+            data["stop"].set()
+            return True
+        return False
+
+    def _show_line(data, st, header=""):
+        _, idx = _get_current_line(data["lyrics_data"], st.progress())
+        if idx != data["last_idx"]:
+            data["last_idx"] = idx
+            data["live"].update(header + _format_rt_lyrics(data["lyrics_data"], idx))
+
     async def _realtime_loop():
         data = _state["realtime_data"]
         if not data or not data["active"]:
             return
+
+        async def on_track(st):
+            if st.track_id != data["track_id"]:
+                return False
+            _show_line(data, st, data["header"])
+
         try:
-            count = 0
-            pause = 0
-            while data["active"] and count < 600:
-                try:
-                    sp = _get_sp()
-                    if not sp:
-                        break
-                    pb = sp.current_playback()
-                    if not pb or not pb.get("item"):
-                        pause += 1
-                        if pause > 30:
-                            break
-                        await asyncio.sleep(1)
-                        count += 1
-                        continue
-                    if pb["item"].get("id", "") != data["track_id"]:
-                        break
-                    progress = pb.get("progress_ms", 0)
-                    if not pb.get("is_playing", False):
-                        pause += 1
-                        if pause >= 120:
-                            break
-                        await asyncio.sleep(1)
-                        count += 1
-                        continue
-                    pause = 0
-                    _, idx = _get_current_line(data["lyrics_data"], progress)
-                    if idx != data["last_idx"]:
-                        fmt = _format_rt_lyrics(data["lyrics_data"], idx)
-                        data["last_idx"] = idx
-                        try:
-                            await client.edit_message(data["chat_id"], data["msg_id"],
-                                                      data["header"] + fmt)
-                        except Exception:
-                            break
-                    await asyncio.sleep(1)
-                    count += 1
-                except Exception as e:
-                    logger.error(f"rt loop: {e}")
-                    await asyncio.sleep(2)
-                    count += 1
-            data["active"] = False
-            try:
-                await client.edit_message(data["chat_id"], data["msg_id"],
-                                          data["header"] + "✅ _Сеанс завершён_")
-            except Exception:
-                pass
+            await _watch_session(data, on_track, data["header"] + "✅ _Сеанс завершён_")
         except Exception as e:
             logger.error(f"rt critical: {e}")
             data["active"] = False
@@ -432,83 +847,41 @@ def setup(bot):
         data = _state["playnow_data"]
         if not data or not data["active"]:
             return
+
+        async def on_track(st):
+            if st.track_id != data["track_id"]:
+                # Трек сменился — обновляем карточку
+                track = st.item
+                ti = {
+                    "track_name": track.get("name", "?"),
+                    "artist_name": track["artists"][0].get("name", "?"),
+                    "album_art": track["album"]["images"][0]["url"],
+                    "album_id": track["album"].get("id"),
+                    "track_id": st.track_id,
+                }
+                card, ld = await asyncio.gather(
+                    _create_card(ti, with_time=False),
+                    _get_synced_data(ti["artist_name"], ti["track_name"], st.duration_ms),
+                )
+                cap = "🎵 Ожидание..." if ld else "❌ _Текст не найден_"
+                data["lyrics_data"] = ld
+                data["last_idx"] = -1
+                data["track_id"] = st.track_id
+                if card:
+                    data["live"].cancel()
+                    try:
+                        await client.delete_messages(data["chat_id"], data["msg_id"])
+                    except Exception:
+                        pass
+                    msg = await client.send_file(data["chat_id"], card, caption=cap)
+                    data["msg_id"] = msg.id
+                    data["live"] = LiveMessage(msg)
+                return
+            if data.get("lyrics_data"):
+                _show_line(data, st)
+
         try:
-            count = 0
-            pause = 0
-            cur_tid = data.get("track_id")
-            while data["active"] and count < 1200:
-                try:
-                    sp = _get_sp()
-                    if not sp:
-                        break
-                    pb = sp.current_playback()
-                    if not pb or not pb.get("item"):
-                        pause += 1
-                        if pause > 30:
-                            break
-                        await asyncio.sleep(1)
-                        count += 1
-                        continue
-                    new_tid = pb["item"].get("id", "")
-                    progress = pb.get("progress_ms", 0)
-                    if new_tid != cur_tid:
-                        # Трек сменился — обновляем карточку
-                        track = pb["item"]
-                        ti = {
-                            "track_name": track.get("name", "?"),
-                            "artist_name": track["artists"][0].get("name", "?"),
-                            "album_art": track["album"]["images"][0]["url"],
-                            "track_id": new_tid,
-                        }
-                        card = await _create_card(ti, with_time=False)
-                        ld = await _get_synced_data(ti["artist_name"], ti["track_name"],
-                                                     track.get("duration_ms", 0))
-                        cap = "🎵 Ожидание..." if ld else "❌ _Текст не найден_"
-                        data["lyrics_data"] = ld
-                        data["last_idx"] = -1
-                        cur_tid = new_tid
-                        data["track_id"] = new_tid
-                        if card:
-                            try:
-                                await client.delete_messages(data["chat_id"], data["msg_id"])
-                            except Exception:
-                                pass
-                            msg = await client.send_file(data["chat_id"], card, caption=cap)
-                            data["msg_id"] = msg.id
-                            try:
-                                os.remove(card)
-                            except Exception:
-                                pass
-                        continue
-                    if not pb.get("is_playing", False):
-                        pause += 1
-                        if pause >= 120:
-                            break
-                        await asyncio.sleep(1)
-                        count += 1
-                        continue
-                    pause = 0
-                    if data.get("lyrics_data"):
-                        _, idx = _get_current_line(data["lyrics_data"], progress)
-                        if idx != data.get("last_idx", -1):
-                            fmt = _format_rt_lyrics(data["lyrics_data"], idx)
-                            data["last_idx"] = idx
-                            try:
-                                await client.edit_message(data["chat_id"], data["msg_id"], fmt)
-                            except Exception:
-                                break
-                    await asyncio.sleep(1)
-                    count += 1
-                except Exception as e:
-                    logger.error(f"playnow loop: {e}")
-                    await asyncio.sleep(2)
-                    count += 1
-            data["active"] = False
-            try:
-                await client.edit_message(data["chat_id"], data["msg_id"],
-                                          "✅ _Live-сеанс завершён_")
-            except Exception:
-                pass
+            await _watch_session(data, on_track, "✅ _Live-сеанс завершён_")
         except Exception as e:
             logger.error(f"playnow critical: {e}")
             data["active"] = False
@@ -573,7 +946,7 @@ def setup(bot):
             redirect_uri="https://sp.fajox.one", scope=scopes
         )
         try:
-            token_info = oauth.get_access_token(args[1].strip())
+            token_info = await offload(oauth.get_access_token, args[1].strip(), pool="sdk")
             mc_set(bot, "spots", "auth_token", token_info["access_token"])
             mc_set(bot, "spots", "refresh_token", token_info["refresh_token"])
             await event.edit("✅ **Авторизация успешна!** 🎵")
@@ -585,8 +958,7 @@ def setup(bot):
         if not await _check(event):
             return
         try:
-            sp = _get_sp()
-            pb = sp.current_playback()
+            pb = await _current_playback()
             if not pb or not pb.get("item"):
                 await event.edit("❌ Ничего не играет")
                 return
@@ -604,6 +976,7 @@ def setup(bot):
                 "duration": f"{dm}:{ds:02d}",
                 "current_time": f"{pm}:{ps:02d}",
                 "album_art": track["album"]["images"][0]["url"],
+                "album_id": track["album"].get("id"),
                 "track_id": tid,
             }
             card = await _create_card(ti, with_time=True)
@@ -614,10 +987,6 @@ def setup(bot):
                 await event.delete()
                 await client.send_file(event.chat_id, card, caption=cap,
                                         reply_to=event.reply_to_msg_id if event.is_reply else None)
-                try:
-                    os.remove(card)
-                except Exception:
-                    pass
             else:
                 await event.edit(
                     f"🎧 **{ti['track_name']}**\n"
@@ -637,8 +1006,7 @@ def setup(bot):
         if not await _check(event):
             return
         try:
-            sp = _get_sp()
-            pb = sp.current_playback()
+            pb = await _current_playback()
             if not pb or not pb.get("item"):
                 await event.edit("❌ Ничего не играет")
                 return
@@ -672,15 +1040,12 @@ def setup(bot):
                 await event.edit("❌ Не удалось скачать трек")
                 return
 
-            # Обложка
+            # Обложка — из того же LRU, что и для карточек
             art_url = track["album"]["images"][0]["url"]
-            art_path = None
+            thumb = None
             try:
-                async with aiohttp.ClientSession() as s:
-                    async with s.get(art_url) as r:
-                        art_path = os.path.join(tempfile.gettempdir(), "kub_cover.jpg")
-                        with open(art_path, "wb") as f:
-                            f.write(await r.read())
+                thumb = BytesIO(await _album_art(track["album"].get("id") or art_url, art_url))
+                thumb.name = "cover.jpg"
             except Exception:
                 pass
 
@@ -696,15 +1061,10 @@ def setup(bot):
                 attributes=[tl_types.DocumentAttributeAudio(
                     duration=dur_ms // 1000, title=name, performer=artist
                 )],
-                thumb=art_path,
+                thumb=thumb,
                 reply_to=event.reply_to_msg_id if event.is_reply else None,
             )
             await event.delete()
-            if art_path:
-                try:
-                    os.remove(art_path)
-                except Exception:
-                    pass
         except spotipy.exceptions.SpotifyException as e:
             if "expired" in str(e).lower():
                 await event.edit(f"❌ `{p}spauth`")
@@ -718,8 +1078,7 @@ def setup(bot):
         if not await _check(event):
             return
         try:
-            sp = _get_sp()
-            pb = sp.current_playback()
+            pb = await _current_playback()
             if not pb or not pb.get("item"):
                 await event.edit("❌ Ничего не играет")
                 return
@@ -731,13 +1090,7 @@ def setup(bot):
             prog_ms = pb.get("progress_ms", 0)
             turl = track["external_urls"]["spotify"]
 
-            ld = await _get_lyrics_lrclib(artist, name, dur_ms)
-            if not ld:
-                genius = await _get_lyrics_genius(artist, name)
-                if genius:
-                    ld = {"type": "plain", "lyrics": genius}
-            if not ld:
-                ld = await _get_lyrics_ovh(artist, name)
+            ld = await _resolve_lyrics(artist, name, dur_ms)
 
             if ld:
                 if ld["type"] == "synced":
@@ -762,8 +1115,7 @@ def setup(bot):
         if not await _check(event):
             return
         try:
-            sp = _get_sp()
-            pb = sp.current_playback()
+            pb = await _current_playback()
             if not pb or not pb.get("item"):
                 await event.edit("❌ Ничего не играет")
                 return
@@ -786,14 +1138,13 @@ def setup(bot):
             header = f"📜 **Realtime**\n[{artist} — {name}]({turl})\n\n"
             msg = await event.edit(header + "🎵 Ожидание...")
 
-            if _state["realtime_data"] and _state["realtime_data"].get("active"):
-                _state["realtime_data"]["active"] = False
-                await asyncio.sleep(1)
+            _end(_state["realtime_data"])
 
             _state["realtime_data"] = {
                 "msg_id": msg.id, "chat_id": event.chat_id,
                 "lyrics_data": ld, "track_id": tid,
                 "header": header, "last_idx": -1, "active": True,
+                "live": LiveMessage(msg), "stop": asyncio.Event(),
             }
             asyncio.create_task(_realtime_loop())
         except spotipy.exceptions.SpotifyException as e:
@@ -806,8 +1157,7 @@ def setup(bot):
 
     async def cmd_stoplyrics(event):
         """Остановить realtime текст."""
-        if _state["realtime_data"] and _state["realtime_data"].get("active"):
-            _state["realtime_data"]["active"] = False
+        if _end(_state["realtime_data"]):
             await event.edit("✅ Остановлено")
         else:
             await event.edit("❌ Нет активного сеанса")
@@ -817,8 +1167,7 @@ def setup(bot):
         if not await _check(event):
             return
         try:
-            sp = _get_sp()
-            pb = sp.current_playback()
+            pb = await _current_playback()
             if not pb or not pb.get("item"):
                 await event.edit("❌ Ничего не играет")
                 return
@@ -832,23 +1181,18 @@ def setup(bot):
 
             ti = {
                 "track_name": name, "artist_name": artist,
-                "album_art": track["album"]["images"][0]["url"], "track_id": tid,
+                "album_art": track["album"]["images"][0]["url"],
+                "album_id": track["album"].get("id"), "track_id": tid,
             }
             card = await _create_card(ti, with_time=False)
             ld = await _get_synced_data(artist, name, dur_ms)
             cap = "🎵 Ожидание..." if ld else "❌ _Текст не найден_"
 
-            if _state["playnow_data"] and _state["playnow_data"].get("active"):
-                _state["playnow_data"]["active"] = False
-                await asyncio.sleep(1)
+            _end(_state["playnow_data"])
 
             if card:
                 msg = await client.send_file(event.chat_id, card, caption=cap,
                                               reply_to=event.reply_to_msg_id if event.is_reply else None)
-                try:
-                    os.remove(card)
-                except Exception:
-                    pass
             else:
                 msg = await event.edit(cap)
 
@@ -856,6 +1200,7 @@ def setup(bot):
                 "msg_id": msg.id, "chat_id": event.chat_id,
                 "lyrics_data": ld, "track_id": tid,
                 "last_idx": -1, "active": True,
+                "live": LiveMessage(msg), "stop": asyncio.Event(),
             }
             await event.delete()
             asyncio.create_task(_playnow_loop())
@@ -869,8 +1214,7 @@ def setup(bot):
 
     async def cmd_stopplaynow(event):
         """Остановить live-отображение."""
-        if _state["playnow_data"] and _state["playnow_data"].get("active"):
-            _state["playnow_data"]["active"] = False
+        if _end(_state["playnow_data"]):
             await event.edit("✅ Live остановлено")
         else:
             await event.edit("❌ Нет активного сеанса")
@@ -890,10 +1234,9 @@ def setup(bot):
     }
 
     def _unload():
-        if _state["realtime_data"]:
-            _state["realtime_data"]["active"] = False
-        if _state["playnow_data"]:
-            _state["playnow_data"]["active"] = False
+        _end(_state["realtime_data"])
+        _end(_state["playnow_data"])
+        _poller.stop()
 
     mod.on_unload = _unload
 
@@ -27,11 +27,23 @@ import traceback
 import platform
 import io
 import re
+import random
+import ast
 import subprocess
+import hashlib
+import marshal
 import collections
+import contextvars
+import functools
+import string
 import threading
+import tempfile
+import atexit
+import weakref
 import webbrowser
 from pathlib import Path
+from urllib.parse import urlsplit
+from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
 from typing import Dict, List, Callable, Any, Optional, Tuple
@@ -44,15 +56,23 @@ except ImportError:
     HAS_CURSES = False
 
 # Основные библиотеки Telethon
-from telethon import TelegramClient, events, Button, version as telethon_version
+from telethon import TelegramClient, events, Button, version as telethon_version, utils as telethon_utils
+from telethon.tl import types as tl_types
+from telethon.extensions import html as telethon_html
 from telethon.tl.types import (
     User, Channel, Chat,
     DocumentAttributeFilename,
 )
+from telethon.tl.functions import PingRequest
 from telethon.tl.functions.users import GetFullUserRequest
 from telethon.tl.functions.channels import GetFullChannelRequest
 from telethon.errors import (
     FloodWaitError,
+    FloodPremiumWaitError,
+    SlowModeWaitError,
+    MessageNotModifiedError,
+    BadRequestError,
+    ForbiddenError,
     AccessTokenInvalidError,
     UserAdminInvalidError,
     ChatAdminRequiredError,
@@ -62,6 +82,13 @@ from telethon.errors import (
     PhoneCodeExpiredError
 )
 
+# inotify для слежения за папкой модулей (опционально, иначе — опрос mtime)
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
 # AIOHTTP для веб-сервера установщика и загрузок
 try:
     import aiohttp
@@ -143,9 +170,17 @@ _STRINGS: Dict[str, Dict[str, str]] = {
     "modules_list": {"ru": "Модули", "en": "Modules", "uk": "Модулі"},
     "reloading": {"ru": "Перезагрузка", "en": "Reloading", "uk": "Перезавантаження"},
     "reloaded": {"ru": "модулей", "en": "modules", "uk": "модулів"},
+    "lazy_activated": {"ru": "загружен по первой команде", "en": "loaded on first use", "uk": "завантажено за першою командою"},
+    "lazy_failed": {"ru": "не удалось загрузить модуль", "en": "failed to load module", "uk": "не вдалося завантажити модуль"},
     "inline_panel": {"ru": "Inline панель", "en": "Inline panel", "uk": "Inline панель"},
     "bot_token": {"ru": "Bot token", "en": "Bot token", "uk": "Bot token"},
     "status_word": {"ru": "Статус", "en": "Status", "uk": "Статус"},
+    "perf_word": {"ru": "Производительность", "en": "Performance", "uk": "Продуктивність"},
+    "perf_empty": {"ru": "Пока нет данных", "en": "No data yet", "uk": "Поки немає даних"},
+    "perf_reset_done": {"ru": "Метрики сброшены", "en": "Metrics reset", "uk": "Метрики скинуто"},
+    "perf_since": {"ru": "с", "en": "since", "uk": "з"},
+    "lag_word": {"ru": "Лаг цикла", "en": "Loop lag", "uk": "Лаг циклу"},
+    "lag_last_stall": {"ru": "Последняя блокировка", "en": "Last stall", "uk": "Останнє блокування"},
     "install_file": {"ru": "Установить (файл)", "en": "Install (file)", "uk": "Встановити (файл)"},
     "uninstall_mod": {"ru": "Удалить модуль", "en": "Uninstall module", "uk": "Видалити модуль"},
     "download_url": {"ru": "Скачать (URL)", "en": "Download (URL)", "uk": "Завантажити (URL)"},
@@ -165,6 +200,20 @@ _STRINGS: Dict[str, Dict[str, str]] = {
     "info_word": {"ru": "Инфо", "en": "Info", "uk": "Інфо"},
     "delete_word": {"ru": "Удалить", "en": "Delete", "uk": "Видалити"},
     "purge_word": {"ru": "Purge", "en": "Purge", "uk": "Purge"},
+    "purge_usage": {
+        "ru": "Ответьте на сообщение или укажите количество. Фильтры: me, @user, type:photo|video|doc|voice|gif|music|round|url|media, since:ГГГГ-ММ-ДД, until:ГГГГ-ММ-ДД",
+        "en": "Reply to a message or give a count. Filters: me, @user, type:photo|video|doc|voice|gif|music|round|url|media, since:YYYY-MM-DD, until:YYYY-MM-DD",
+        "uk": "Дайте відповідь на повідомлення або вкажіть кількість. Фільтри: me, @user, type:photo|video|doc|voice|gif|music|round|url|media, since:РРРР-ММ-ДД, until:РРРР-ММ-ДД",
+    },
+    "purge_bad_filter": {"ru": "Неизвестный фильтр", "en": "Unknown filter", "uk": "Невідомий фільтр"},
+    "purge_progress": {"ru": "Удаляю", "en": "Deleting", "uk": "Видаляю"},
+    "search_found": {"ru": "Найдено", "en": "Found", "uk": "Знайдено"},
+    "search_in_file": {"ru": "полный список в файле", "en": "full list in the file", "uk": "повний список у файлі"},
+    "search_usage": {
+        "ru": "Фильтры: limit:N, offset:N, from:@user|me, type:photo|video|doc|voice|gif|music|round|url|media, since:ГГГГ-ММ-ДД, until:ГГГГ-ММ-ДД",
+        "en": "Filters: limit:N, offset:N, from:@user|me, type:photo|video|doc|voice|gif|music|round|url|media, since:YYYY-MM-DD, until:YYYY-MM-DD",
+        "uk": "Фільтри: limit:N, offset:N, from:@user|me, type:photo|video|doc|voice|gif|music|round|url|media, since:РРРР-ММ-ДД, until:РРРР-ММ-ДД",
+    },
     "chat_info": {"ru": "Чат инфо", "en": "Chat info", "uk": "Чат інфо"},
     "calculator": {"ru": "Калькулятор", "en": "Calculator", "uk": "Калькулятор"},
     "self_destruct": {"ru": "Самоуничтожение", "en": "Self-destruct", "uk": "Самознищення"},
@@ -195,6 +244,7 @@ _STRINGS: Dict[str, Dict[str, str]] = {
     "panel_settings": {"ru": "⚙️ Настройки", "en": "⚙️ Settings", "uk": "⚙️ Налаштування"},
     "panel_status": {"ru": "📊 Статус", "en": "📊 Status", "uk": "📊 Статус"},
     "panel_stats": {"ru": "📈 Статистика", "en": "📈 Statistics", "uk": "📈 Статистика"},
+    "panel_perf": {"ru": "⏱ Perf", "en": "⏱ Perf", "uk": "⏱ Perf"},
     "panel_user_mods": {"ru": "🔌 Польз.", "en": "🔌 User", "uk": "🔌 Корист."},
     "panel_kinfo": {"ru": "🎨 kinfo", "en": "🎨 kinfo", "uk": "🎨 kinfo"},
     "panel_reload": {"ru": "🔄 Перезагрузка", "en": "🔄 Reload", "uk": "🔄 Перезавантаження"},
@@ -231,6 +281,7 @@ _STRINGS: Dict[str, Dict[str, str]] = {
     "panel_send_photo": {"ru": "Отправьте фото или URL", "en": "Send photo or URL", "uk": "Надішліть фото або URL"},
     "panel_photo_removed": {"ru": "✅ Фото удалено", "en": "✅ Photo removed", "uk": "✅ Фото видалено"},
     "panel_template_updated": {"ru": "✅ Шаблон обновлён", "en": "✅ Template updated", "uk": "✅ Шаблон оновлено"},
+    "panel_template_invalid": {"ru": "❌ Шаблон не принят", "en": "❌ Template rejected", "uk": "❌ Шаблон не прийнято"},
     "panel_template_reset": {"ru": "✅ Сброшен", "en": "✅ Reset", "uk": "✅ Скинуто"},
     "panel_send_line": {"ru": "Отправьте текст строки:", "en": "Send line text:", "uk": "Надішліть текст рядка:"},
     "panel_line_added": {"ru": "✅ Строка добавлена", "en": "✅ Line added", "uk": "✅ Рядок додано"},
@@ -429,56 +480,174 @@ def custom_emoji(emoji_id: int, fallback: str = "⭐") -> str:
 def _strip_custom_emoji(text: str) -> str:
     return re.sub(r'<tg-emoji[^>]*>([^<]*)</tg-emoji>', r'\1', text)
 
+def _rpc(fn: Callable, chat, kind: str):
+    """Провести действие через планировщик RPC, если он уже поднят"""
+    if _RPC_SCHEDULER is None or _RPC_SCHEDULED.get():
+        return fn()
+    return _RPC_SCHEDULER.run(fn, chat=chat, kind=kind)
+
+# Рендеринг: HTML разбирается один раз в (текст, entities), а отказы
+# сервера (кастомные эмодзи, разметка) запоминаются, чтобы следующая
+# отправка сразу шла в том виде, который проходит
+
+RENDER_FULL, RENDER_NO_CUSTOM_EMOJI, RENDER_PLAIN = 0, 1, 2
+RENDER_CACHE_ENTRIES = 1024
+RENDER_REJECT_TTL = 6 * 3600  # сек. — потом пробуем полный вид снова
+
+_MENTION_URL = re.compile(r'^@|\+|tg://user\?id=(\d+)')
+
+class MessageRenderer:
+    def __init__(self):
+        self._parsed: "collections.OrderedDict[Tuple[int, str], Tuple[str, Optional[tuple]]]" = collections.OrderedDict()
+        self._rejected: Dict[Any, Tuple[int, float]] = {}
+        self.parse_hits = 0
+        self.parse_misses = 0
+        self.retries = 0  # повторы после отказа
+        self.avoided = 0  # повторы, которых не было благодаря памяти
+        self.learned = 0
+
+    def level(self, chat) -> int:
+        """С какого вида начинать: отказы на аккаунт (ключ None) и на чат"""
+        lvl = RENDER_FULL
+        now = time.time()
+        for key in (None, chat):
+            item = self._rejected.get(key)
+            if item is None:
+                continue
+            if now - item[1] > RENDER_REJECT_TTL:
+                self._rejected.pop(key, None)
+            else:
+                lvl = max(lvl, item[0])
+        return lvl
+
+    def learn(self, chat, level: int):
+        # кастомные эмодзи без премиума отклоняются везде — помним на аккаунт
+        key = None if level == RENDER_NO_CUSTOM_EMOJI and not _HAS_PREMIUM else chat
+        if self._rejected.get(key, (RENDER_FULL,))[0] < level:
+            self.learned += 1
+        self._rejected[key] = (level, time.time())
+
+    def parse(self, text: str, level: int) -> Tuple[str, Optional[list]]:
+        """
+        (сообщение, entities). entities=None — в тексте упоминания, их
+        должен разобрать сам Telethon (нужен клиент), отправляем как HTML.
+        """
+        key = (level, text)
+        item = self._parsed.get(key)
+        if item is not None:
+            self.parse_hits += 1
+            self._parsed.move_to_end(key)
+        else:
+            self.parse_misses += 1
+            item = self._parse(text, level)
+            self._parsed[key] = item
+            while len(self._parsed) > RENDER_CACHE_ENTRIES:
+                self._parsed.popitem(last=False)
+        msg, ents = item
+        return msg, (list(ents) if ents is not None else None)
+
+    @staticmethod
+    def _parse(text: str, level: int) -> Tuple[str, Optional[tuple]]:
+        src = text if level == RENDER_FULL else _strip_custom_emoji(text)
+        try:
+            msg, ents = telethon_html.parse(src)
+        except Exception:
+            return (re.sub(r'<[^>]+>', '', src), ()) if level == RENDER_PLAIN else (src, None)
+        if level == RENDER_PLAIN:
+            return msg, ()
+        ents = [e for e in ents if e.length]
+        for e in ents:
+            if isinstance(e, tl_types.MessageEntityMentionName) or (
+                    isinstance(e, tl_types.MessageEntityTextUrl) and _MENTION_URL.match(e.url)):
+                return src, None
+        return msg, tuple(ents)
+
+    @staticmethod
+    def rejected(err: Exception) -> bool:
+        """Отказ из-за разметки/эмодзи (а не флуд, права и т.п.)"""
+        if isinstance(err, _FLOOD_ERRORS):
+            return False
+        err_str = str(err).lower()
+        return "invalid" in err_str or "document" in err_str or "emoji" in err_str
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.parse_hits, "misses": self.parse_misses, "retries": self.retries,
+                "avoided": self.avoided, "learned": self.learned}
+
+    def reset_stats(self):
+        self.parse_hits = self.parse_misses = self.retries = self.avoided = self.learned = 0
+
+_RENDERER = MessageRenderer()
+
+def format_render_line(r: MessageRenderer) -> Optional[str]:
+    st = r.stats()
+    total = st["hits"] + st["misses"]
+    if not total:
+        return None
+    return (f"parse {st['hits'] * 100 // total}% hit ({total}) · retries {st['retries']}"
+            f" · avoided {st['avoided']} · learned {st['learned']}")
+
+async def _render_call(chat, text: str, kwargs: Dict[str, Any], do: Callable, kind: str):
+    """
+    do(message, kwargs) — отправка/правка. Текст идёт готовыми entities из
+    кэша, с вида, который этот чат/аккаунт уже принимал; при отказе —
+    следующий вид (без кастомных эмодзи, затем без разметки).
+    """
+    if kwargs.get("parse_mode", "html") != "html" or "formatting_entities" in kwargs:
+        return await _rpc(lambda: do(text, kwargs), chat, kind)
+    kw = {k: v for k, v in kwargs.items() if k != "parse_mode"}
+    r = _RENDERER
+    has_ce = "<tg-emoji" in text
+    first = r.level(chat)
+    if first == RENDER_NO_CUSTOM_EMOJI and not has_ce:
+        first = RENDER_FULL  # без кастомных эмодзи это тот же полный вид
+    r.avoided += (first >= RENDER_NO_CUSTOM_EMOJI and has_ce) + (first >= RENDER_PLAIN)
+    lvl = first
+    learnable = True
+    while True:
+        msg, ents = r.parse(text, lvl)
+        if lvl == RENDER_PLAIN:
+            # как и раньше, крайний вариант — только текст
+            call_kw = {**kw, "parse_mode": None} if lvl == first else {"parse_mode": None}
+        elif ents is None:
+            call_kw = {**kw, "parse_mode": "html"}
+        else:
+            call_kw = {**kw, "formatting_entities": ents, "parse_mode": None}
+        try:
+            res = await _rpc(lambda: do(msg, call_kw), chat, kind)
+        except Exception as e:
+            if lvl >= RENDER_PLAIN or not (r.rejected(e) or lvl > first):
+                raise
+            learnable = learnable and r.rejected(e)
+            r.retries += 1
+            lvl += 1
+            if lvl == RENDER_NO_CUSTOM_EMOJI and not has_ce:
+                lvl = RENDER_PLAIN
+            continue
+        # запоминаем, только если причина — точно разметка, а не отброшенные kwargs
+        if lvl > first and learnable and not (lvl == RENDER_PLAIN and kw):
+            r.learn(chat, lvl)
+        return res
+
 async def safe_edit(event, text: str, **kwargs):
     kwargs.setdefault("parse_mode", "html")
+    chat = getattr(event, "chat_id", None)
     try:
-        await event.edit(text, **kwargs)
+        await _render_call(chat, text, kwargs, lambda m, kw: event.edit(m, **kw), "edit")
     except Exception as e:
-        err_str = str(e).lower()
-        if "invalid" in err_str or "document" in err_str or "emoji" in err_str:
-            clean = _strip_custom_emoji(text)
-            try:
-                await event.edit(clean, **kwargs)
-            except Exception:
-                plain = re.sub(r'<[^>]+>', '', clean)
-                try:
-                    await event.edit(plain)
-                except Exception:
-                    pass
-        else:
+        # как и раньше: если даже простой текст не прошёл — молча
+        if not MessageRenderer.rejected(e):
             raise
 
 async def safe_send(client, chat_id, text: str, **kwargs):
     kwargs.setdefault("parse_mode", "html")
-    try:
-        return await client.send_message(chat_id, text, **kwargs)
-    except Exception as e:
-        err_str = str(e).lower()
-        if "invalid" in err_str or "document" in err_str or "emoji" in err_str:
-            clean = _strip_custom_emoji(text)
-            try:
-                return await client.send_message(chat_id, clean, **kwargs)
-            except Exception:
-                plain = re.sub(r'<[^>]+>', '', clean)
-                return await client.send_message(chat_id, plain)
-        else:
-            raise
+    return await _render_call(chat_id, text, kwargs,
+                              lambda m, kw: client.send_message(chat_id, m, **kw), "send")
 
 async def safe_send_file(client, chat_id, file, caption: str = "", **kwargs):
     kwargs.setdefault("parse_mode", "html")
-    try:
-        return await client.send_file(chat_id, file, caption=caption, **kwargs)
-    except Exception as e:
-        err_str = str(e).lower()
-        if "invalid" in err_str or "document" in err_str or "emoji" in err_str:
-            clean = _strip_custom_emoji(caption)
-            try:
-                return await client.send_file(chat_id, file, caption=clean, **kwargs)
-            except Exception:
-                plain = re.sub(r'<[^>]+>', '', clean)
-                return await client.send_file(chat_id, file, caption=plain, parse_mode=None)
-        else:
-            raise
+    return await _render_call(chat_id, caption, kwargs,
+                              lambda m, kw: client.send_file(chat_id, file, caption=m, **kw), "upload")
 
 # ──────────────────────── Логирование (Стандарт+TUI) ────────────────
 
@@ -533,6 +702,71 @@ for _n in[
 CONFIG_FILE = "kub_config.json"
 MODULES_DIR = "modules"
 DEFAULT_PREFIX = "."
+CONFIG_FLUSH_INTERVAL = 2.0  # сек. — окно склейки отложенных записей конфига
+CONFIG_RETRY_MAX = 60.0  # сек. — потолок паузы между повторами неудачной записи
+IDENTITY_TTL = 600.0  # сек. — срок жизни кэша get_me()
+ENTITY_CACHE_ENTRIES = 2048  # отправителей/чатов в памяти
+ENTITY_CACHE_TTL = 1800.0  # сек.
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 5000
+SEARCH_PAGE = 25  # сообщений между разрешением отправителей и правкой
+SEARCH_EDIT_INTERVAL = 2.0  # сек. между промежуточными правками
+PING_INTERVAL = 30.0  # сек. — период фонового MTProto Ping
+PING_WINDOW = 20  # сэмплов RTT в скользящем окне
+LOOP_LAG_INTERVAL = 0.1  # сек. между пульсами монитора event loop
+LOOP_STALL_THRESHOLD = 0.25  # сек. — остановка цикла дольше считается блокирующим вызовом
+LOOP_STALLS_KEPT = 50  # последних остановок со стеками
+LOOP_STACK_DEPTH = 12  # кадров стека в записи об остановке
+# потоков в именованных пулах блокирующей работы
+EXECUTOR_POOLS = {
+    "io": 8,  # файлы, sqlite, сжатие
+    "cpu": max(2, os.cpu_count() or 2),  # PIL/zlib/hashlib — отпускают GIL
+    "sdk": 4,  # синхронные SDK и библиотеки (spotipy, googlesearch)
+    "pip": 1,  # установки pip — строго по одной
+}
+EXECUTOR_QUEUE = 64  # задач в очереди пула сверх рабочих; дальше offload() ждёт места
+DEPS_CACHE_FILE = "kub_deps_cache.json"
+MODULE_CACHE_DIR = ".kub_cache"
+MODULE_POLL_INTERVAL = 2.0  # сек. — опрос папки модулей без inotify
+MODULE_RELOAD_DEBOUNCE = 0.3  # сек. — пауза после изменения файла перед перезагрузкой
+INLINE_START_WAIT = 10.0  # сек. — сколько ждать inline-бота перед setup() модулей
+HTTP_TIMEOUT = 30.0  # сек. — общий таймаут запроса по умолчанию
+HTTP_POOL_LIMIT = 100  # соединений в пуле всего
+HTTP_PER_HOST_LIMIT = 8  # одновременных соединений на хост
+HTTP_DNS_TTL = 300  # сек. — кэш DNS
+HTTP_KEEPALIVE = 30.0  # сек. — простой keep-alive соединения
+HTTP_RETRIES = 2  # повторов идемпотентного запроса
+HTTP_BACKOFF = 0.3  # сек. — база экспоненциальной задержки повтора
+HTTP_BREAKER_THRESHOLD = 5  # ошибок подряд до размыкания предохранителя хоста
+HTTP_BREAKER_COOLDOWN = 30.0  # сек. — хост отклоняется без запроса
+RESPONSE_CACHE_DIR = os.path.join(MODULE_CACHE_DIR, "responses")
+RESPONSE_CACHE_ENTRIES = 512  # записей в памяти (LRU)
+RESPONSE_CACHE_DISK_MAX = 2000  # файлов на диске, старые удаляются
+RPC_GLOBAL_RATE = 25.0  # исходящих действий в секунду на аккаунт
+RPC_GLOBAL_BURST = 30
+RPC_RESERVE = 0.2  # доля глобального запаса, недоступная фоновым задачам
+RPC_FLOOD_RETRIES = 3  # повторов после FloodWait
+RPC_MAX_FLOOD_WAIT = 300  # сек. — дольше ждать не будем, ошибка уходит вызывающему
+LIVE_EDIT_INTERVAL = 1.0  # сек. — минимум между правками «живого» сообщения
+LIVE_EDIT_MAX_INTERVAL = 30.0  # потолок после FloodWait
+LIVE_EDIT_RETRIES = 5  # сбоев подряд (сеть, 5xx), после которых правки прекращаются
+PURGE_CHUNK = 100  # максимум id в одном messages.deleteMessages
+PURGE_WORKERS = 4  # параллельных пачек удаления (темп держит планировщик)
+PURGE_PROGRESS_INTERVAL = 3.0  # сек. между правками прогресса
+PANEL_PAGE_SIZE = 16  # модулей на страницу inline-панели
+PANEL_KB_CACHE = 256  # собранных клавиатур в кэше
+PANEL_CALLBACK_MAX = 64  # лимит Telegram на callback-data, байт
+PANEL_INLINE_CACHE = 10  # сек. — кэш ответа владельцу на inline-запрос
+PANEL_INLINE_DENY_CACHE = 300  # сек. — кэш отказа посторонним
+# (в секунду, запас) на вид действия: на аккаунт и на чат
+RPC_LIMITS = {
+    "send": ((20.0, 30), (1.0, 5)),
+    "edit": ((20.0, 30), (2.0, 5)),
+    "delete": ((10.0, 20), (3.0, 6)),
+    "react": ((5.0, 10), (1.0, 3)),
+    "upload": ((3.0, 5), None),
+    "story": ((0.5, 3), None),
+}
 def get_default_kinfo_template(bot=None):
     return (
         f"{CE.BRAND} <b>{{brand}}</b> v{{version}}\n"
@@ -589,6 +823,116 @@ def get_raw_github_url(url: str) -> str:
         url = url.rstrip("/") + "/raw"
     return url
 
+# ──────────────────────── Шаблоны kinfo/alive ────────────────
+
+# Переключатель show_* → переменная шаблона; строка скрывается, если в ней
+# есть переменная с выключенным переключателем (привязка явная, не по тексту)
+KINFO_TOGGLES = {
+    "show_ping": "ping", "show_uptime": "uptime", "show_modules": "modules",
+    "show_commands": "commands", "show_prefix": "prefix", "show_python": "python",
+    "show_telethon": "telethon", "show_os": "os", "show_owner": "owner",
+}
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный один раз в строки из сегментов
+    (литерал, переменная, формат, конверсия) с набором переменных строки.
+    """
+    __slots__ = ("source", "lines", "variables")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.lines: List[Tuple[list, frozenset]] = []
+        fmt = string.Formatter()
+        for raw in source.split("\n"):
+            segs = []
+            names = set()
+            for literal, name, spec, conv in fmt.parse(raw):
+                if name is not None:
+                    if not name.isidentifier():
+                        raise ValueError(f"unsupported field {{{name}}}")
+                    names.add(name)
+                segs.append((literal, name, spec or "", conv))
+            self.lines.append((segs, frozenset(names)))
+        self.variables = frozenset().union(*(n for _, n in self.lines))
+
+    def needed(self, hidden=frozenset()) -> frozenset:
+        """Переменные видимых строк — только их и нужно вычислять"""
+        return frozenset().union(*(n for _, n in self.lines if not (n & hidden)))
+
+    def render(self, values: Dict[str, Any], hidden=frozenset()) -> str:
+        out = []
+        for segs, names in self.lines:
+            if names & hidden:
+                continue
+            parts = []
+            for literal, name, spec, conv in segs:
+                parts.append(literal)
+                if name is None:
+                    continue
+                v = values[name]
+                if conv == "r":
+                    v = repr(v)
+                elif conv == "a":
+                    v = ascii(v)
+                parts.append(format(v, spec))
+            out.append("".join(parts))
+        return "\n".join(out)
+
+@functools.lru_cache(maxsize=32)
+def compile_template(source: str) -> CompiledTemplate:
+    """Кэш по тексту шаблона: смена шаблона в конфиге = новый ключ"""
+    return CompiledTemplate(source)
+
+def template_error(source: str, variables) -> Optional[str]:
+    """Почему шаблон не отрисуется (None — годится): неподдерживаемое поле или неизвестная переменная"""
+    try:
+        tpl = compile_template(source)
+    except ValueError as e:
+        return str(e)
+    unknown = sorted(tpl.variables - set(variables))
+    return f"unknown variable {{{unknown[0]}}}" if unknown else None
+
+@functools.lru_cache(maxsize=32)
+def _log_template_fallback(where: str, source: str, error: str):
+    # lru_cache — одно предупреждение на шаблон, а не на каждый вызов команды
+    log.warning(f"{where}: custom template ignored — {error}")
+
+@functools.lru_cache(maxsize=None)
+def _platform_info() -> Dict[str, str]:
+    """Не меняется за время жизни процесса"""
+    return {
+        "python": platform.python_version(),
+        "telethon": telethon_version.__version__,
+        "os": f"{platform.system()} {platform.release()}",
+    }
+
+async def render_template(tpl: CompiledTemplate, providers: Dict[str, Any], hidden=frozenset()) -> str:
+    """
+    Вычисляет только переменные видимых строк. Провайдер — значение или
+    функция без аргументов (синхронная или корутина); медленные
+    (владелец, пинг) выполняются параллельно. KeyError — неизвестная
+    переменная.
+    """
+    needed = tpl.needed(hidden)
+    missing = needed - providers.keys()
+    if missing:
+        raise KeyError(sorted(missing)[0])
+    values: Dict[str, Any] = {}
+    pending = {}
+    for name in needed:
+        v = providers[name]
+        if callable(v):
+            v = v()
+        if asyncio.iscoroutine(v):
+            pending[name] = v
+        else:
+            values[name] = v
+    if pending:
+        results = await asyncio.gather(*pending.values())
+        values.update(zip(pending.keys(), results))
+    return tpl.render(values, hidden)
+
 # ──────────────── Управление зависимостями ───────────────────
 
 PIP_TO_IMPORT = {
@@ -631,27 +975,36 @@ def _get_import_name(pip_name: str) -> str:
     mapped = PIP_TO_IMPORT.get(base.lower())
     return mapped if mapped else base.replace("-", "_")
 
-def is_package_installed(package: str) -> bool:
-    base = re.split(r'[><=!~]', package)[0].strip()
-    import_name = _get_import_name(package)
+def _has_spec(name: str) -> bool:
     try:
-        importlib.import_module(import_name)
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def is_package_installed(package: str) -> bool:
+    # Только поиск спецификации/метаданных — без импорта самого пакета
+    base = re.split(r'[><=!~\[;]', package)[0].strip()
+    if _has_spec(_get_import_name(package)):
         return True
-    except ImportError:
-        pass
     try:
         from importlib.metadata import distribution
         distribution(base)
         return True
     except Exception:
         pass
-    try:
-        importlib.import_module(base.replace("-", "_").lower())
-        return True
-    except ImportError:
-        pass
-    return False
+    return _has_spec(base.replace("-", "_").lower())
+
+_PIP_LOCK = threading.Lock()
 
+def _pip_serialized(fn: Callable) -> Callable:
+    """Один pip за раз на окружение: параллельные установки портят site-packages"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _PIP_LOCK:
+            return fn(*args, **kwargs)
+    return wrapper
+
+@_pip_serialized
 def install_pip_package(package: str, timeout: int = 120) -> Tuple[bool, str]:
     try:
         result = subprocess.run([sys.executable, "-m", "pip", "install", package, "--quiet"],
@@ -670,6 +1023,28 @@ def install_pip_package(package: str, timeout: int = 120) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"{package}: {e}"
 
+@_pip_serialized
+def install_pip_packages(packages: List[str], timeout: int = 300) -> Tuple[bool, str]:
+    """Один вызов pip для нескольких пакетов"""
+    if not packages:
+        return True, ""
+    try:
+        result = subprocess.run([sys.executable, "-m", "pip", "install", *packages, "--quiet"],
+            capture_output=True, text=True, timeout=timeout,
+        )
+        importlib.invalidate_caches()
+        if result.returncode == 0:
+            return True, " ".join(packages)
+        err = result.stderr.strip().split("\n")[-1] if result.stderr.strip() else "unknown error"
+        return False, err[:200]
+    except subprocess.TimeoutExpired:
+        return False, f"timeout ({timeout}s)"
+    except FileNotFoundError:
+        return False, "pip not found"
+    except Exception as e:
+        return False, str(e)
+
+@_pip_serialized
 def uninstall_pip_package(package: str) -> Tuple[bool, str]:
     try:
         result = subprocess.run([sys.executable, "-m", "pip", "uninstall", package, "-y", "--quiet"],
@@ -683,66 +1058,161 @@ def uninstall_pip_package(package: str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"{package}: {e}"
 
-def check_and_install_requirements(content: str) -> Dict[str, Any]:
-    reqs = parse_module_requirements(content)
-    result = {"all": reqs, "already": [], "installed": [], "failed": []}
-    for pkg in reqs:
-        if is_package_installed(pkg):
-            result["already"].append(pkg)
-            log.debug(f"📦 {pkg} — already installed")
-        else:
-            log.info(f"📥 Installing: {pkg} ...")
-            ok, msg = install_pip_package(pkg)
-            if ok:
-                result["installed"].append(pkg)
-                log.info(f"✅ {pkg} installed")
-            else:
-                result["failed"].append(msg)
-                log.error(f"❌ Failed {pkg}: {msg}")
-    return result
-
 async def async_install_pip_package(package: str, timeout: int = 120) -> Tuple[bool, str]:
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            sys.executable, "-m", "pip", "install", package, "--quiet",
-            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
-        )
+    # через пул pip: установки и удаления идут строго по одной
+    return await offload(install_pip_package, package, timeout, pool="pip")
+
+async def async_install_pip_packages(packages: List[str], timeout: int = 300) -> Tuple[bool, str]:
+    return await offload(install_pip_packages, packages, timeout, pool="pip")
+
+class RequirementsResolver:
+    """
+    Разрешение зависимостей модулей: проверка через find_spec/metadata,
+    персистентный кэш «хеш файла модуля → требования удовлетворены»
+    и единый вызов pip для всех недостающих пакетов пачки модулей.
+    """
+    def __init__(self, path: str = DEPS_CACHE_FILE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._env = f"{sys.executable}|{platform.python_version()}"
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        # resolve_many идёт в пуле pip, forget* — на цикле: записи и файл под локом
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
         try:
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
-        except asyncio.TimeoutError:
-            proc.kill()
-            return False, f"{package}: timeout ({timeout}s)"
-        if proc.returncode == 0:
-            importlib.invalidate_caches()
-            return True, package
-        else:
-            err = stderr.decode().strip().split("\n")[-1] if stderr else "unknown"
-            return False, f"{package}: {err[:200]}"
-    except FileNotFoundError:
-        return False, f"{package}: pip not found"
-    except Exception as e:
-        return False, f"{package}: {e}"
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("env") == self._env:
+            self._entries = data.get("modules", {}) or {}
 
-async def async_check_and_install_requirements(content: str) -> Dict[str, Any]:
-    reqs = parse_module_requirements(content)
-    result = {"all": reqs, "already": [], "installed": [], "failed": []}
-    for pkg in reqs:
-        if is_package_installed(pkg):
-            result["already"].append(pkg)
-        else:
-            log.info(f"📥 Installing: {pkg} ...")
-            ok, msg = await async_install_pip_package(pkg)
-            if ok:
-                result["installed"].append(pkg)
-                log.info(f"✅ {pkg} installed")
-            else:
-                result["failed"].append(msg)
-                log.error(f"❌ {msg}")
-    return result
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self._dirty:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"env": self._env, "modules": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            log.error(f"deps cache: {e}")
+
+    @staticmethod
+    def digest(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+
+    def forget(self, digest: str):
+        with self._lock:
+            if self._entries.pop(digest, None) is not None:
+                self._dirty = True
+                self._save()
+
+    def forget_package(self, package: str):
+        """Сбросить записи, зависящие от пакета (после pip uninstall)"""
+        base = re.split(r'[><=!~\[;]', package)[0].strip().lower()
+        with self._lock:
+            drop = [
+                d for d, e in self._entries.items()
+                if any(re.split(r'[><=!~\[;]', r)[0].strip().lower() == base for r in e.get("reqs", []))
+            ]
+            for d in drop:
+                del self._entries[d]
+            if drop:
+                self._dirty = True
+                self._save()
+
+    def _prepare(self, items: Dict[str, Any]):
+        # вызывается под self._lock
+        results: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, Tuple[str, List[str], List[str]]] = {}
+        to_install: List[str] = []
+        for name, item in items.items():
+            # item — исходник (str) либо ModuleArtifact с готовыми хешем и требованиями
+            d = self.digest(item) if isinstance(item, str) else item.sha256
+            entry = self._entries.get(d)
+            if entry is not None:
+                self.hits += 1
+                reqs = entry.get("reqs", [])
+                results[name] = {"all": reqs, "already": list(reqs), "installed": [], "failed": [], "cached": True}
+                continue
+            self.misses += 1
+            reqs = parse_module_requirements(item) if isinstance(item, str) else list(item.requirements)
+            missing = [r for r in reqs if not is_package_installed(r)]
+            pending[name] = (d, reqs, missing)
+            for r in missing:
+                if r.lower() not in (x.lower() for x in to_install):
+                    to_install.append(r)
+        return results, pending, to_install
+
+    def _finish(self, results, pending, failures: Dict[str, str]):
+        for name, (d, reqs, missing) in pending.items():
+            failed = [failures[r.lower()] for r in missing if r.lower() in failures]
+            installed = [r for r in missing if r.lower() not in failures]
+            results[name] = {
+                "all": reqs, "already": [r for r in reqs if r not in missing],
+                "installed": installed, "failed": failed, "cached": False,
+            }
+            if not failed:
+                self._entries[d] = {"name": name, "reqs": reqs}
+                self._dirty = True
+        self._save()
+        return results
+
+    def resolve_many(self, items: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """items: имя модуля → исходник или ModuleArtifact. Возвращает по каждому модулю {"all", "already", "installed", "failed"}"""
+        with self._lock:
+            results, pending, to_install = self._prepare(items)
+        failures: Dict[str, str] = {}
+        if to_install:
+            log.info(f"📥 Installing: {', '.join(to_install)} ...")
+            ok, msg = install_pip_packages(to_install)
+            if not ok:
+                # пачка не встала — ставим по одному, чтобы найти виноватых
+                for pkg in to_install:
+                    ok1, msg1 = install_pip_package(pkg)
+                    if not ok1:
+                        failures[pkg.lower()] = msg1
+                        log.error(f"❌ {msg1}")
+        with self._lock:
+            return self._finish(results, pending, failures)
+
+    def resolve(self, name: str, item) -> Dict[str, Any]:
+        return self.resolve_many({name: item})[name]
 
 # ──────────────────────── Конфиг ─────────────────────────────
 
+_LIVE_CONFIGS: "weakref.WeakSet" = weakref.WeakSet()
+
+def flush_all_configs():
+    """Сбрасывает на диск все несохранённые конфиги (выход, os._exit)"""
+    for cfg in list(_LIVE_CONFIGS):
+        try:
+            cfg.flush()
+        except Exception as e:
+            log.error(f"Config flush: {e}")
+
+atexit.register(flush_all_configs)
+
 class Config:
+    """
+    JSON-конфиг с отложенной записью (write-behind).
+    save()/set() только помечают данные изменёнными — запись выполняется
+    фоновым таймером через flush_interval секунд, все изменения за это окно
+    склеиваются в одну атомарную запись (temp-файл + os.replace).
+    """
+    _own_attrs = ("path", "data", "_defaults", "flush_interval",
+                  "persist_stats", "_dirty", "_timer", "_lock", "version", "_failures")
+
     _defaults = {
         "api_id": 0,
         "api_hash": "",
@@ -754,6 +1224,8 @@ class Config:
         "disabled_modules": [],
         "custom_settings": {},
         "owner_id": 0,
+        "hot_reload": True,
+        "lazy_modules": True,
         "installed_modules": {},
         "kinfo": {
             "template": "",
@@ -776,10 +1248,18 @@ class Config:
         },
     }
 
-    def __init__(self, path: str = CONFIG_FILE):
+    def __init__(self, path: str = CONFIG_FILE, flush_interval: float = CONFIG_FLUSH_INTERVAL):
         self.path = path
         self.data: Dict[str, Any] = {}
+        self.flush_interval = flush_interval
+        self.persist_stats = {"requests": 0, "writes": 0, "coalesced": 0, "errors": 0}
+        self.version = 0  # растёт при set()/save() — ключ для кэшей (клавиатуры панели)
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self._failures = 0  # неудачных записей подряд — для паузы перед повтором
+        self._lock = threading.RLock()
         self.load()
+        _LIVE_CONFIGS.add(self)
 
     def load(self):
         if os.path.exists(self.path):
@@ -794,19 +1274,103 @@ class Config:
                 for dk, dv in v.items():
                     self.data[k].setdefault(dk, dv)
 
+    def mark_dirty(self):
+        """Помечает конфиг изменённым и планирует отложенную запись"""
+        with self._lock:
+            self.persist_stats["requests"] += 1
+            if self._dirty and self._timer is not None and self.flush_interval > 0:
+                # запись (или повтор после ошибки) уже запланирована
+                self.persist_stats["coalesced"] += 1
+                return
+            self._dirty = True
+            if self.flush_interval > 0:
+                self._schedule(self.flush_interval)
+                return
+        self.flush()
+
+    def _schedule(self, delay: float):
+        # вызывается под self._lock
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _failed(self):
+        """Запись не удалась: данные остаются грязными, повтор — с растущей паузой"""
+        self._failures += 1
+        self.persist_stats["errors"] += 1
+        base = self.flush_interval if self.flush_interval > 0 else 1.0
+        self._schedule(min(CONFIG_RETRY_MAX, base * 2 ** (self._failures - 1)))
+
     def save(self):
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        # version — только для настоящих изменений настроек (set/save); счётчики
+        # статистики идут через mark_dirty() и кэши панели не сбрасывают
+        self.version += 1
+        self.mark_dirty()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    @property
+    def writes_saved(self) -> int:
+        return self.persist_stats["requests"] - self.persist_stats["writes"]
+
+    def flush(self) -> bool:
+        """Немедленно записывает конфиг, если есть несохранённые изменения"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return False
+            payload = None
+            for _ in range(3):
+                try:
+                    payload = json.dumps(self.data, indent=2, ensure_ascii=False)
+                    break
+                except RuntimeError:
+                    # data меняется из другого потока во время сериализации
+                    time.sleep(0.01)
+            if payload is None:
+                self._failed()
+                return False
+            self._dirty = False
+            try:
+                self._write_atomic(payload)
+            except OSError as e:
+                self._dirty = True
+                log.error(f"Config save: {e}")
+                self._failed()
+                return False
+            self._failures = 0
+            self.persist_stats["writes"] += 1
+            return True
+
+    def _write_atomic(self, payload: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".kub_config.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
 
     def __getattr__(self, name):
-        if name in ("path", "data", "_defaults"):
+        if name in Config._own_attrs:
             return super().__getattribute__(name)
         if name in self.data:
             return self.data[name]
         raise AttributeError(name)
 
     def __setattr__(self, name, value):
-        if name in ("path", "data", "_defaults"):
+        if name in Config._own_attrs:
             super().__setattr__(name, value)
         else:
             self.data[name] = value
@@ -874,6 +1438,7 @@ class Command:
     module: str = ""
     usage: str = ""
     category: str = "misc"
+    aliases: List[str] = field(default_factory=list)
 
 @dataclass
 class Module:
@@ -889,26 +1454,290 @@ class Module:
     settings_schema: List[Dict] = field(default_factory=list)
     requirements: List[str] = field(default_factory=list)
 
+# вызовы в setup(), после которых модуль нельзя откладывать: он должен
+# слушать апдейты/inline-бота или работать в фоне с момента загрузки
+_LAZY_BLOCKERS = {
+    "add_watcher", "add_panel_page", "add_event_handler", "on", "create_task", "ensure_future",
+    "run_coroutine_threadsafe", "Thread",
+}
+
+def _const_str(node) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+def _usage_template(node) -> Optional[str]:
+    """f"{p}cmd <arg>" → "{prefix}cmd <arg>" (первый плейсхолдер — префикс)"""
+    if _const_str(node) is not None:
+        return node.value
+    if not isinstance(node, ast.JoinedStr) or not node.values:
+        return None
+    head, tail = node.values[0], node.values[1:]
+    if not isinstance(head, ast.FormattedValue) or any(_const_str(v) is None for v in tail):
+        return None
+    return "{prefix}" + "".join(v.value for v in tail)
+
+def parse_module_manifest(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Статический разбор модуля без его выполнения: имя Module(...), команды
+    из mod.commands = {...} и признак «ленивой» загрузки. Явно задаётся
+    строкой "# lazy: yes|no" в шапке файла.
+    """
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return None
+    override = None
+    for line in content.split("\n")[:50]:
+        stripped = line.strip().lower()
+        if stripped.startswith("# lazy:"):
+            override = stripped[7:].strip() in ("yes", "true", "on", "1")
+    setup = next((n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))
+                  and n.name == "setup"), None)
+    if setup is None:
+        return None
+
+    # узлы, выполняемые при импорте и в setup() (без тел вложенных функций);
+    # у определений функций всё же выполняются декораторы и значения по
+    # умолчанию (@bot.client.on(...) над обработчиком), у классов — базы и тело
+    skip = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+    def _def_time(n) -> List[ast.AST]:
+        if isinstance(n, ast.ClassDef):
+            return n.decorator_list + n.bases + [k.value for k in n.keywords] + n.body
+        parts = list(getattr(n, "decorator_list", []))
+        return parts + n.args.defaults + [d for d in n.args.kw_defaults if d is not None]
+
+    nodes, stack = [], tree.body + setup.body
+    while stack:
+        n = stack.pop()
+        if isinstance(n, skip):
+            stack.extend(_def_time(n))
+            continue
+        nodes.append(n)
+        stack.extend(ast.iter_child_nodes(n))
+    # в порядке исходника: более поздние определения перекрывают ранние
+    nodes.sort(key=lambda n: (getattr(n, "lineno", 0), getattr(n, "col_offset", 0)))
+
+    consts: Dict[str, str] = {}
+    for n in nodes:
+        if isinstance(n, ast.Assign) and len(n.targets) == 1 and isinstance(n.targets[0], ast.Name):
+            v = _const_str(n.value)
+            if v is not None:
+                consts[n.targets[0].id] = v
+
+    def _str(node) -> Optional[str]:
+        if isinstance(node, ast.Name):
+            return consts.get(node.id)
+        return _const_str(node)
+
+    blocked, dynamic = False, False
+    names: List[str] = []
+    info: Dict[str, Any] = {}
+    commands: Dict[str, Dict[str, Any]] = {}
+    for n in nodes:
+        if isinstance(n, ast.Call):
+            fn = n.func.attr if isinstance(n.func, ast.Attribute) else getattr(n.func, "id", None)
+            if fn in _LAZY_BLOCKERS:
+                blocked = True
+            elif fn == "Module":
+                args = dict(zip(("name", "description", "author", "version"), n.args))
+                args.update({k.arg: k.value for k in n.keywords if k.arg})
+                name = _str(args.get("name"))
+                if name is None:
+                    dynamic = True
+                elif name not in names:
+                    names.append(name)
+                for k in ("description", "author", "version"):
+                    v = _str(args.get(k))
+                    if v is not None:
+                        info.setdefault(k, v)
+                if "settings_schema" in args:
+                    try:
+                        info["settings_schema"] = ast.literal_eval(args["settings_schema"])
+                    except ValueError:
+                        pass
+        elif isinstance(n, ast.Assign):
+            for tgt in n.targets:
+                if isinstance(tgt, ast.Attribute) and tgt.attr == "commands":
+                    if not isinstance(n.value, ast.Dict):
+                        dynamic = True
+                        continue
+                    for k, v in zip(n.value.keys, n.value.values):
+                        cn = _str(k) if k is not None else None
+                        if cn is None:
+                            dynamic = True
+                            continue
+                        meta: Dict[str, Any] = {}
+                        if isinstance(v, ast.Call):
+                            args = dict(zip(("name", "handler", "description", "module", "usage", "category"), v.args))
+                            args.update({kw.arg: kw.value for kw in v.keywords if kw.arg})
+                            for key in ("description", "category"):
+                                val = _str(args.get(key))
+                                if val is not None:
+                                    meta[key] = val
+                            if args.get("usage") is not None:
+                                usage = _usage_template(args["usage"])
+                                if usage is not None:
+                                    meta["usage"] = usage
+                            al = args.get("aliases")
+                            if isinstance(al, (ast.List, ast.Tuple)):
+                                meta["aliases"] = [x for x in map(_str, al.elts) if x]
+                        commands.setdefault(cn, {}).update(meta)
+                elif isinstance(tgt, ast.Subscript) and isinstance(tgt.value, ast.Attribute) \
+                        and tgt.value.attr == "commands":
+                    cn = _str(tgt.slice)
+                    if cn is None:
+                        dynamic = True
+                    else:
+                        commands.setdefault(cn, {})
+    lazy = bool(commands) and len(names) == 1 and not dynamic and not blocked
+    if override is not None:
+        lazy = override and bool(commands) and len(names) == 1
+    return {
+        "module": names[0] if len(names) == 1 else None,
+        "commands": commands,
+        "lazy": lazy,
+        **info,
+    }
+
+@dataclass
+class ModuleArtifact:
+    """Скомпилированный модуль и метаданные, извлечённые из исходника"""
+    name: str
+    path: str
+    mtime_ns: int
+    size: int
+    sha256: str
+    requirements: List[str] = field(default_factory=list)
+    has_setup: bool = False
+    manifest: Optional[Dict[str, Any]] = None
+    code: Any = None
+    content: Optional[str] = None
+
+class ModuleArtifactCache:
+    """
+    Кэш артефактов модулей на диске (MODULE_CACHE_DIR): code object (marshal)
+    + требования/имя/наличие setup/манифест команд. Ключ — путь+mtime+размер; при «touch» без
+    изменений совпадение sha256 тоже даёт попадание. Попадание по stat не
+    читает исходник вовсе.
+    """
+    _MAGIC = b"KUBC2"
+
+    def __init__(self, directory: str = MODULE_CACHE_DIR):
+        self.dir = Path(directory)
+        self.hits = 0
+        self.misses = 0
+        self._tag = sys.implementation.cache_tag or "py"
+
+    def _file(self, src: Path) -> Path:
+        return self.dir / f"{src.stem}.{self._tag}.kubc"
+
+    def _read(self, src: Path) -> Optional[ModuleArtifact]:
+        try:
+            raw = self._file(src).read_bytes()
+            if not raw.startswith(self._MAGIC):
+                return None
+            n = int.from_bytes(raw[5:9], "big")
+            meta = json.loads(raw[9:9 + n].decode("utf-8"))
+            code = marshal.loads(raw[9 + n:])
+            return ModuleArtifact(code=code, **meta)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+    def _write(self, art: ModuleArtifact):
+        meta = json.dumps({
+            "name": art.name, "path": art.path, "mtime_ns": art.mtime_ns, "size": art.size,
+            "sha256": art.sha256, "requirements": art.requirements, "has_setup": art.has_setup,
+            "manifest": art.manifest,
+        }).encode("utf-8")
+        target = self._file(Path(art.path))
+        tmp = target.with_suffix(".tmp")
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(self._MAGIC + len(meta).to_bytes(4, "big") + meta + marshal.dumps(art.code))
+            os.replace(tmp, target)
+        except OSError as e:
+            log.debug(f"module cache: {e}")
+
+    def load(self, src: Path) -> ModuleArtifact:
+        st = src.stat()
+        path = str(src.resolve())
+        cached = self._read(src)
+        if cached and cached.path == path and cached.mtime_ns == st.st_mtime_ns and cached.size == st.st_size:
+            self.hits += 1
+            return cached
+        content = src.read_text(encoding="utf-8", errors="replace")
+        digest = RequirementsResolver.digest(content)
+        if cached and cached.path == path and cached.sha256 == digest:
+            self.hits += 1
+            cached.mtime_ns, cached.size, cached.content = st.st_mtime_ns, st.st_size, content
+            self._write(cached)
+            return cached
+        self.misses += 1
+        code = compile(content, str(src), "exec", dont_inherit=True)
+        art = ModuleArtifact(
+            name=src.stem, path=path, mtime_ns=st.st_mtime_ns, size=st.st_size, sha256=digest,
+            requirements=parse_module_requirements(content),
+            has_setup="setup" in code.co_names, manifest=parse_module_manifest(content),
+            code=code, content=content,
+        )
+        self._write(art)
+        return art
+
+    def drop(self, src: Path):
+        try:
+            self._file(src).unlink()
+        except OSError:
+            pass
+
 class ModuleManager:
     def __init__(self, bot):
         self.bot = bot
         self.modules: Dict[str, Module] = {}
         self._builtin_names: set = set()
+        self.resolver = RequirementsResolver()
+        self.artifacts = ModuleArtifactCache()
+        self._file_state: Dict[str, Tuple[int, int]] = {}
+        self._file_modules: Dict[str, List[str]] = {}
+        self._lazy: Dict[str, Tuple[Path, Module]] = {}
+        self.watcher = ModuleDirWatcher(self)
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self.version = 0  # растёт при любом изменении набора модулей
 
     def register_module(self, module: Module):
         self.modules[module.name] = module
+        self.version += 1
         log.info(f"📦 {module.name} v{module.version} ({len(module.commands)} cmd)")
 
     def mark_builtin(self, name: str):
         self._builtin_names.add(name)
+        self.version += 1
 
     def is_builtin(self, name: str) -> bool:
         return name in self._builtin_names
 
+    def is_lazy(self, name: str) -> bool:
+        """Модуль зарегистрирован заглушкой и ещё не выполнялся"""
+        return name in self._lazy
+
     def unload_module(self, name: str) -> bool:
         if name not in self.modules:
             return False
         mod = self.modules[name]
+        self._retire(mod, self.bot.dispatcher.watchers(name), pages=self._panel_pages(name))
+        del self.modules[name]
+        return True
+
+    def _panel_pages(self, name: str) -> List["PanelPage"]:
+        panel = getattr(self.bot, "inline_panel", None)
+        return panel.pages(name) if panel else []
+
+    def _retire(self, mod: Module, watchers: List["Watcher"], keep: Dict[str, Any] = None,
+                pages: List["PanelPage"] = ()):
+        """Снять обработчики/вотчеры/страницы панели/команды экземпляра модуля (команды из keep не трогаются)"""
+        keep = keep or {}
+        self.version += 1
+        if self._lazy.get(mod.name, (None, None))[1] is mod:
+            del self._lazy[mod.name]
         if mod.on_unload:
             try:
                 r = mod.on_unload()
@@ -921,10 +1750,18 @@ class ModuleManager:
                 self.bot.client.remove_event_handler(h)
             except Exception:
                 pass
-        for cn in mod.commands:
-            self.bot._command_handlers.pop(cn, None)
-        del self.modules[name]
-        return True
+        for w in watchers:
+            self.bot.dispatcher.remove(w)
+        if pages:
+            self.bot.inline_panel.remove_pages(pages)
+        for cn, cmd in mod.commands.items():
+            if cn in keep:
+                continue
+            if self.bot._command_handlers.get(cn) is cmd:
+                self.bot._command_handlers.pop(cn, None)
+            for a in getattr(cmd, "aliases", None) or ():
+                if self.bot._command_aliases.get(a) == cn:
+                    self.bot._command_aliases.pop(a, None)
 
     def get_all_commands(self) -> Dict[str, Command]:
         cmds = {}
@@ -935,19 +1772,79 @@ class ModuleManager:
     def get_user_modules(self) -> Dict[str, Module]:
         return {k: v for k, v in self.modules.items() if not self.is_builtin(k)}
 
-    def load_from_directory(self, directory: str = MODULES_DIR):
+    def _discover(self, directory: str = MODULES_DIR, include_disabled: bool = False) -> List[Path]:
         path = Path(directory)
         if not path.exists():
             path.mkdir(parents=True, exist_ok=True)
-            return
+            return []
+        disabled = () if include_disabled else self.bot.config.disabled_modules
+        return [
+            f for f in sorted(path.glob("*.py"))
+            if not f.name.startswith("_") and f.stem not in disabled
+        ]
+
+    async def load_from_directory_async(self, directory: str = MODULES_DIR, timeline=None,
+                                        before_setup=None):
+        """
+        Загрузка при старте: чтение+компиляция файлов и разрешение зависимостей
+        идут в пулах io и pip (цикл свободен для inline-бота и апдейтов), затем
+        exec/setup() каждого модуля по очереди на цикле с замером времени.
+        """
+        files = self._discover(directory)
+        arts: Dict[str, ModuleArtifact] = {}
+        t = time.perf_counter()
+        results = await asyncio.gather(
+            *(offload(self.artifacts.load, f) for f in files),
+            return_exceptions=True,
+        )
+        for f, res in zip(files, results):
+            if isinstance(res, BaseException):
+                log.error(f"Error {f.name}: {res}")
+            else:
+                arts[f.stem] = res
+        if timeline:
+            timeline.add_stage("modules: read+compile", t)
+            timeline.notes["module cache"] = f"{self.artifacts.hits} hit / {self.artifacts.misses} miss"
+        t = time.perf_counter()
+        deps = await offload(self.resolver.resolve_many, arts, pool="pip")
+        if timeline:
+            timeline.add_stage("modules: deps", t)
+            timeline.notes["deps cache"] = f"{self.resolver.hits} hit / {self.resolver.misses} miss"
+        if before_setup:
+            await before_setup()
         loaded = 0
-        for f in sorted(path.glob("*.py")):
-            if f.name.startswith("_"):
+        for f in files:
+            if f.stem not in arts:
                 continue
-            if f.stem in self.bot.config.disabled_modules:
+            t = time.perf_counter()
+            try:
+                self._load_file(f, artifact=arts[f.stem], deps_result=deps.get(f.stem))
+                loaded += 1
+            except Exception as e:
+                log.error(f"Error {f.name}: {e}")
+                traceback.print_exc()
+            if timeline:
+                timeline.add_module(f.stem, t)
+        if timeline and self._lazy:
+            timeline.notes["lazy modules"] = ", ".join(self._lazy)
+        if loaded:
+            log.info(f"📂 {loaded} {S('user_mods_loaded', self.bot)}")
+
+    def load_from_directory(self, directory: str = MODULES_DIR):
+        files = self._discover(directory)
+        arts: Dict[str, ModuleArtifact] = {}
+        for f in files:
+            try:
+                arts[f.stem] = self.artifacts.load(f)
+            except (OSError, SyntaxError, ValueError) as e:
+                log.error(f"Error {f.name}: {e}")
+        deps = self.resolver.resolve_many(arts)
+        loaded = 0
+        for f in files:
+            if f.stem not in arts:
                 continue
             try:
-                self._load_file(f)
+                self._load_file(f, artifact=arts[f.stem], deps_result=deps.get(f.stem))
                 loaded += 1
             except Exception as e:
                 log.error(f"Error {f.name}: {e}")
@@ -955,10 +1852,104 @@ class ModuleManager:
         if loaded:
             log.info(f"📂 {loaded} {S('user_mods_loaded', self.bot)}")
 
-    def _load_file(self, file: Path):
-        content = file.read_text(encoding="utf-8", errors="replace")
-        deps_result = check_and_install_requirements(content)
-        if deps_result["all"]:
+    @staticmethod
+    def _file_key(file: Path) -> str:
+        return str(Path(file).resolve())
+
+    def _load_file(self, file: Path, artifact: ModuleArtifact = None,
+                   deps_result: Dict[str, Any] = None, lazy: Optional[bool] = None) -> List[str]:
+        """
+        Загружает файл модуля; возвращает имена зарегистрированных им модулей.
+        lazy=None — по настройке lazy_modules: модули только с командами
+        регистрируются заглушками, а выполняются при первой команде.
+        """
+        key = self._file_key(file)
+        try:
+            st = file.stat()
+            self._file_state[key] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        before = dict(self.modules)
+        try:
+            if artifact is None:
+                artifact = self.artifacts.load(file)
+            if lazy is None:
+                lazy = self.bot.config.get("lazy_modules", True)
+            manifest = artifact.manifest or {}
+            if lazy and manifest.get("lazy"):
+                self._register_stub(file, manifest)
+            else:
+                self._exec_file(file, artifact, deps_result)
+        finally:
+            new = [n for n, m in self.modules.items() if before.get(n) is not m]
+            if new or key not in self._file_modules:
+                self._file_modules[key] = new
+        return new
+
+    def _register_stub(self, file: Path, manifest: Dict[str, Any]):
+        name = manifest["module"]
+        p = self.bot.config.prefix
+        mod = Module(
+            name=name,
+            description=manifest.get("description", ""),
+            author=manifest.get("author", "Unknown"),
+            version=manifest.get("version", "1.0"),
+            settings_schema=list(manifest.get("settings_schema") or []),
+        )
+        for cn, meta in manifest["commands"].items():
+            mod.commands[cn] = Command(
+                cn, self._stub_handler(name, cn), meta.get("description", ""), name,
+                meta.get("usage", "{prefix}" + cn).replace("{prefix}", p),
+                meta.get("category", "misc"), list(meta.get("aliases") or []),
+            )
+        self.modules[name] = mod
+        self.version += 1
+        self._lazy[name] = (file, mod)
+        self.bot.register_commands(mod)
+        log.debug(f"💤 {name} ({len(mod.commands)} cmd)")
+
+    def _stub_handler(self, name: str, cn: str) -> Callable:
+        async def handler(event):
+            if not await self.activate(name):
+                await safe_edit(event, f"{CE.CROSS} <code>{html_escape(name)}</code>: {S('lazy_failed', self.bot)}")
+                return
+            cmd = self.bot._command_handlers.get(cn)
+            if cmd is None or cmd.handler is handler:
+                await safe_edit(event, f"{CE.CROSS} <code>{html_escape(cn)}</code>: {S('not_found', self.bot)}")
+                return
+            await cmd.handler(event)
+        return handler
+
+    async def activate(self, name: str) -> bool:
+        """
+        Выполнить отложенный модуль (настоящий setup() вместо заглушки).
+        Чтение файла и зависимости — в пулах io и pip, на цикле только setup().
+        """
+        entry = self._lazy.get(name)
+        if entry is None:
+            return name in self.modules
+        t = time.perf_counter()
+        with self.bot.perf.span(f"lazy.{name}"):
+            try:
+                artifact = await offload(self.artifacts.load, entry[0])
+                deps_result = await offload(self.resolver.resolve, entry[0].stem, artifact, pool="pip")
+            except Exception as e:
+                log.error(f"Activate {name}: {e}")
+                return False
+            if self._lazy.get(name) is not entry:
+                # пока ждали пулы, модуль активировала параллельная команда или перезагрузка
+                return name in self.modules
+            ok = self._reload_file(entry[0], lazy=False, artifact=artifact, deps_result=deps_result)
+        if ok:
+            log.info(f"⚡ {name}: {S('lazy_activated', self.bot)} ({(time.perf_counter() - t) * 1000:.0f}ms)")
+        return ok
+
+    def _exec_file(self, file: Path, artifact: Optional[ModuleArtifact], deps_result: Optional[Dict[str, Any]]):
+        if artifact is None:
+            artifact = self.artifacts.load(file)
+        if deps_result is None:
+            deps_result = self.resolver.resolve(file.stem, artifact)
+        if deps_result["all"] and not deps_result.get("cached"):
             installed_count = len(deps_result["installed"])
             failed_count = len(deps_result["failed"])
             if installed_count:
@@ -994,11 +1985,168 @@ class ModuleManager:
         py.safe_send = safe_send
         py.safe_send_file = safe_send_file
         py.S = lambda key: S(key, self.bot)
-        spec.loader.exec_module(py)
+        py.identity = self.bot.identity
+        py.http = self.bot.http
+        py.cache = self.bot.cache
+        py.scheduler = self.bot.scheduler
+        py.LiveMessage = LiveMessage
+        py.executors = self.bot.executors
+        py.offload = offload
+        try:
+            exec(artifact.code, py.__dict__)
+        except ImportError:
+            # зависимость пропала — при следующей загрузке проверить заново
+            self.resolver.forget(artifact.sha256)
+            raise
         if hasattr(py, "setup"):
             py.setup(self.bot)
 
-    def install_from_file(self, filename: str, content: bytes) -> Tuple[bool, str]:
+    # ─── инкрементальная перезагрузка ───
+
+    def scan_changes(self, directory: str = MODULES_DIR) -> Dict[str, List[Path]]:
+        """
+        Сравнить папку модулей с состоянием на момент загрузки. Отключённые
+        модули не считаются ни новыми/изменёнными, ни удалёнными: выключение
+        в панели вступает в силу при перезапуске, а не на ближайшем опросе.
+        """
+        disabled = set(self.bot.config.disabled_modules)
+        current: Dict[str, Tuple[Path, Tuple[int, int]]] = {}
+        for f in self._discover(directory, include_disabled=True):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            current[self._file_key(f)] = (f, (st.st_mtime_ns, st.st_size))
+        active = {k: v for k, v in current.items() if v[0].stem not in disabled}
+        added = [f for k, (f, _) in active.items() if k not in self._file_state]
+        changed = [f for k, (f, sig) in active.items() if k in self._file_state and self._file_state[k] != sig]
+        removed = [Path(k) for k in self._file_state if k not in current]
+        return {"added": added, "changed": changed, "removed": removed}
+
+    def _reload_file(self, file: Path, lazy: Optional[bool] = None, artifact: ModuleArtifact = None,
+                     deps_result: Dict[str, Any] = None) -> bool:
+        """
+        Перезагрузка с атомарной подменой: новая версия регистрируется
+        поверх старой, затем старый экземпляр снимается. Оба шага синхронны,
+        так что цикл не обрабатывает апдейты «между» версиями; при ошибке
+        старая версия остаётся рабочей.
+        """
+        key = self._file_key(file)
+        old = {n: self.modules[n] for n in self._file_modules.get(key, []) if n in self.modules}
+        old_watchers = {n: self.bot.dispatcher.watchers(n) for n in old}
+        old_pages = {n: self._panel_pages(n) for n in old}
+        if lazy is None and any(not self.is_lazy(n) for n in old):
+            lazy = False  # уже активный модуль не превращаем обратно в заглушку
+        try:
+            new = self._load_file(file, artifact=artifact, deps_result=deps_result, lazy=lazy)
+        except Exception as e:
+            log.error(f"Reload {file.name}: {e}")
+            traceback.print_exc()
+            return False
+        for n, mod in old.items():
+            cur = self.modules.get(n)
+            if cur is mod:
+                self._retire(mod, old_watchers[n], pages=old_pages[n])
+                del self.modules[n]
+            else:
+                self._retire(mod, old_watchers[n], keep=cur.commands if cur else None,
+                             pages=old_pages[n])
+        self._file_modules[key] = new
+        return True
+
+    def _drop_file(self, file: Path):
+        key = self._file_key(file)
+        for n in self._file_modules.pop(key, []):
+            if n in self.modules and not self.is_builtin(n):
+                self.unload_module(n)
+        self._file_state.pop(key, None)
+        self.artifacts.drop(file)
+
+    def reload_changed(self, directory: str = MODULES_DIR) -> Dict[str, List[str]]:
+        """Перезагрузить только добавленные/изменённые/удалённые файлы"""
+        ch = self.scan_changes(directory)
+        summary = {"added": [], "changed": [], "removed": [], "failed": []}
+        for f in ch["removed"]:
+            self._drop_file(f)
+            summary["removed"].append(f.stem)
+        for kind in ("added", "changed"):
+            for f in ch[kind]:
+                if self._reload_file(f):
+                    summary[kind].append(f.stem)
+                else:
+                    summary["failed"].append(f.stem)
+        return summary
+
+    async def reload_changed_async(self, directory: str = MODULES_DIR) -> Dict[str, List[str]]:
+        """
+        То же, что reload_changed, но чтение/компиляция и зависимости (pip)
+        идут в пулах io и pip, как при старте; на цикле — только подмена.
+        Вотчер и .reload не перезагружают одно и то же одновременно.
+        """
+        async with self._reload_guard():
+            return await self._reload_changed_async(directory)
+
+    def _reload_guard(self) -> asyncio.Lock:
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        return self._reload_lock
+
+    async def _reload_changed_async(self, directory: str) -> Dict[str, List[str]]:
+        ch = self.scan_changes(directory)
+        summary = {"added": [], "changed": [], "removed": [], "failed": []}
+        for f in ch["removed"]:
+            self._drop_file(f)
+            summary["removed"].append(f.stem)
+        files = ch["added"] + ch["changed"]
+        if not files:
+            return summary
+        arts: Dict[str, ModuleArtifact] = {}
+        results = await asyncio.gather(
+            *(offload(self.artifacts.load, f) for f in files),
+            return_exceptions=True,
+        )
+        for f, res in zip(files, results):
+            if isinstance(res, BaseException):
+                log.error(f"Reload {f.name}: {res}")
+            else:
+                arts[f.stem] = res
+        deps = await offload(self.resolver.resolve_many, arts, pool="pip") if arts else {}
+        for kind in ("added", "changed"):
+            for f in ch[kind]:
+                if f.stem in arts and self._reload_file(f, artifact=arts[f.stem],
+                                                         deps_result=deps.get(f.stem)):
+                    summary[kind].append(f.stem)
+                else:
+                    summary["failed"].append(f.stem)
+        return summary
+
+    def reload_all(self, directory: str = MODULES_DIR):
+        """Полная перезагрузка всех пользовательских модулей"""
+        for n in [x for x in list(self.modules) if not self.is_builtin(x)]:
+            self.unload_module(n)
+        self._file_state.clear()
+        self._file_modules.clear()
+        self.load_from_directory(directory)
+
+    async def reload_all_async(self, directory: str = MODULES_DIR):
+        """reload_all с чтением и зависимостями в пулах io и pip (.reload full)"""
+        async with self._reload_guard():
+            # сначала прогреваем кэши артефактов и зависимостей, пока старые модули
+            # ещё работают, — окно «без модулей» не включает установку пакетов
+            files = self._discover(directory)
+            results = await asyncio.gather(*(offload(self.artifacts.load, f) for f in files),
+                                           return_exceptions=True)
+            arts = {f.stem: r for f, r in zip(files, results) if not isinstance(r, BaseException)}
+            if arts:
+                await offload(self.resolver.resolve_many, arts, pool="pip")
+            for n in [x for x in list(self.modules) if not self.is_builtin(x)]:
+                self.unload_module(n)
+            self._file_state.clear()
+            self._file_modules.clear()
+            await self.load_from_directory_async(directory)
+
+    def install_from_file(self, filename: str, content: bytes,
+                          deps_result: Optional[Dict[str, Any]] = None) -> Tuple[bool, str]:
         if not filename.endswith(".py"):
             return False, S("file_must_be_py", self.bot)
         mod_name = filename[:-3]
@@ -1009,7 +2157,8 @@ class ModuleManager:
         except UnicodeDecodeError:
             return False, S("invalid_utf8", self.bot)
 
-        deps_result = check_and_install_requirements(text_content)
+        if deps_result is None:
+            deps_result = self.resolver.resolve(mod_name, text_content)
         deps_info = ""
         if deps_result["installed"]:
             deps_info += f"\n📥 {S('installed', self.bot)}: {', '.join(deps_result['installed'])}"
@@ -1023,9 +2172,10 @@ class ModuleManager:
         if mod_name in self.modules:
             self.unload_module(mod_name)
         try:
-            self._load_file(fp)
+            self._load_file(fp, deps_result=deps_result, lazy=False)
         except Exception as e:
             fp.unlink(missing_ok=True)
+            self.artifacts.drop(fp)
             return False, f"{S('error', self.bot)}: {e}{deps_info}"
         installed = self.bot.config.get("installed_modules", {})
         installed[mod_name] = {
@@ -1041,6 +2191,18 @@ class ModuleManager:
 
         return True, mod_name + deps_info
 
+    async def install_from_file_async(self, filename: str, content: bytes,
+                                      deps_result: Optional[Dict[str, Any]] = None) -> Tuple[bool, str]:
+        """install_from_file, но установка зависимостей идёт в пуле pip — цикл не стоит"""
+        if deps_result is None and filename.endswith(".py") and filename[:-3] not in self._builtin_names:
+            try:
+                text_content = content.decode("utf-8")
+            except UnicodeDecodeError:
+                text_content = None
+            if text_content is not None:
+                deps_result = await offload(self.resolver.resolve, filename[:-3], text_content, pool="pip")
+        return self.install_from_file(filename, content, deps_result=deps_result)
+
     async def install_from_url(self, url: str) -> Tuple[bool, str]:
         if not HAS_AIOHTTP:
             return False, "pip install aiohttp"
@@ -1049,27 +2211,20 @@ class ModuleManager:
         if not fn.endswith(".py"):
             fn += ".py"
         try:
-            async with aiohttp.ClientSession() as s:
-                async with s.get(raw_url, timeout=aiohttp.ClientTimeout(total=30)) as r:
-                    if r.status != 200:
-                        return False, f"HTTP {r.status}"
-                    content = await r.read()
-                    if len(content) > 5 * 1024 * 1024:
-                        return False, ">5MB"
-                    txt = content.decode("utf-8", errors="replace")
-                    if txt.strip().startswith(("<!DOCTYPE", "<html")):
-                        return False, "HTML instead of Python"
+            async with self.bot.http.get(raw_url) as r:
+                if r.status != 200:
+                    return False, f"HTTP {r.status}"
+                content = await r.read()
+                if len(content) > 5 * 1024 * 1024:
+                    return False, ">5MB"
+                txt = content.decode("utf-8", errors="replace")
+                if txt.strip().startswith(("<!DOCTYPE", "<html")):
+                    return False, "HTML instead of Python"
         except Exception as e:
             return False, str(e)
 
-        deps_result = await async_check_and_install_requirements(txt)
-        deps_info = ""
-        if deps_result["installed"]:
-            deps_info += f"\n📥 {S('installed', self.bot)}: {', '.join(deps_result['installed'])}"
-        if deps_result["failed"]:
-            deps_info += f"\n⚠️ {S('error', self.bot)}: {', '.join(deps_result['failed'])}"
-
-        ok, res = self.install_from_file(fn, content)
+        deps_result = (await offload(self.resolver.resolve_many, {fn[:-3]: txt}, pool="pip"))[fn[:-3]]
+        ok, res = await self.install_from_file_async(fn, content, deps_result=deps_result)
         if ok:
             inst = self.bot.config.get("installed_modules", {})
             mn = fn[:-3]
@@ -1080,35 +2235,1923 @@ class ModuleManager:
                 self.bot.config.set("installed_modules", inst)
         return ok, res
 
-    def uninstall_module(self, name: str) -> Tuple[bool, str]:
-        if self.is_builtin(name):
-            return False, S("builtin_module", self.bot)
-        self.unload_module(name)
-        deleted = False
-        p = Path(MODULES_DIR)
-        fp = p / f"{name}.py"
-        if fp.exists():
-            fp.unlink()
-            deleted = True
-        inst = self.bot.config.get("installed_modules", {})
-        if name in inst:
-            if not deleted:
-                fn = inst[name].get("filename", "")
-                fp2 = p / fn
-                if fp2.exists():
-                    fp2.unlink()
-                    deleted = True
-            del inst[name]
-            self.bot.config.set("installed_modules", inst)
-        return True, f"{name} {S('removed', self.bot)}"
+    def uninstall_module(self, name: str) -> Tuple[bool, str]:
+        if self.is_builtin(name):
+            return False, S("builtin_module", self.bot)
+        self.unload_module(name)
+        deleted = False
+        p = Path(MODULES_DIR)
+        fp = p / f"{name}.py"
+        if fp.exists():
+            fp.unlink()
+            deleted = True
+        self.artifacts.drop(fp)
+        inst = self.bot.config.get("installed_modules", {})
+        if name in inst:
+            if not deleted:
+                fn = inst[name].get("filename", "")
+                fp2 = p / fn
+                if fp2.exists():
+                    fp2.unlink()
+                    deleted = True
+            del inst[name]
+            self.bot.config.set("installed_modules", inst)
+        return True, f"{name} {S('removed', self.bot)}"
+
+class ModuleDirWatcher:
+    """
+    Следит за MODULES_DIR (inotify при наличии inotify_simple, иначе опрос
+    mtime/размера) и перезагружает только изменившиеся модули.
+    """
+    def __init__(self, manager: "ModuleManager", directory: str = MODULES_DIR,
+                 interval: float = MODULE_POLL_INTERVAL):
+        self.manager = manager
+        self.directory = directory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopped = False
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self):
+        self._stopped = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _apply(self):
+        summary = await self.manager.reload_changed_async(self.directory)
+        parts = [f"{sign}{', '.join(summary[key])}"
+                 for sign, key in (("+", "added"), ("~", "changed"), ("-", "removed"), ("✗", "failed"))
+                 if summary[key]]
+        if parts:
+            log.info(f"🔄 hot-reload: {' '.join(parts)}")
+
+    async def _run(self):
+        if HAS_INOTIFY:
+            try:
+                await self._run_inotify()
+                return
+            except Exception as e:
+                log.warning(f"inotify: {e} — polling")
+        await self._run_poll()
+
+    async def _run_poll(self):
+        while not self._stopped:
+            await asyncio.sleep(self.interval)
+            if any(self.manager.scan_changes(self.directory).values()):
+                await asyncio.sleep(MODULE_RELOAD_DEBOUNCE)
+                await self._apply()
+
+    async def _run_inotify(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        ino = INotify()
+        mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                | inotify_flags.DELETE | inotify_flags.CREATE)
+        ino.add_watch(self.directory, mask)
+        try:
+            while not self._stopped:
+                evs = await offload(ino.read, 1000, pool="io")
+                if any(e.name.endswith(".py") for e in evs):
+                    await asyncio.sleep(MODULE_RELOAD_DEBOUNCE)
+                    await self._apply()
+        finally:
+            ino.close()
+
+# ──────────────────────── Метрики производительности ─────────
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек фиксированного размера в стиле HDR:
+    значения в микросекундах, лог-линейные бакеты (8 на степень двойки,
+    относительная ошибка ≤ 12.5%), диапазон до ~2^40 мкс.
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    SUB_BITS = 3
+    MAX_US = (1 << 40) - 1
+    SIZE = ((40 - SUB_BITS) << SUB_BITS) + (2 << SUB_BITS)
+
+    def __init__(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def _index(cls, us: int) -> int:
+        e = max(0, us.bit_length() - cls.SUB_BITS - 1)
+        return (e << cls.SUB_BITS) + (us >> e)
+
+    @classmethod
+    def _bucket_mid(cls, idx: int) -> float:
+        e = max(0, (idx >> cls.SUB_BITS) - 1)
+        m = idx - (e << cls.SUB_BITS)
+        return ((m << e) + ((m + 1) << e)) / 2
+
+    def add(self, seconds: float):
+        us = min(self.MAX_US, max(0, int(seconds * 1_000_000)))
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Перцентиль в миллисекундах"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(q * self.count + 0.999999))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            if seen >= target:
+                return min(self._bucket_mid(idx) / 1000, self.max * 1000)
+        return self.max * 1000
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total / self.count * 1000 if self.count else 0.0
+
+class PerfMetric:
+    """Счётчики одного обработчика: вызовы, ошибки, полное время, RPC и локальная часть"""
+    __slots__ = ("calls", "errors", "wall", "rpc", "local")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall = LatencyHistogram()
+        self.rpc = LatencyHistogram()
+        self.local = LatencyHistogram()
+
+class PerfSpan:
+    __slots__ = ("rpc", "error")
+
+    def __init__(self):
+        self.rpc = 0.0
+        self.error = False
+
+_PERF_SPAN: contextvars.ContextVar = contextvars.ContextVar("kub_perf_span", default=None)
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+class PerfRegistry:
+    """
+    Реестр метрик команд и вотчеров. Время RPC набирается KUBClient-ом
+    в текущий спан (contextvar), локальная часть — wall минус RPC.
+    """
+    def __init__(self):
+        self.metrics: Dict[str, PerfMetric] = {}
+        # задача → ключ её текущего спана; LoopMonitor читает из своего потока
+        self.active: Dict[asyncio.Task, str] = {}
+        self.since = time.time()
+
+    @contextmanager
+    def span(self, key: str):
+        sp = PerfSpan()
+        token = _PERF_SPAN.set(sp)
+        task = _current_task()
+        prev = self.active.get(task) if task else None
+        if task:
+            self.active[task] = key
+        t = time.perf_counter()
+        try:
+            yield sp
+        except BaseException:
+            sp.error = True
+            raise
+        finally:
+            _PERF_SPAN.reset(token)
+            if task:
+                if prev is None:
+                    self.active.pop(task, None)
+                else:
+                    self.active[task] = prev
+            self.record(key, time.perf_counter() - t, sp.rpc, sp.error)
+
+    def record(self, key: str, wall: float, rpc: float = 0.0, error: bool = False):
+        m = self.metrics.get(key)
+        if m is None:
+            m = self.metrics[key] = PerfMetric()
+        m.calls += 1
+        if error:
+            m.errors += 1
+        m.wall.add(wall)
+        m.rpc.add(min(rpc, wall))
+        # всё, кроме RPC: код обработчика, но и sleep, HTTP, ожидание пулов и локов —
+        # это не процессорное время
+        m.local.add(max(0.0, wall - rpc))
+
+    def top(self, n: int = 15, by: float = 0.95) -> List[Tuple[str, PerfMetric]]:
+        items = sorted(self.metrics.items(), key=lambda kv: kv[1].wall.percentile(by), reverse=True)
+        return items[:n]
+
+    def reset(self):
+        self.metrics.clear()
+        self.since = time.time()
+
+def format_perf_lines(perf: PerfRegistry, n: int = 15, markup: str = "html") -> List[str]:
+    """Строки отчёта: вызовы, ошибки, p50/p95/p99 и медианы RPC и остального (не-RPC) времени, мс"""
+    lines = []
+    for key, m in perf.top(n):
+        name = f"<code>{html_escape(key)}</code>" if markup == "html" else f"`{key}`"
+        err = f" ❗{m.errors}" if m.errors else ""
+        lines.append(
+            f"{name} ×{m.calls}{err}\n"
+            f"   p50 {m.wall.percentile(0.5):.0f} · p95 {m.wall.percentile(0.95):.0f} · "
+            f"p99 {m.wall.percentile(0.99):.0f} ms | rpc {m.rpc.percentile(0.5):.0f} · "
+            f"local {m.local.percentile(0.5):.0f}"
+        )
+    return lines
+
+def _perf_add_rpc(seconds: float):
+    sp = _PERF_SPAN.get()
+    if sp is not None:
+        sp.rpc += seconds
+
+class KUBClient(TelegramClient):
+    """
+    TelegramClient, учитывающий время запросов в текущем perf-спане.
+    Внутри RpcScheduler.run() FloodWait не «просыпается» молча, а
+    поднимается до планировщика, чтобы тот выучил лимит.
+    """
+    async def __call__(self, request, *args, **kwargs):
+        if _RPC_SCHEDULED.get() and not args:
+            kwargs.setdefault("flood_sleep_threshold", 0)
+        if _PERF_SPAN.get() is None:
+            return await super().__call__(request, *args, **kwargs)
+        t = time.perf_counter()
+        try:
+            return await super().__call__(request, *args, **kwargs)
+        finally:
+            _perf_add_rpc(time.perf_counter() - t)
+
+# ──────────────────────── Замер задержки ─────────────────────
+
+class LatencyProbe:
+    """
+    Фоновый MTProto Ping: раз в PING_INTERVAL секунд отправляет PingRequest
+    и хранит скользящее окно RTT по DC. ping/kinfo/status читают сводку
+    из окна и не ждут нового запроса.
+    """
+    def __init__(self, bot, interval: float = PING_INTERVAL, window: int = PING_WINDOW):
+        self.bot = bot
+        self.interval = interval
+        self.window = window
+        self.samples: Dict[int, collections.deque] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _dc(self) -> int:
+        try:
+            return self.bot.client.session.dc_id
+        except Exception:
+            return 0
+
+    async def probe(self) -> Optional[float]:
+        """Один замер RTT в мс (None при ошибке)"""
+        client = self.bot.client
+        if not client or not client.is_connected():
+            return None
+        t = time.perf_counter()
+        try:
+            await client(PingRequest(ping_id=int.from_bytes(os.urandom(8), "big", signed=True)))
+        except Exception as e:
+            log.debug(f"ping probe: {e}")
+            return None
+        rtt = (time.perf_counter() - t) * 1000
+        dc = self._dc()
+        if dc not in self.samples:
+            self.samples[dc] = collections.deque(maxlen=self.window)
+        self.samples[dc].append(rtt)
+        return rtt
+
+    async def _loop(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def summary(self, dc: int = None) -> Optional[Dict[str, float]]:
+        """min/avg/max/jitter/last (мс) по окну; jitter — средняя разница соседних RTT"""
+        win = list(self.samples.get(self._dc() if dc is None else dc, ()))
+        if not win:
+            return None
+        jitter = 0.0
+        if len(win) > 1:
+            jitter = sum(abs(b - a) for a, b in zip(win, win[1:])) / (len(win) - 1)
+        return {
+            "min": min(win), "avg": sum(win) / len(win), "max": max(win),
+            "jitter": jitter, "last": win[-1], "n": len(win),
+        }
+
+    async def ensure(self) -> Optional[Dict[str, float]]:
+        """Сводка; единственный синхронный замер — если окно ещё пустое"""
+        st = self.summary()
+        if st is None:
+            await self.probe()
+            st = self.summary()
+        return st
+
+# ──────────────────────── Монитор event loop ─────────────────
+
+@dataclass
+class LoopStall:
+    at: float
+    lag: float  # сек. — на сколько цикл опоздал с пульсом
+    where: str  # спан (cmd.x / модуль.вотчер) или файл:строка функция
+    module: str
+    stack: List[str]
+
+class LoopOffender:
+    __slots__ = ("count", "total", "max", "module", "stack")
+
+    def __init__(self, module: str):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.module = module
+        self.stack: List[str] = []
+
+class LoopMonitor:
+    """
+    Сторож event loop. Корутина-пульс раз в interval засыпает и меряет,
+    насколько позже проснулась, — это лаг цикла. Поток-сторож следит за
+    последним пульсом: если цикл молчит дольше threshold, снимает стек
+    потока цикла и привязывает его к спану текущей задачи (команда или
+    вотчер модуля). Запись фиксируется, когда цикл оживает и пульс знает
+    итоговую длительность.
+    """
+    def __init__(self, bot, interval: float = LOOP_LAG_INTERVAL,
+                 threshold: float = LOOP_STALL_THRESHOLD):
+        self.bot = bot
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = LatencyHistogram()
+        self.stalls: collections.deque = collections.deque(maxlen=LOOP_STALLS_KEPT)
+        self.offenders: Dict[str, LoopOffender] = {}
+        self.since = time.time()
+        self._beat = 0.0
+        self._pending: Optional[LoopStall] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_tid: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_event_loop()
+        self._loop_tid = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._pulse())
+        threading.Thread(target=self._watch, name="kub-loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _pulse(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t - self.interval)
+            self._beat = time.monotonic()
+            self.lag.add(lag)
+            st, self._pending = self._pending, None
+            # стек мог быть снят на самом выходе из короткой паузы — такие не считаем
+            if st is not None and lag >= self.threshold:
+                st.lag = lag
+                self._commit(st)
+
+    def _watch(self):
+        seen = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            if beat == seen or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            seen = beat
+            try:
+                self._pending = self._capture()
+            except Exception as e:
+                log.debug(f"loop monitor: {e}")
+
+    def _capture(self) -> Optional[LoopStall]:
+        frame = sys._current_frames().get(self._loop_tid)
+        if frame is None:
+            return None
+        try:
+            stack = traceback.extract_stack(frame)
+        finally:
+            del frame
+        task = asyncio.current_task(self._loop)
+        key = self.bot.perf.active.get(task) if task else None
+        module, site = self._locate(stack)
+        return LoopStall(
+            at=time.time(), lag=0.0, where=key or site,
+            module=self._module_of(key) if key else module,
+            stack=traceback.format_list(stack[-LOOP_STACK_DEPTH:]),
+        )
+
+    @staticmethod
+    def _locate(stack: traceback.StackSummary) -> Tuple[str, str]:
+        """Самый глубокий кадр из модулей (или ядра) → (модуль, «файл:строка функция»)"""
+        mods_dir = os.path.abspath(MODULES_DIR) + os.sep
+        core = os.path.abspath(__file__)
+        for fs in reversed(stack):
+            path = os.path.abspath(fs.filename)
+            if path.startswith(mods_dir) or path == core:
+                name = Path(path).stem if path != core else "core"
+                return name, f"{Path(path).name}:{fs.lineno} {fs.name}"
+        fs = stack[-1]
+        return "", f"{Path(fs.filename).name}:{fs.lineno} {fs.name}"
+
+    def _module_of(self, key: str) -> str:
+        kind, _, rest = key.partition(".")
+        if kind == "cmd":
+            cmd = self.bot.resolve_command(rest)
+            return cmd.module if cmd else ""
+        if kind == "lazy":
+            return rest
+        return kind
+
+    def _commit(self, st: LoopStall):
+        self.stalls.append(st)
+        off = self.offenders.get(st.where)
+        if off is None:
+            off = self.offenders[st.where] = LoopOffender(st.module)
+        off.count += 1
+        off.total += st.lag
+        off.max = max(off.max, st.lag)
+        off.stack = st.stack
+        log.warning(f"🐢 event loop: {st.lag * 1000:.0f}ms — {st.where}"
+                    + (f" [{st.module}]" if st.module else "")
+                    + "\n" + "".join(st.stack[-4:]).rstrip())
+
+    def top(self, n: int = 5) -> List[Tuple[str, LoopOffender]]:
+        return sorted(self.offenders.items(), key=lambda kv: kv[1].total, reverse=True)[:n]
+
+    def reset(self):
+        self.lag = LatencyHistogram()
+        self.stalls.clear()
+        self.offenders.clear()
+        self.since = time.time()
+
+def format_loop_lines(mon: LoopMonitor, n: int = 5, markup: str = "html") -> List[str]:
+    """Перцентили лага цикла и главные блокирующие места"""
+    h = mon.lag
+    if not h.count:
+        return []
+    lines = [
+        f"p50 {h.percentile(0.5):.0f} · p95 {h.percentile(0.95):.0f} · "
+        f"p99 {h.percentile(0.99):.0f} · max {h.max * 1000:.0f} ms | ⚠️ {len(mon.stalls)}"
+    ]
+    for where, off in mon.top(n):
+        mod = f" [{off.module}]" if off.module and not where.startswith(off.module) else ""
+        name = f"<code>{html_escape(where)}</code>" if markup == "html" else f"`{where}`"
+        lines.append(f"{name}{mod} ×{off.count} · Σ {off.total * 1000:.0f} · max {off.max * 1000:.0f} ms")
+    return lines
+
+# ──────────────────────── Пулы блокирующей работы ────────────
+
+class BlockingPool:
+    """
+    Именованный ограниченный пул потоков. Очередь ограничена семафором:
+    при переполнении ждёт вызывающая корутина, а не растёт память.
+    Счётчики ожидания/выполнения пишутся из рабочих потоков под локом.
+    """
+    def __init__(self, name: str, workers: int, queue: int = EXECUTOR_QUEUE):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self._executor = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        # живые показатели — reset_stats их не трогает, иначе уйдут в минус
+        self.queued = 0  # ждут свободного потока
+        self.running = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.busy = 0.0  # сек. суммарной работы потоков
+            self.wait = LatencyHistogram()
+            self.run_time = LatencyHistogram()
+            self.since = time.monotonic()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f"kub-{self.name}")
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue)
+        call = functools.partial(fn, *args, **kwargs)
+        submitted = time.perf_counter()
+        job = {"started": False, "dropped": False}
+
+        def work():
+            t = time.perf_counter()
+            with self._lock:
+                job["started"] = True
+                if not job["dropped"]:
+                    self.queued -= 1
+                self.running += 1
+                self.wait.add(t - submitted)
+            try:
+                return call()
+            except BaseException:
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                dt = time.perf_counter() - t
+                with self._lock:
+                    self.running -= 1
+                    self.busy += dt
+                    self.run_time.add(dt)
+
+        async with self._slots:
+            with self._lock:
+                self.calls += 1
+                self.queued += 1
+            # контекст (perf-спан, приоритет RPC) уходит в поток вместе с задачей
+            ctx = contextvars.copy_context()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, ctx.run, work)
+            except asyncio.CancelledError:
+                # вызывающего отменили до того, как задачу взял поток — снять её из очереди
+                with self._lock:
+                    if not job["started"]:
+                        job["dropped"] = True
+                        self.queued -= 1
+                raise
+
+    def utilisation(self) -> float:
+        elapsed = max(1e-6, time.monotonic() - self.since)
+        return min(1.0, self.busy / (elapsed * self.workers))
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+class Executors:
+    """
+    Реестр пулов io / cpu / sdk / pip. Модули получают offload():
+    await offload(fn, *args, pool="sdk", **kwargs). Пулы потоковые: код
+    модулей исполняется из файлов и в дочерний процесс не передаётся, а
+    тяжёлые библиотеки (PIL, zlib, hashlib) отпускают GIL на время работы.
+    """
+    def __init__(self, sizes: Dict[str, int] = None):
+        self.pools: Dict[str, BlockingPool] = {
+            name: BlockingPool(name, n) for name, n in (sizes or EXECUTOR_POOLS).items()
+        }
+
+    def pool(self, name: str) -> BlockingPool:
+        try:
+            return self.pools[name]
+        except KeyError:
+            raise ValueError(f"unknown executor pool: {name} ({', '.join(self.pools)})") from None
+
+    async def run(self, pool: str, fn: Callable, *args, **kwargs):
+        return await self.pool(pool).run(fn, *args, **kwargs)
+
+    def reset_stats(self):
+        for p in self.pools.values():
+            p.reset_stats()
+
+    def shutdown(self, wait: bool = False):
+        for p in self.pools.values():
+            p.shutdown(wait)
+
+_EXECUTORS = Executors()
+atexit.register(_EXECUTORS.shutdown)
+
+async def offload(fn: Callable, *args, pool: str = "io", **kwargs):
+    """Выполнить блокирующую функцию в именованном пуле, не останавливая цикл"""
+    return await _EXECUTORS.run(pool, fn, *args, **kwargs)
+
+def format_executor_lines(ex: Executors, markup: str = "html") -> List[str]:
+    """Строки отчёта пулов: вызовы, очередь, занятость, p95 ожидания/работы (мс)"""
+    lines = []
+    for name, p in ex.pools.items():
+        if not p.calls:
+            continue
+        label = f"<code>{name}</code>" if markup == "html" else f"`{name}`"
+        err = f" ❗{p.errors}" if p.errors else ""
+        lines.append(
+            f"{label} ×{p.calls}{err} · {p.running}/{p.workers} busy · ⏳{p.queued} · "
+            f"{p.utilisation() * 100:.0f}% | wait p95 {p.wait.percentile(0.95):.0f} · "
+            f"run p95 {p.run_time.percentile(0.95):.0f} ms"
+        )
+    return lines
+
+# ──────────────────────── Кэш идентичности ───────────────────
+
+# Апдейты, после которых кэш собственного профиля сбрасывается
+_IDENTITY_UPDATES = tuple(
+    t for t in (
+        getattr(tl_types, "UpdateUser", None),
+        getattr(tl_types, "UpdateUserName", None),
+        getattr(tl_types, "UpdateUserPhoto", None),
+        getattr(tl_types, "UpdateUserEmojiStatus", None),
+    ) if t
+)
+
+class Identity:
+    """
+    Кэш get_me() для аккаунта и inline-бота. Обновляется по UpdateUser*
+    для своего id или по истечении TTL — горячие пути (вотчеры, kinfo,
+    inline-панель) не делают лишних запросов.
+    """
+    def __init__(self, bot, ttl: float = IDENTITY_TTL):
+        self.bot = bot
+        self.ttl = ttl
+        self._me = None
+        self._me_at = 0.0
+        self._inline = None
+        self._inline_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.hits = 0
+        self.misses = 0
+        self.entities = EntityCache()
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def user(self):
+        """Последний известный профиль без запроса (может быть None)"""
+        return self._me
+
+    @property
+    def id(self) -> int:
+        if self._me is not None:
+            return self._me.id
+        return int(self.bot.config.get("owner_id", 0) or 0)
+
+    async def me(self, force: bool = False):
+        if not force and self._me is not None and time.time() - self._me_at < self.ttl:
+            self.hits += 1
+            return self._me
+        async with self._get_lock():
+            if not force and self._me is not None and time.time() - self._me_at < self.ttl:
+                self.hits += 1
+                return self._me
+            self.misses += 1
+            me = await self.bot.client.get_me()
+            if me is not None:
+                self._me, self._me_at = me, time.time()
+            return me
+
+    async def inline_me(self, force: bool = False):
+        ib = self.bot.inline_panel.inline_bot
+        if ib is None:
+            return None
+        if not force and self._inline is not None and time.time() - self._inline_at < self.ttl:
+            self.hits += 1
+            return self._inline
+        self.misses += 1
+        me = await ib.get_me()
+        if me is not None:
+            self._inline, self._inline_at = me, time.time()
+        return me
+
+    def invalidate(self, inline: bool = False):
+        self._me_at = 0.0
+        if inline:
+            self._inline = None
+            self._inline_at = 0.0
+
+    async def _on_update(self, event):
+        uid = getattr(event, "user_id", None)
+        if uid == self.id:
+            self.invalidate()
+        elif uid is not None:
+            self.entities.drop(uid)
+
+class EntityCache:
+    """
+    LRU пользователей и чатов по peer id. Сообщения из истории/поиска уже
+    несут своих отправителей — их запоминаем, а недостающих разрешаем
+    одним get_entity([...]) на пачку вместо get_sender() на каждое.
+    """
+    def __init__(self, max_entries: int = ENTITY_CACHE_ENTRIES, ttl: float = ENTITY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items: "collections.OrderedDict[int, Tuple[Any, float]]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, peer_id: int):
+        item = self._items.get(peer_id)
+        if item is None or time.time() - item[1] > self.ttl:
+            return None
+        self._items.move_to_end(peer_id)
+        return item[0]
+
+    def remember(self, entity):
+        # min-сущности неполные (без access_hash) — не кэшируем
+        if entity is None or getattr(entity, "min", False):
+            return
+        try:
+            pid = telethon_utils.get_peer_id(entity)
+        except Exception:
+            return
+        self._items[pid] = (entity, time.time())
+        self._items.move_to_end(pid)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def drop(self, peer_id: int):
+        self._items.pop(peer_id, None)
+
+    async def resolve(self, client, peer_ids) -> Dict[int, Any]:
+        """peer id → сущность; промахи одним пакетным запросом"""
+        found: Dict[int, Any] = {}
+        missing = []
+        for pid in dict.fromkeys(i for i in peer_ids if i is not None):
+            ent = self.get(pid)
+            if ent is not None:
+                self.hits += 1
+                found[pid] = ent
+            else:
+                missing.append(pid)
+        if missing:
+            self.misses += len(missing)
+            try:
+                ents = await client.get_entity(missing)
+            except Exception as e:
+                log.debug(f"entity batch {len(missing)}: {e}")
+                ents = []
+            for pid, ent in zip(missing, ents):
+                self.remember(ent)
+                found[pid] = ent
+        return found
+
+    async def senders(self, client, messages) -> Dict[int, Any]:
+        """Отправители сообщений: из самих сообщений, кэша и одного батча"""
+        for m in messages:
+            self.remember(getattr(m, "sender", None))
+        return await self.resolve(client, [m.sender_id for m in messages])
+
+# ──────────────────────── HTTP-клиент ────────────────────────
+
+class HttpCircuitOpen(aiohttp.ClientConnectionError):
+    """Хост временно отключён предохранителем после серии ошибок"""
+
+class HostStats:
+    __slots__ = ("requests", "errors", "retries", "rejected", "latency",
+                 "failures", "opened_until", "probing")
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probing = False
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency = LatencyHistogram()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_until > time.monotonic()
+
+class HttpClient:
+    """
+    Общий HTTP-клиент ядра и модулей: одна aiohttp-сессия на весь процесс
+    (пул keep-alive соединений, DNS-кэш, лимит соединений на хост),
+    повторы идемпотентных запросов с экспоненциальной задержкой и
+    джиттером, предохранитель на хост и метрики по хостам.
+
+        async with bot.http.get(url, params=...) as r:
+            data = await r.json()
+    """
+    RETRY_STATUSES = {429, 502, 503, 504}
+    IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self.hosts: Dict[str, HostStats] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_PER_HOST_LIMIT,
+                    ttl_dns_cache=HTTP_DNS_TTL, keepalive_timeout=HTTP_KEEPALIVE,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def _stats(self, host: str) -> HostStats:
+        st = self.hosts.get(host)
+        if st is None:
+            st = self.hosts[host] = HostStats()
+        return st
+
+    def _failure(self, host: str, st: HostStats):
+        st.errors += 1
+        st.failures += 1
+        if st.failures >= HTTP_BREAKER_THRESHOLD:
+            if not st.opened_until:
+                log.warning(f"🌐 {host}: {st.failures} errors — paused for {HTTP_BREAKER_COOLDOWN:.0f}s")
+            st.opened_until = time.monotonic() + HTTP_BREAKER_COOLDOWN
+
+    @staticmethod
+    def _observe(st: HostStats, started: float):
+        st.probing = False
+        elapsed = time.perf_counter() - started
+        st.latency.add(elapsed)
+        _perf_add_rpc(elapsed)
+
+    @staticmethod
+    def _success(st: HostStats):
+        st.failures = 0
+        st.opened_until = 0.0
+
+    @staticmethod
+    def _delay(attempt: int, resp=None) -> float:
+        if resp is not None and resp.status == 429:
+            try:
+                return min(10.0, float(resp.headers.get("Retry-After", "")))
+            except ValueError:
+                pass
+        return random.uniform(0, HTTP_BACKOFF * (2 ** attempt))
+
+    @asynccontextmanager
+    async def request(self, method: str, url, *, retries: Optional[int] = None, **kwargs):
+        """
+        Как session.request(): отдаёт aiohttp.ClientResponse. Повторяются
+        только сетевые ошибки и 429/502/503/504 до получения ответа;
+        неидемпотентные методы по умолчанию не повторяются.
+        """
+        method = method.upper()
+        if retries is None:
+            retries = self.retries if method in self.IDEMPOTENT else 0
+        host = urlsplit(str(url)).hostname or "?"
+        st = self._stats(host)
+        resp = None
+        for attempt in range(retries + 1):
+            if st.opened_until:
+                # открыт — отказ; остыл — пропускаем один пробный запрос
+                if st.is_open or st.probing:
+                    st.rejected += 1
+                    raise HttpCircuitOpen(f"{host}: circuit open")
+                st.probing = True
+            st.requests += 1
+            t = time.perf_counter()
+            try:
+                resp = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self._observe(st, t)
+                self._failure(host, st)
+                if attempt >= retries or st.is_open:
+                    raise
+                st.retries += 1
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            except BaseException:
+                st.probing = False
+                raise
+            self._observe(st, t)
+            if resp.status >= 500:
+                self._failure(host, st)
+            else:
+                self._success(st)
+            if resp.status in self.RETRY_STATUSES and attempt < retries and not st.is_open:
+                st.retries += 1
+                delay = self._delay(attempt, resp)
+                resp.release()
+                await asyncio.sleep(delay)
+                continue
+            break
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def reset_stats(self):
+        for st in self.hosts.values():
+            st.reset()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+def format_http_lines(http: HttpClient, n: int = 8, markup: str = "html") -> List[str]:
+    """Строки отчёта по хостам: запросы, ошибки, повторы, p50/p95 (мс)"""
+    lines = []
+    top = sorted(http.hosts.items(), key=lambda kv: kv[1].requests, reverse=True)[:n]
+    for host, st in top:
+        if not st.requests and not st.rejected:
+            continue
+        name = f"<code>{html_escape(host)}</code>" if markup == "html" else f"`{host}`"
+        extra = ""
+        if st.errors:
+            extra += f" ❗{st.errors}"
+        if st.retries:
+            extra += f" ↻{st.retries}"
+        if st.rejected or st.is_open:
+            extra += f" ⛔{st.rejected}"
+        lines.append(
+            f"{name} ×{st.requests}{extra}\n"
+            f"   p50 {st.latency.percentile(0.5):.0f} · p95 {st.latency.percentile(0.95):.0f} ms"
+        )
+    return lines
+
+# ──────────────────────── Кэш ответов ───────────────────────
+
+class _CacheEntry:
+    __slots__ = ("value", "expires", "stale_until")
+
+    def __init__(self, value, expires: float, stale_until: float):
+        self.value = value
+        self.expires = expires
+        self.stale_until = stale_until
+
+class ResponseCache:
+    """
+    Кэш ответов внешних API для ядра и модулей: LRU в памяти и опционально
+    диск (JSON), TTL на запись, stale-while-revalidate (просроченное
+    значение отдаётся сразу, обновление идёт в фоне) и singleflight —
+    одинаковые одновременные запросы делают один вызов наружу.
+
+        data = await bot.cache.get_or_fetch(("jikan", q), fetch, ttl=600, stale=3600)
+    """
+    def __init__(self, max_entries: int = RESPONSE_CACHE_ENTRIES, directory: str = RESPONSE_CACHE_DIR):
+        self.max_entries = max_entries
+        self.dir = Path(directory)
+        self._mem: "collections.OrderedDict[str, _CacheEntry]" = collections.OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._disk_writes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(key) -> str:
+        if isinstance(key, str):
+            return key
+        return json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+
+    def _disk_file(self, k: str) -> Path:
+        return self.dir / (hashlib.sha1(k.encode("utf-8")).hexdigest() + ".json")
+
+    def _remember(self, k: str, entry: _CacheEntry):
+        self._mem[k] = entry
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, k: str) -> Optional[_CacheEntry]:
+        entry = self._mem.get(k)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.time():
+            del self._mem[k]
+            return None
+        self._mem.move_to_end(k)
+        return entry
+
+    def _disk_read(self, k: str) -> Optional[_CacheEntry]:
+        try:
+            raw = json.loads(self._disk_file(k).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if raw.get("key") != k or raw.get("stale_until", 0) <= time.time():
+            return None
+        return _CacheEntry(raw.get("value"), raw.get("expires", 0), raw.get("stale_until", 0))
+
+    def _disk_write(self, k: str, entry: _CacheEntry):
+        target = self._disk_file(k)
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "key": k, "expires": entry.expires, "stale_until": entry.stale_until, "value": entry.value,
+            }, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, target)
+        except (OSError, TypeError, ValueError) as e:
+            log.debug(f"response cache: {e}")
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        try:
+            files = sorted(self.dir.glob("*.json"), key=lambda f: f.stat().st_mtime)
+        except OSError:
+            return
+        for f in files[:max(0, len(files) - RESPONSE_CACHE_DISK_MAX)]:
+            try:
+                f.unlink()
+            except OSError:
+                pass
+
+    def get(self, key, default=None):
+        """Свежее или «несвежее» значение из памяти без обращения наружу"""
+        entry = self._lookup(self._key(key))
+        if entry is None:
+            return default
+        self.hits += 1
+        return entry.value
+
+    def set(self, key, value, ttl: float, stale: float = 0.0, disk: bool = False):
+        k = self._key(key)
+        now = time.time()
+        entry = _CacheEntry(value, now + ttl, now + ttl + stale)
+        self._remember(k, entry)
+        if disk:
+            self._disk_write(k, entry)
+
+    async def put(self, key, value, ttl: float, stale: float = 0.0, disk: bool = False):
+        """set() для корутин: запись на диск — в пуле io, а не на цикле"""
+        k = self._key(key)
+        now = time.time()
+        entry = _CacheEntry(value, now + ttl, now + ttl + stale)
+        self._remember(k, entry)
+        if disk:
+            await offload(self._disk_write, k, entry)
+
+    def invalidate(self, key):
+        k = self._key(key)
+        self._mem.pop(k, None)
+        try:
+            self._disk_file(k).unlink()
+        except OSError:
+            pass
+
+    async def get_or_fetch(self, key, fetch: Callable, ttl: float, stale: float = 0.0,
+                           disk: bool = False, cache_none: bool = False):
+        """
+        fetch — корутинная функция без аргументов. None по умолчанию не
+        кэшируется (ответ «не найдено»/ошибка API). disk=True — значение
+        должно сериализоваться в JSON.
+        """
+        k = self._key(key)
+        entry = self._lookup(k)
+        if entry is None and disk:
+            entry = await offload(self._disk_read, k)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(k, entry)
+        if entry is not None:
+            if entry.expires > time.time():
+                self.hits += 1
+                return entry.value
+            self.stale_hits += 1
+            if k not in self._inflight:
+                asyncio.ensure_future(self._revalidate(k, fetch, ttl, stale, disk, cache_none))
+            return entry.value
+        self.misses += 1
+        return await self._fetch(k, fetch, ttl, stale, disk, cache_none)
+
+    async def _fetch(self, k: str, fetch: Callable, ttl: float, stale: float, disk: bool, cache_none: bool):
+        # запрос живёт в отдельной задаче кэша: отмена того, кто его начал,
+        # не отменяет его для остальных ожидающих
+        task = self._inflight.get(k)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._fill(k, fetch, ttl, stale, disk, cache_none))
+            task.add_done_callback(self._fill_done)
+            self._inflight[k] = task
+        return await asyncio.shield(task)
+
+    async def _fill(self, k: str, fetch: Callable, ttl: float, stale: float, disk: bool, cache_none: bool):
+        try:
+            value = await fetch()
+            if value is not None or cache_none:
+                now = time.time()
+                entry = _CacheEntry(value, now + ttl, now + ttl + stale)
+                self._remember(k, entry)
+                if disk:
+                    await offload(self._disk_write, k, entry)
+            return value
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._inflight.pop(k, None)
+
+    @staticmethod
+    def _fill_done(task: asyncio.Task):
+        if not task.cancelled():
+            task.exception()  # ожидающих может не остаться — не логировать как «не полученное»
+
+    async def _revalidate(self, k: str, fetch: Callable, ttl: float, stale: float, disk: bool, cache_none: bool):
+        try:
+            await self._fetch(k, fetch, ttl, stale, disk, cache_none)
+        except Exception as e:
+            log.debug(f"response cache revalidate: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._mem), "hits": self.hits, "stale": self.stale_hits,
+            "disk": self.disk_hits, "misses": self.misses, "coalesced": self.coalesced,
+            "evictions": self.evictions, "errors": self.errors,
+        }
+
+def format_cache_line(cache: ResponseCache) -> Optional[str]:
+    """Сводка кэша ответов: доля попаданий, свежие/несвежие/промахи, склейки"""
+    st = cache.stats()
+    total = st["hits"] + st["stale"] + st["misses"]
+    if not total:
+        return None
+    ratio = (st["hits"] + st["stale"]) / total * 100
+    return (f"{ratio:.0f}% hit · {st['hits']}/{st['stale']}/{st['misses']} fresh/stale/miss · "
+            f"disk {st['disk']} · ⇉{st['coalesced']} · {st['entries']} entries")
+
+# ──────────────────────── Планировщик исходящих RPC ──────────
+
+PRIO_INTERACTIVE = 0  # ответы на команды владельца
+PRIO_BACKGROUND = 10  # массовые/фоновые действия
+
+_RPC_PRIORITY: contextvars.ContextVar = contextvars.ContextVar("kub_rpc_priority", default=PRIO_BACKGROUND)
+_RPC_SCHEDULED: contextvars.ContextVar = contextvars.ContextVar("kub_rpc_scheduled", default=False)
+
+_FLOOD_ERRORS = (FloodWaitError, FloodPremiumWaitError, SlowModeWaitError)
+
+_RPC_SCHEDULER: Optional["RpcScheduler"] = None
+
+class RpcBackpressure(Exception):
+    """Действие отброшено: лимит освободится позже, чем вызывающий готов ждать"""
+
+class TokenBucket:
+    """
+    Ведро токенов с обучением по FloodWait: блокировка на время ожидания и
+    мультипликативное снижение скорости, затем плавный возврат к базовой.
+    """
+    __slots__ = ("base_rate", "rate", "burst", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """Через сколько секунд можно взять токен, не опускаясь ниже reserve"""
+        self._refill(now)
+        need = 1.0 + reserve * self.burst
+        wait = 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1.0
+
+    def penalize(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.rate = max(self.base_rate * 0.1, self.rate * 0.5)
+        self.tokens = 0.0
+
+    def reward(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+class _RpcWaiter:
+    __slots__ = ("priority", "seq", "buckets", "reserve", "fut")
+
+    def __init__(self, priority: int, seq: int, buckets: List[TokenBucket], reserve: float, fut):
+        self.priority = priority
+        self.seq = seq
+        self.buckets = buckets
+        self.reserve = reserve
+        self.fut = fut
+
+class RpcScheduler:
+    """
+    Единая очередь исходящих действий (отправка, правка, удаление, реакции,
+    загрузки): ведро токенов на аккаунт, на вид действия и на чат, ожидание
+    и повтор после FloodWait, приоритет ответов на команды над фоновыми
+    задачами (фоновым недоступен резерв глобального ведра).
+
+        await bot.scheduler.send(chat_id, "text")
+        await bot.scheduler.run(lambda: msg.reply("x"), chat=chat_id, kind="send",
+                                priority=bot.scheduler.BACKGROUND)
+    """
+    INTERACTIVE = PRIO_INTERACTIVE
+    BACKGROUND = PRIO_BACKGROUND
+    Backpressure = RpcBackpressure
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(RPC_GLOBAL_RATE, RPC_GLOBAL_BURST)
+        self._buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        self._waiters: List[_RpcWaiter] = []
+        self._seq = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _bucket(self, kind: str, chat) -> Optional[TokenBucket]:
+        key = (kind, chat)
+        b = self._buckets.get(key)
+        if b is None:
+            limits = RPC_LIMITS.get(kind, RPC_LIMITS["send"])
+            spec = limits[0] if chat is None else limits[1]
+            if spec is None:
+                return None
+            b = self._buckets[key] = TokenBucket(*spec)
+        return b
+
+    def _stat(self, kind: str) -> Dict[str, float]:
+        st = self.stats.get(kind)
+        if st is None:
+            st = self.stats[kind] = {"calls": 0, "queued": 0, "waited": 0.0, "floods": 0,
+                                     "flood_s": 0, "retries": 0, "dropped": 0}
+        return st
+
+    @staticmethod
+    def _ready_in(w: _RpcWaiter, now: float) -> float:
+        d = 0.0
+        for i, b in enumerate(w.buckets):
+            d = max(d, b.delay(now, w.reserve if i == 0 else 0.0))
+        return d
+
+    async def _acquire(self, buckets: List[TokenBucket], priority: int, max_delay: Optional[float]) -> float:
+        reserve = RPC_RESERVE if priority > PRIO_INTERACTIVE else 0.0
+        self._seq += 1
+        loop = asyncio.get_event_loop()
+        w = _RpcWaiter(priority, self._seq, buckets, reserve, loop.create_future())
+        now = time.monotonic()
+        d = self._ready_in(w, now)
+        if max_delay is not None and d > max_delay:
+            raise RpcBackpressure(f"rate limited for {d:.0f}s")
+        if d <= 0 and not self._waiters:
+            for b in buckets:
+                b.take()
+            return 0.0
+        self._waiters.append(w)
+        self._waiters.sort(key=lambda x: (x.priority, x.seq))
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = loop.create_task(self._pump())
+        try:
+            await w.fut
+        except asyncio.CancelledError:
+            if w in self._waiters:
+                self._waiters.remove(w)
+            raise
+        return time.monotonic() - now
+
+    async def _pump(self):
+        while self._waiters:
+            now = time.monotonic()
+            nearest = None
+            for w in list(self._waiters):
+                if w.fut.done():
+                    self._waiters.remove(w)
+                    continue
+                d = self._ready_in(w, now)
+                if d <= 0:
+                    for b in w.buckets:
+                        b.take()
+                    self._waiters.remove(w)
+                    w.fut.set_result(None)
+                    nearest = 0.0
+                    break
+                nearest = d if nearest is None else min(nearest, d)
+            if not nearest:
+                await asyncio.sleep(0)
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=nearest)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, fn: Callable, *, chat=None, kind: str = "send", priority: Optional[int] = None,
+                  retries: int = RPC_FLOOD_RETRIES, max_wait: float = RPC_MAX_FLOOD_WAIT,
+                  max_delay: Optional[float] = None, on_flood: Optional[Callable] = None):
+        """
+        fn — функция без аргументов, возвращающая awaitable (вызывается
+        заново при повторе). chat=None — действие без привязки к чату.
+        max_delay — бросить RpcBackpressure, если ждать очереди дольше;
+        on_flood(seconds) вызывается перед ожиданием FloodWait.
+        """
+        if priority is None:
+            priority = _RPC_PRIORITY.get()
+        st = self._stat(kind)
+        kind_bucket = self._bucket(kind, None)
+        chat_bucket = self._bucket(kind, chat) if chat is not None else None
+        buckets = [b for b in (self.global_bucket, kind_bucket, chat_bucket) if b is not None]
+        token = _RPC_SCHEDULED.set(True)
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    waited = await self._acquire(buckets, priority, max_delay)
+                except RpcBackpressure:
+                    st["dropped"] += 1
+                    raise
+                if waited:
+                    st["queued"] += 1
+                    st["waited"] += waited
+                st["calls"] += 1
+                try:
+                    result = await fn()
+                except _FLOOD_ERRORS as e:
+                    seconds = getattr(e, "seconds", 0) or 1
+                    st["floods"] += 1
+                    st["flood_s"] += seconds
+                    (chat_bucket or kind_bucket).penalize(seconds)
+                    if chat_bucket is not None:
+                        kind_bucket.rate = max(kind_bucket.base_rate * 0.1, kind_bucket.rate * 0.8)
+                    if attempt >= retries or seconds > max_wait:
+                        raise
+                    st["retries"] += 1
+                    log.debug(f"rpc {kind} {chat}: FloodWait {seconds}s, retry {attempt + 1}")
+                    if on_flood:
+                        try:
+                            r = on_flood(seconds)
+                            if asyncio.iscoroutine(r):
+                                await r
+                        except Exception:
+                            pass
+                    continue
+                for b in buckets:
+                    b.reward()
+                return result
+        finally:
+            _RPC_SCHEDULED.reset(token)
+
+    # ─── удобные обёртки ───
+
+    def send(self, chat, text: str, **kwargs):
+        client = kwargs.pop("client", None) or _BOT.client
+        return self.run(lambda: client.send_message(chat, text, **kwargs), chat=chat, kind="send")
+
+    def edit(self, message, text: str, **kwargs):
+        return self.run(lambda: message.edit(text, **kwargs), chat=message.chat_id, kind="edit")
+
+    def delete(self, chat, message_ids, **kwargs):
+        client = kwargs.pop("client", None) or _BOT.client
+        return self.run(lambda: client.delete_messages(chat, message_ids, **kwargs), chat=chat, kind="delete")
+
+    def call(self, request, *, chat=None, kind: str = "send", **kwargs):
+        return self.run(lambda: _BOT.client(request), chat=chat, kind=kind, **kwargs)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+def format_rpc_lines(sched: RpcScheduler, markup: str = "html") -> List[str]:
+    """Строки отчёта планировщика: вызовы, ожидание в очереди, FloodWait"""
+    lines = []
+    for kind, st in sorted(sched.stats.items(), key=lambda kv: kv[1]["calls"], reverse=True):
+        if not st["calls"] and not st["dropped"]:
+            continue
+        name = f"<code>{kind}</code>" if markup == "html" else f"`{kind}`"
+        extra = ""
+        if st["queued"]:
+            extra += f" · ⏳{st['queued']} ({st['waited']:.1f}s)"
+        if st["floods"]:
+            extra += f" · 🌊{st['floods']} ({st['flood_s']}s)"
+        if st["dropped"]:
+            extra += f" · ✗{st['dropped']}"
+        lines.append(f"{name} ×{st['calls']}{extra}")
+    return lines
+
+# ──────────────────────── Живые сообщения ───────────────────
+
+class LiveMessage:
+    """
+    Сообщение с часто меняющимся содержимым (прогресс, анимация, текст в
+    реальном времени). update() только запоминает желаемый текст; правки
+    уходят не чаще interval, промежуточные состояния схлопываются, а
+    одинаковый текст не отправляется. После FloodWait интервал растёт и
+    затем постепенно возвращается. close() всегда доставляет последнее.
+
+        live = LiveMessage(await event.edit("0%"))
+        for i in ...:
+            live.update(f"{i}%")
+        await live.close("✅")
+    """
+    def __init__(self, message, interval: float = LIVE_EDIT_INTERVAL, **edit_kwargs):
+        self.message = message
+        self.base_interval = self.interval = interval
+        self.edit_kwargs = edit_kwargs
+        self.edits = 0
+        self.coalesced = 0
+        self.failures = 0  # временных сбоев подряд
+        self.error: Optional[Exception] = None  # окончательная ошибка — правок больше не будет
+        self._want: Optional[str] = None
+        self._want_kwargs: Dict[str, Any] = {}
+        self._sent: Optional[str] = getattr(message, "raw_text", None)
+        self._last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> bool:
+        return self.error is None and self._want is not None and self._want != self._sent
+
+    def update(self, text: str, **kwargs):
+        """Запомнить новое состояние; правка будет отправлена фоном"""
+        if self.pending:
+            self.coalesced += 1
+        self._want, self._want_kwargs = text, kwargs
+        if self.pending and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self.pending:
+            delay = self._last + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._push()
+
+    def _on_flood(self, seconds: float):
+        self.interval = min(LIVE_EDIT_MAX_INTERVAL, max(self.interval * 2, seconds / 2))
+
+    async def _push(self):
+        text, kwargs = self._want, {**self.edit_kwargs, **self._want_kwargs}
+        fn = lambda: self.message.edit(text, **kwargs)
+        try:
+            if _RPC_SCHEDULER is None:
+                await fn()
+            else:
+                await _RPC_SCHEDULER.run(fn, chat=getattr(self.message, "chat_id", None), kind="edit",
+                                         on_flood=self._on_flood)
+            self.edits += 1
+            self.interval = max(self.base_interval, self.interval * 0.9)
+        except MessageNotModifiedError:
+            pass
+        except (BadRequestError, ForbiddenError, *_FLOOD_ERRORS) as e:
+            # сообщение удалено/недоступно или флуд сверх потолка планировщика
+            self.error = e
+            log.debug(f"live edit: {e}")
+        except Exception as e:
+            # временный сбой: состояние остаётся несохранённым, повтор — с растущей паузой
+            self._last = time.monotonic()
+            self.failures += 1
+            if self.failures >= LIVE_EDIT_RETRIES:
+                self.error = e
+            else:
+                self.interval = min(LIVE_EDIT_MAX_INTERVAL, self.interval * 2)
+            log.debug(f"live edit: {e}")
+            return
+        self.failures = 0
+        self._sent = text
+        self._last = time.monotonic()
+
+    async def flush(self):
+        """Дождаться отправки текущего состояния (с повторами после сбоев)"""
+        if self._task is not None and not self._task.done():
+            await self._task
+        if self.pending:
+            await self._run()
+
+    async def close(self, text: Optional[str] = None, **kwargs):
+        """Финальное состояние доставляется всегда (с учётом интервала)"""
+        if text is not None:
+            self.update(text, **kwargs)
+        await self.flush()
+
+    def cancel(self):
+        """Бросить несохранённые промежуточные правки (например, перед удалением)"""
+        self._want = self._sent
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.flush()
+
+# ──────────────────────── Массовое удаление ──────────────────
+
+_MESSAGE_FILTERS = {
+    "photo": tl_types.InputMessagesFilterPhotos,
+    "video": tl_types.InputMessagesFilterVideo,
+    "media": tl_types.InputMessagesFilterPhotoVideo,
+    "doc": tl_types.InputMessagesFilterDocument,
+    "voice": tl_types.InputMessagesFilterVoice,
+    "round": tl_types.InputMessagesFilterRoundVideo,
+    "gif": tl_types.InputMessagesFilterGif,
+    "music": tl_types.InputMessagesFilterMusic,
+    "url": tl_types.InputMessagesFilterUrl,
+}
+
+@dataclass
+class PurgeSpec:
+    """Что удалять: количество, отправитель, тип медиа, диапазон дат"""
+    limit: Optional[int] = None
+    from_user: Any = None
+    msg_filter: Any = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+def _parse_purge_date(value: str) -> datetime:
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(value, fmt).astimezone()
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+def parse_purge_args(tokens: List[str]) -> PurgeSpec:
+    """Разбор аргументов .purge; ValueError(токен) — на неизвестном фильтре"""
+    spec = PurgeSpec()
+    for tok in tokens:
+        key, _, val = tok.partition(":")
+        key = key.lower()
+        if tok.isdigit():
+            spec.limit = int(tok)
+        elif tok.lower() == "me":
+            spec.from_user = "me"
+        elif tok.startswith("@"):
+            spec.from_user = tok
+        elif key == "from" and val:
+            spec.from_user = int(val) if val.lstrip("-").isdigit() else val
+        elif key == "type" and val.lower() in _MESSAGE_FILTERS:
+            spec.msg_filter = _MESSAGE_FILTERS[val.lower()]
+        elif key == "since" and val:
+            spec.since = _parse_purge_date(val)
+        elif key == "until" and val:
+            spec.until = _parse_purge_date(val)
+        else:
+            raise ValueError(tok)
+    return spec
+
+@dataclass
+class SearchSpec:
+    """Запрос .search: текст, limit/offset и те же фильтры, что у .purge"""
+    query: str = ""
+    limit: int = SEARCH_DEFAULT_LIMIT
+    offset: int = 0
+    from_user: Any = None
+    msg_filter: Any = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+def parse_search_args(text: str) -> SearchSpec:
+    """
+    Токены вида limit:N, offset:N, from:@user|me|id, type:…, since:…,
+    until:… — фильтры, остальное — текст запроса. ValueError(токен) на
+    некорректном значении фильтра.
+    """
+    spec = SearchSpec()
+    words = []
+    for tok in text.split():
+        key, sep, val = tok.partition(":")
+        key = key.lower()
+        if not sep or not val or key not in ("limit", "offset", "from", "type", "since", "until"):
+            words.append(tok)
+            continue
+        try:
+            if key == "limit":
+                spec.limit = max(1, min(SEARCH_MAX_LIMIT, int(val)))
+            elif key == "offset":
+                spec.offset = max(0, int(val))
+            elif key == "from":
+                spec.from_user = int(val) if val.lstrip("-").isdigit() else val
+            elif key == "type":
+                spec.msg_filter = _MESSAGE_FILTERS[val.lower()]
+            elif key == "since":
+                spec.since = _parse_purge_date(val)
+            else:
+                spec.until = _parse_purge_date(val)
+        except (ValueError, KeyError):
+            raise ValueError(tok)
+    spec.query = " ".join(words)
+    return spec
+
+async def iter_search_pages(client, chat, spec: SearchSpec, page: int = SEARCH_PAGE):
+    """
+    Результаты поиска страницами по page сообщений; у каждой страницы
+    отправители уже разрешены пачкой через EntityCache: (messages, senders).
+    """
+    entities = _BOT.identity.entities
+    buf = []
+    async for m in client.iter_messages(
+        chat, search=spec.query or None, limit=spec.limit, add_offset=spec.offset,
+        from_user=spec.from_user, filter=spec.msg_filter, offset_date=spec.until,
+    ):
+        if spec.since and m.date and m.date < spec.since:
+            break
+        buf.append(m)
+        if len(buf) >= page:
+            yield buf, await entities.senders(client, buf)
+            buf = []
+    if buf:
+        yield buf, await entities.senders(client, buf)
+
+async def iter_purge_ids(client, chat, spec: PurgeSpec, min_id: int = 0, max_id: int = 0):
+    """
+    id сообщений под удаление, от новых к старым. Отправитель и тип
+    фильтруются на сервере (messages.search), даты — по offset_date и
+    остановке на первом сообщении старше since.
+    """
+    async for m in client.iter_messages(
+        chat, limit=spec.limit, min_id=min_id, max_id=max_id,
+        from_user=spec.from_user, filter=spec.msg_filter,
+        offset_date=spec.until, wait_time=0,
+    ):
+        if spec.since and m.date and m.date < spec.since:
+            break
+        yield m.id
+
+async def bulk_delete(client, chat, ids, on_progress: Optional[Callable] = None,
+                      workers: int = PURGE_WORKERS) -> int:
+    """
+    Удаляет сообщения пачками по PURGE_CHUNK id: сбор id идёт параллельно
+    с удалением, пачки уходят через планировщик RPC (фоновый приоритет,
+    лимиты чата, FloodWait). on_progress(deleted, seen) вызывается не чаще
+    раза в PURGE_PROGRESS_INTERVAL. Возвращает число удалённых сообщений.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    state = {"deleted": 0, "seen": 0, "reported": time.monotonic()}
+
+    async def report(force: bool = False):
+        if on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - state["reported"] < PURGE_PROGRESS_INTERVAL:
+            return
+        state["reported"] = now
+        try:
+            r = on_progress(state["deleted"], state["seen"])
+            if asyncio.iscoroutine(r):
+                await r
+        except Exception:
+            pass
+
+    async def worker():
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            try:
+                res = await _BOT.scheduler.run(
+                    lambda: client.delete_messages(chat, chunk), chat=chat, kind="delete",
+                    priority=PRIO_BACKGROUND,
+                )
+                affected = sum(getattr(r, "pts_count", 0) or 0 for r in (res or []))
+                state["deleted"] += affected or len(chunk)
+            except Exception as e:
+                log.warning(f"purge {chat}: {e}")
+            await report()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, workers))]
+    try:
+        chunk: List[int] = []
+        async for mid in ids:
+            chunk.append(mid)
+            state["seen"] += 1
+            if len(chunk) >= PURGE_CHUNK:
+                await queue.put(chunk)
+                chunk = []
+        if chunk:
+            await queue.put(chunk)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for tk in tasks:
+            if not tk.done():
+                tk.cancel()
+    await report(force=True)
+    return state["deleted"]
+
+# ──────────────────────── Диспетчер событий ───────────────────
+
+@dataclass(eq=False)
+class Watcher:
+    """
+    Обработчик сообщений модуля с декларативными фильтрами.
+    chats / exclude_chats — множество chat_id или callable, возвращающий
+    chat_id либо множество (для списков, меняющихся во время работы).
+    """
+    handler: Callable
+    module: str = ""
+    name: str = ""
+    incoming: bool = True
+    outgoing: bool = False
+    chats: Any = None
+    exclude_chats: Any = None
+    pattern: Any = None
+    seq: int = 0
+
+    def __post_init__(self):
+        if not self.name:
+            self.name = getattr(self.handler, "__name__", "watcher")
+        if isinstance(self.pattern, str):
+            self.pattern = re.compile(self.pattern)
+
+    @property
+    def key(self) -> str:
+        return f"{self.module}.{self.name}"
+
+def _chat_set(value) -> set:
+    if value is None:
+        return set()
+    if isinstance(value, (int, str)):
+        value = [value]
+    out = set()
+    for c in value:
+        try:
+            out.add(int(c))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+class Dispatcher:
+    """
+    Единая точка входа для NewMessage: апдейт классифицируется один раз
+    (направление, chat_id), команды ищутся по хеш-индексу, а вотчеры модулей
+    выбираются из таблицы маршрутов вместо того, чтобы каждый фильтровал
+    все сообщения сам.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self._watchers: List[Watcher] = []
+        self._routes: Optional[Dict[bool, Tuple[list, Dict[int, list], list]]] = None
+        self._seq = 0
+
+    # ─── регистрация ───
+
+    def add(self, watcher: Watcher) -> Watcher:
+        self._seq += 1
+        watcher.seq = self._seq
+        self._watchers.append(watcher)
+        self._routes = None
+        return watcher
+
+    def remove(self, watcher: Watcher):
+        if watcher in self._watchers:
+            self._watchers.remove(watcher)
+            self._routes = None
+
+    def remove_module(self, module: str):
+        before = len(self._watchers)
+        self._watchers = [w for w in self._watchers if w.module != module]
+        if len(self._watchers) != before:
+            self._routes = None
+
+    def invalidate(self):
+        """Перестроить маршруты (после изменения статичного набора chats)"""
+        self._routes = None
+
+    def watchers(self, module: str = None) -> List[Watcher]:
+        return [w for w in self._watchers if module is None or w.module == module]
+
+    def _build(self):
+        # out -> (все чаты, {chat_id: [...]}, динамические chats)
+        routes = {True: ([], {}, []), False: ([], {}, [])}
+        for w in self._watchers:
+            for out in (True, False):
+                if (out and not w.outgoing) or (not out and not w.incoming):
+                    continue
+                any_chat, by_chat, dynamic = routes[out]
+                if w.chats is None:
+                    any_chat.append(w)
+                elif callable(w.chats):
+                    dynamic.append(w)
+                else:
+                    for cid in _chat_set(w.chats):
+                        by_chat.setdefault(cid, []).append(w)
+        self._routes = routes
+        return routes
+
+    def _match(self, event) -> List[Watcher]:
+        routes = self._routes or self._build()
+        any_chat, by_chat, dynamic = routes[bool(event.out)]
+        if not (any_chat or by_chat or dynamic):
+            return []
+        chat_id = event.chat_id
+        candidates = list(any_chat)
+        if chat_id is not None:
+            candidates.extend(by_chat.get(chat_id, ()))
+        for w in dynamic:
+            try:
+                if chat_id in _chat_set(w.chats()):
+                    candidates.append(w)
+            except Exception as e:
+                log.error(f"{w.key} chats: {e}")
+        if not candidates:
+            return []
+        if len(candidates) > 1:
+            candidates.sort(key=lambda w: w.seq)
+        text = None
+        matched = []
+        for w in candidates:
+            if w.exclude_chats is not None:
+                excl = w.exclude_chats() if callable(w.exclude_chats) else w.exclude_chats
+                if chat_id in excl:
+                    continue
+            if w.pattern is not None:
+                if text is None:
+                    text = event.raw_text or ""
+                if not w.pattern.search(text):
+                    continue
+            matched.append(w)
+        return matched
+
+    # ─── диспетчеризация ───
+
+    async def dispatch(self, event):
+        if event.out:
+            await self.bot._handle_command(event)
+        perf = self.bot.perf
+        for w in self._match(event):
+            with perf.span(w.key) as sp:
+                try:
+                    await w.handler(event)
+                except events.StopPropagation:
+                    break
+                except Exception as e:
+                    sp.error = True
+                    log.error(f"{w.key}: {e}")
+
 # ──────────────────────── Inline-панель ──────────────────────
 
+@dataclass
+class PanelPage:
+    """
+    Страница inline-панели от модуля: кнопка на карточке модуля, callback
+    «x:<key>[:<arg>]». render(arg) → текст или (текст, ряды кнопок);
+    кнопка «назад» к модулю добавляется сама.
+    """
+    module: str
+    key: str
+    label: str
+    render: Callable
+
 class InlinePanel:
     def __init__(self, bot):
         self.bot = bot
         self.inline_bot: Optional[TelegramClient] = None
         self._states: Dict[int, dict] = {}
         self.active = False
+        self._pages: Dict[str, PanelPage] = {}
+        self._kb_cache: Dict[Any, Tuple[Tuple[int, int], list]] = {}
+        self.kb_hits = 0
+        self.kb_misses = 0
+        self._build_routes()
 
     def _s(self, key: str) -> str:
         return S(key, self.bot)
@@ -1123,7 +4166,7 @@ class InlinePanel:
                 "kub_inline_session", self.bot.config.api_id, self.bot.config.api_hash
             )
             await self.inline_bot.start(bot_token=token)
-            me = await self.inline_bot.get_me()
+            me = await self.bot.identity.inline_me(force=True)
             log.info(f"🤖 Inline: @{me.username}")
             self.inline_bot.add_event_handler(self._on_callback, events.CallbackQuery())
             self.inline_bot.add_event_handler(self._on_inline_query, events.InlineQuery())
@@ -1146,6 +4189,7 @@ class InlinePanel:
             except Exception:
                 pass
             self.inline_bot = None
+            self.bot.identity.invalidate(inline=True)
             self.active = False
 
     async def restart(self) -> bool:
@@ -1162,467 +4206,593 @@ class InlinePanel:
 
     async def _on_inline_query(self, event):
         if not await self._is_owner(event.sender_id):
-            await event.answer([event.builder.article(title="⛔", text=self._s("panel_no_access"))])
+            await event.answer([event.builder.article(title="⛔", text=self._s("panel_no_access"))],
+                               cache_time=PANEL_INLINE_DENY_CACHE, private=True)
             return
         up = format_uptime(time.time() - self.bot.start_time)
         mods = len(self.bot.module_manager.modules)
         cmds = len(self.bot._command_handlers)
+        # ответ персональный (private) и живёт недолго: в описании аптайм
         await event.answer([event.builder.article(
             title=f"{BRAND_EMOJI} {BRAND_NAME} — {self._s('panel_title')}",
             description=f"⏱ {up} | 📦 {mods} | 🔧 {cmds}",
             text=f"{BRAND_EMOJI} **{BRAND_NAME}** v{BRAND_VERSION}\n━━━━━━━━━━━━━━━━━━━━━",
             buttons=self._main_buttons(),
-        )])
+        )], cache_time=PANEL_INLINE_CACHE, private=True)
+
+    # ─── Клавиатуры (кэш по версии конфига и реестра модулей) ───
+
+    def _kb(self, key, build: Callable) -> list:
+        ver = (self.bot.config.version, self.bot.module_manager.version)
+        item = self._kb_cache.get(key)
+        if item is not None and item[0] == ver:
+            self.kb_hits += 1
+            return item[1]
+        self.kb_misses += 1
+        if len(self._kb_cache) >= PANEL_KB_CACHE:
+            self._kb_cache.clear()
+        kb = build()
+        self._kb_cache[key] = (ver, kb)
+        return kb
+
+    def _back(self, data: bytes = b"p:main") -> list:
+        return [Button.inline(f"🔙 {self._s('back')}", data)]
+
+    @staticmethod
+    def _page_slice(items: list, page: int) -> Tuple[list, int, int]:
+        pages = max(1, -(-len(items) // PANEL_PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+        return items[page * PANEL_PAGE_SIZE:(page + 1) * PANEL_PAGE_SIZE], page, pages
+
+    @staticmethod
+    def _nav_row(prefix: str, page: int, pages: int) -> list:
+        if pages <= 1:
+            return []
+        row = []
+        if page > 0:
+            row.append(Button.inline("◀️", f"{prefix}:{page - 1}".encode()))
+        row.append(Button.inline(f"{page + 1}/{pages}", f"{prefix}:{page}".encode()))
+        if page < pages - 1:
+            row.append(Button.inline("▶️", f"{prefix}:{page + 1}".encode()))
+        return [row]
 
     def _main_buttons(self):
-        um = len(self.bot.module_manager.get_user_modules())
-        lang = self.bot.config.data.get("language", DEFAULT_LANGUAGE)
-        lang_name = LANG_NAMES.get(lang, lang)
-        return [
-            [Button.inline(self._s("panel_modules"), b"p:modules"), Button.inline(self._s("panel_settings"), b"p:settings")],
-            [Button.inline(self._s("panel_status"), b"p:status"), Button.inline(self._s("panel_stats"), b"p:stats")],
-            [Button.inline(f"{self._s('panel_user_mods')} ({um})", b"p:usermods"), Button.inline(self._s("panel_kinfo"), b"p:kinfo")],
-            [Button.inline(f"{self._s('panel_language')}: {lang_name}", b"p:lang")],
-            [Button.inline(self._s("panel_reload"), b"act:reload")],
-        ]
+        def build():
+            um = len(self.bot.module_manager.get_user_modules())
+            lang = self.bot.config.data.get("language", DEFAULT_LANGUAGE)
+            lang_name = LANG_NAMES.get(lang, lang)
+            return [
+                [Button.inline(self._s("panel_modules"), b"p:modules"), Button.inline(self._s("panel_settings"), b"p:settings")],
+                [Button.inline(self._s("panel_status"), b"p:status"), Button.inline(self._s("panel_stats"), b"p:stats"),
+                 Button.inline(self._s("panel_perf"), b"p:perf")],
+                [Button.inline(f"{self._s('panel_user_mods')} ({um})", b"p:usermods"), Button.inline(self._s("panel_kinfo"), b"p:kinfo")],
+                [Button.inline(f"{self._s('panel_language')}: {lang_name}", b"p:lang")],
+                [Button.inline(self._s("panel_reload"), b"act:reload")],
+            ]
+        return self._kb("main", build)
 
     def _lang_buttons(self):
-        btns = []
-        current = self.bot.config.data.get("language", DEFAULT_LANGUAGE)
-        for code, name in LANG_NAMES.items():
-            marker = " ✅" if code == current else ""
-            btns.append([Button.inline(f"{name}{marker}", f"lang:{code}".encode())])
-        btns.append([Button.inline(f"🔙 {self._s('back')}", b"p:settings")])
-        return btns
-
-    def _modules_buttons(self):
-        btns = []
-        row = []
-        for name in self.bot.module_manager.modules:
-            dis = name in self.bot.config.disabled_modules
-            bi = self.bot.module_manager.is_builtin(name)
-            icon = "🔴" if dis else ("🔵" if bi else "🟢")
-            row.append(Button.inline(f"{icon} {name}", f"m:{name}".encode()))
-            if len(row) == 2:
-                btns.append(row)
-                row = []
-        if row:
-            btns.append(row)
-        btns.append([Button.inline(f"🔙 {self._s('back')}", b"p:main")])
-        return btns
+        def build():
+            btns = []
+            current = self.bot.config.data.get("language", DEFAULT_LANGUAGE)
+            for code, name in LANG_NAMES.items():
+                marker = " ✅" if code == current else ""
+                btns.append([Button.inline(f"{name}{marker}", f"lang:{code}".encode())])
+            btns.append(self._back(b"p:settings"))
+            return btns
+        return self._kb("lang", build)
+
+    def _module_icon(self, name: str, disabled: set) -> str:
+        if name in disabled:
+            return "🔴"
+        return "🔵" if self.bot.module_manager.is_builtin(name) else "🟢"
+
+    def _modules_buttons(self, page: int = 0):
+        def build():
+            dis = set(self.bot.config.disabled_modules)
+            names, cur, pages = self._page_slice(list(self.bot.module_manager.modules), page)
+            btns = []
+            for i in range(0, len(names), 2):
+                btns.append([Button.inline(f"{self._module_icon(n, dis)} {n}", f"m:{n}".encode())
+                             for n in names[i:i + 2]])
+            btns += self._nav_row("pm", cur, pages)
+            btns.append(self._back())
+            return btns
+        return self._kb(("modules", page), build)
 
     def _module_buttons(self, name: str):
-        dis = name in self.bot.config.disabled_modules
-        bi = self.bot.module_manager.is_builtin(name)
-        toggle_text = self._s("panel_enable") if dis else self._s("panel_disable")
-        btns = [[Button.inline(toggle_text, f"tog:{name}".encode())]]
-        mod = self.bot.module_manager.modules.get(name)
-        if mod and mod.settings_schema:
-            btns.append([Button.inline(self._s("panel_mod_settings"), f"ms:{name}".encode())])
-        if not bi:
-            btns.append([Button.inline(self._s("panel_delete"), f"del:{name}".encode())])
-        btns.append([Button.inline(self._s("panel_to_modules"), b"p:modules")])
-        return btns
-
-    def _usermods_buttons(self):
-        um = self.bot.module_manager.get_user_modules()
-        btns = []
-        for name, mod in um.items():
-            btns.append([Button.inline(f"🟢 {name} v{mod.version}", f"m:{name}".encode())])
-        if not btns:
-            btns.append([Button.inline(f"📭 {self._s('empty')}", b"p:usermods")])
-        btns.append([Button.inline(f"🔙 {self._s('back')}", b"p:main")])
-        return btns
+        def build():
+            dis = name in self.bot.config.disabled_modules
+            bi = self.bot.module_manager.is_builtin(name)
+            toggle_text = self._s("panel_enable") if dis else self._s("panel_disable")
+            btns = [[Button.inline(toggle_text, f"tog:{name}".encode())]]
+            mod = self.bot.module_manager.modules.get(name)
+            if mod and mod.settings_schema:
+                btns.append([Button.inline(self._s("panel_mod_settings"), f"ms:{name}".encode())])
+            for pg in self._pages.values():
+                if pg.module == name:
+                    btns.append([Button.inline(pg.label, f"x:{pg.key}".encode())])
+            if not bi:
+                btns.append([Button.inline(self._s("panel_delete"), f"del:{name}".encode())])
+            btns.append([Button.inline(self._s("panel_to_modules"), b"p:modules")])
+            return btns
+        return self._kb(("module", name), build)
+
+    def _usermods_buttons(self, page: int = 0):
+        def build():
+            um = self.bot.module_manager.get_user_modules()
+            items, cur, pages = self._page_slice(list(um.items()), page)
+            btns = [[Button.inline(f"🟢 {name} v{mod.version}", f"m:{name}".encode())] for name, mod in items]
+            if not btns:
+                btns.append([Button.inline(f"📭 {self._s('empty')}", b"p:usermods")])
+            btns += self._nav_row("pu", cur, pages)
+            btns.append(self._back())
+            return btns
+        return self._kb(("usermods", page), build)
 
     def _settings_buttons(self):
-        return [
+        return self._kb("settings", lambda: [
             [Button.inline(f"{self._s('panel_prefix')}: {self.bot.config.prefix}", b"s:prefix")],
             [Button.inline(self._s("panel_alive_msg"), b"s:alive")],
             [Button.inline(self._s("panel_configure_kinfo"), b"p:kinfo")],
             [Button.inline(self._s("panel_language"), b"p:lang")],
-            [Button.inline(f"🔙 {self._s('back')}", b"p:main")],
-        ]
+            self._back(),
+        ])
 
     def _mod_settings_buttons(self, mod_name: str):
-        mod = self.bot.module_manager.modules.get(mod_name)
-        btns = []
-        if mod:
-            custom = self.bot.config.data.get("custom_settings", {})
-            for s in mod.settings_schema:
-                fk = f"{mod_name}.{s['key']}"
-                val = custom.get(fk, s.get("default", "—"))
-                disp = str(val)[:25]
-                stype = s.get("type", "str")
-                if stype == "bool":
-                    if isinstance(val, bool):
-                        bval = val
+        def build():
+            mod = self.bot.module_manager.modules.get(mod_name)
+            btns = []
+            if mod:
+                custom = self.bot.config.data.get("custom_settings", {})
+                for s in mod.settings_schema:
+                    fk = f"{mod_name}.{s['key']}"
+                    val = custom.get(fk, s.get("default", "—"))
+                    disp = str(val)[:25]
+                    stype = s.get("type", "str")
+                    if stype == "bool":
+                        if isinstance(val, bool):
+                            bval = val
+                        else:
+                            bval = str(val).lower() in ("true", "1", "yes", "да", "on")
+                        icon = "✅" if bval else "❌"
+                        btns.append([Button.inline(
+                            f"{icon} {s['label']}",
+                            f"stoggle:{mod_name}:{s['key']}".encode()
+                        )])
                     else:
-                        bval = str(val).lower() in ("true", "1", "yes", "да", "on")
-                    icon = "✅" if bval else "❌"
-                    btns.append([Button.inline(
-                        f"{icon} {s['label']}",
-                        f"stoggle:{mod_name}:{s['key']}".encode()
-                    )])
-                else:
-                    btns.append([Button.inline(
-                        f"✏️ {s['label']}: {disp}",
-                        f"sm:{mod_name}:{s['key']}".encode()
-                    )])
-        btns.append([Button.inline(f"🔙 {self._s('back')}", f"m:{mod_name}".encode())])
-        return btns
+                        btns.append([Button.inline(
+                            f"✏️ {s['label']}: {disp}",
+                            f"sm:{mod_name}:{s['key']}".encode()
+                        )])
+            btns.append(self._back(f"m:{mod_name}".encode()))
+            return btns
+        return self._kb(("modsettings", mod_name), build)
 
     def _kinfo_buttons(self):
-        ki = self.bot.config.data.get("kinfo", {})
-        emoji = ki.get("emoji", BRAND_EMOJI)
-        photo = "✅" if ki.get("photo") else "❌"
-        btns = [
-            [Button.inline(f"😀 Emoji: {emoji}", b"ki:emoji")],
-            [Button.inline(f"🖼 Photo: {photo}", b"ki:photo")],
-            [Button.inline("📝 Template", b"ki:template")],
-            [Button.inline("➕ Add line", b"ki:addline")],
-            [Button.inline("🗑 Clear lines", b"ki:clearlines")],
-        ]
-        toggles = [
-            ("show_ping", "🏓 Ping"), ("show_uptime", "⏱ Uptime"),
-            ("show_modules", "📦 Modules"), ("show_commands", "🔧 Commands"),
-            ("show_prefix", "🔑 Prefix"), ("show_python", "🐍 Python"),
-            ("show_telethon", "📡 Telethon"), ("show_os", "💻 OS"),
-            ("show_owner", "👤 Owner"),
-        ]
-        row = []
-        for key, label in toggles:
-            val = ki.get(key, True)
-            icon = "✅" if val else "❌"
-            row.append(Button.inline(f"{icon} {label}", f"kit:{key}".encode()))
-            if len(row) == 2:
+        def build():
+            ki = self.bot.config.data.get("kinfo", {})
+            emoji = ki.get("emoji", BRAND_EMOJI)
+            photo = "✅" if ki.get("photo") else "❌"
+            btns = [
+                [Button.inline(f"😀 Emoji: {emoji}", b"ki:emoji")],
+                [Button.inline(f"🖼 Photo: {photo}", b"ki:photo")],
+                [Button.inline("📝 Template", b"ki:template")],
+                [Button.inline("➕ Add line", b"ki:addline")],
+                [Button.inline("🗑 Clear lines", b"ki:clearlines")],
+            ]
+            toggles = [
+                ("show_ping", "🏓 Ping"), ("show_uptime", "⏱ Uptime"),
+                ("show_modules", "📦 Modules"), ("show_commands", "🔧 Commands"),
+                ("show_prefix", "🔑 Prefix"), ("show_python", "🐍 Python"),
+                ("show_telethon", "📡 Telethon"), ("show_os", "💻 OS"),
+                ("show_owner", "👤 Owner"),
+            ]
+            row = []
+            for key, label in toggles:
+                val = ki.get(key, True)
+                icon = "✅" if val else "❌"
+                row.append(Button.inline(f"{icon} {label}", f"kit:{key}".encode()))
+                if len(row) == 2:
+                    btns.append(row)
+                    row = []
+            if row:
                 btns.append(row)
-                row = []
-        if row:
-            btns.append(row)
-        btns.append([Button.inline("👁 Preview", b"ki:preview")])
-        btns.append([Button.inline(f"🔙 {self._s('back')}", b"p:main")])
-        return btns
+            btns.append([Button.inline("👁 Preview", b"ki:preview")])
+            btns.append(self._back())
+            return btns
+        return self._kb("kinfo", build)
+
+    # ─── Страницы модулей ───
+
+    def add_page(self, page: "PanelPage"):
+        if len(f"x:{page.key}:".encode()) > PANEL_CALLBACK_MAX:
+            raise ValueError(f"panel page key too long: {page.key}")
+        self._pages[page.key] = page
+        self._kb_cache.clear()
+
+    def pages(self, module: str) -> List[PanelPage]:
+        return [pg for pg in self._pages.values() if pg.module == module]
+
+    def remove_pages(self, pages: List[PanelPage]):
+        # снимаем только те экземпляры, которые не перерегистрированы новой версией модуля
+        for pg in pages:
+            if self._pages.get(pg.key) is pg:
+                del self._pages[pg.key]
+        self._kb_cache.clear()
+
+    # ─── Маршрутизация callback-кнопок ───
+
+    def _build_routes(self):
+        # точные совпадения data → обработчик(event, "")
+        self._routes: Dict[str, Callable] = {
+            "p:main": self._cb_main, "p:lang": self._cb_lang_menu,
+            "p:modules": self._cb_modules, "p:usermods": self._cb_usermods,
+            "p:settings": self._cb_settings, "p:status": self._cb_status,
+            "p:stats": self._cb_stats, "p:perf": self._cb_perf,
+            "p:prefix": self._cb_prefix, "s:prefix": self._cb_prefix,
+            "p:alive": self._cb_alive, "s:alive": self._cb_alive,
+            "p:kinfo": self._cb_kinfo, "ki:emoji": self._cb_ki_emoji,
+            "ki:photo": self._cb_ki_photo, "ki:rmphoto": self._cb_ki_rmphoto,
+            "ki:template": self._cb_ki_template, "ki:resettemplate": self._cb_ki_resettemplate,
+            "ki:addline": self._cb_ki_addline, "ki:clearlines": self._cb_ki_clearlines,
+            "ki:preview": self._cb_ki_preview, "act:reload": self._cb_reload,
+        }
+        # префикс до первого «:» → обработчик(event, остаток)
+        self._prefix_routes: Dict[str, Callable] = {
+            "lang": self._cb_lang_set, "pm": self._cb_modules, "pu": self._cb_usermods,
+            "kit": self._cb_kinfo_toggle, "m": self._cb_module, "tog": self._cb_toggle,
+            "del": self._cb_delete, "ms": self._cb_mod_settings, "sm": self._cb_mod_setting_edit,
+            "stoggle": self._cb_mod_setting_toggle, "x": self._cb_page,
+        }
 
     async def _on_callback(self, event):
         if not await self._is_owner(event.sender_id):
             await event.answer("⛔", alert=True)
             return
         data = event.data.decode()
+        handler = self._routes.get(data)
+        arg = ""
+        if handler is None:
+            prefix, _, arg = data.partition(":")
+            handler = self._prefix_routes.get(prefix)
+        if handler is None:
+            await event.answer()
+            return
         try:
-            if data == "p:main":
-                await event.edit(
-                    f"{BRAND_EMOJI} **{BRAND_NAME}** v{BRAND_VERSION}\n━━━━━━━━━━━━━━━━━━━━━",
-                    buttons=self._main_buttons(),
-                )
+            await handler(event, arg)
+        except Exception as e:
+            log.error(f"CB: {e}")
+            traceback.print_exc()
+            try:
+                await event.answer(str(e)[:150], alert=True)
+            except Exception:
+                pass
 
-            elif data == "p:lang":
-                await event.edit(
-                    self._s("lang_select"),
-                    buttons=self._lang_buttons(),
-                )
+    async def _cb_main(self, event, arg):
+        await event.edit(
+            f"{BRAND_EMOJI} **{BRAND_NAME}** v{BRAND_VERSION}\n━━━━━━━━━━━━━━━━━━━━━",
+            buttons=self._main_buttons(),
+        )
 
-            elif data.startswith("lang:"):
-                new_lang = data[5:]
-                if new_lang in SUPPORTED_LANGUAGES:
-                    self.bot.config.set("language", new_lang)
-                    lang_name = LANG_NAMES.get(new_lang, new_lang)
-                    await event.answer(f"✅ {lang_name}", alert=True)
-                    await event.edit(
-                        f"{BRAND_EMOJI} **{BRAND_NAME}** v{BRAND_VERSION}\n━━━━━━━━━━━━━━━━━━━━━",
-                        buttons=self._main_buttons(),
-                    )
-                else:
-                    await event.answer("❌", alert=True)
-
-            elif data == "p:modules":
-                mods = self.bot.module_manager.modules
-                t = (
-                    f"📋 **{self._s('modules_list')}** ({len(mods)})\n"
-                    f"━━━━━━━━━━━━━━━━━━━━━\n"
-                    f"🔵 {self._s('panel_builtin')} | 🟢 {self._s('panel_user')} | 🔴 {self._s('panel_disabled')}\n\n"
-                )
-                for n, m in mods.items():
-                    d = n in self.bot.config.disabled_modules
-                    b = self.bot.module_manager.is_builtin(n)
-                    i = "🔴" if d else ("🔵" if b else "🟢")
-                    t += f"{i} **{n}** `v{m.version}` — _{m.description}_\n"
-                await event.edit(t, buttons=self._modules_buttons())
-
-            elif data == "p:usermods":
-                um = self.bot.module_manager.get_user_modules()
-                inst = self.bot.config.get("installed_modules", {})
-                p = self.bot.config.prefix
-                t = f"🔌 **{self._s('user_modules')}** ({len(um)})\n━━━━━━━━━━━━━━━━━━━━━\n\n"
-                if um:
-                    for n, m in um.items():
-                        info = inst.get(n, {})
-                        src = {"file": "📎", "url": "🌐"}.get(info.get("source", ""), "❓")
-                        reqs = info.get("requirements", [])
-                        t += f"🟢 **{n}** `v{m.version}` {src}\n"
-                        if reqs:
-                            t += f"   📦 {self._s('panel_dependencies')}: `{', '.join(reqs)}`\n"
-                        if m.settings_schema:
-                            t += f"   ⚙️ {len(m.settings_schema)} {self._s('panel_settings_count')}\n"
-                else:
-                    t += f"📭 {self._s('empty')}\n`{p}im` / `{p}dlm <url>`\n"
-                await event.edit(t, buttons=self._usermods_buttons())
+    async def _cb_lang_menu(self, event, arg):
+        await event.edit(self._s("lang_select"), buttons=self._lang_buttons())
 
-            elif data == "p:settings":
-                await event.edit(
-                    f"⚙️ **{self._s('panel_settings')}**\n━━━━━━━━━━━━━━━━━━━━━",
-                    buttons=self._settings_buttons(),
-                )
+    async def _cb_lang_set(self, event, new_lang):
+        if new_lang in SUPPORTED_LANGUAGES:
+            self.bot.config.set("language", new_lang)
+            lang_name = LANG_NAMES.get(new_lang, new_lang)
+            await event.answer(f"✅ {lang_name}", alert=True)
+            await self._cb_main(event, "")
+        else:
+            await event.answer("❌", alert=True)
 
-            elif data == "p:status":
-                up = format_uptime(time.time() - self.bot.start_time)
-                me = await self.bot.client.get_me()
-                um = len(self.bot.module_manager.get_user_modules())
-                tm = len(self.bot.module_manager.modules)
-                t = (
-                    f"📊 **{self._s('status_word')}**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
-                    f"👤 {me.first_name} `{me.id}`\n⏱ **{up}**\n"
-                    f"📦 {tm} (🔵{tm - um} 🟢{um})\n🔧 {len(self.bot._command_handlers)}\n"
-                    f"🔑 `{self.bot.config.prefix}`\n"
-                    f"🐍 `{platform.python_version()}`\n📡 `{telethon_version.__version__}`\n"
-                    f"💻 {platform.system()} {platform.release()}\n"
-                    f"🤖 {self._s('inline_word')}: {'✅' if self.active else '❌'}"
-                )
-                await event.edit(t, buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:main")]])
-
-            elif data == "p:stats":
-                st = self.bot.config.get("stats", {})
-                t = (
-                    f"📈 **{self._s('panel_stats')}**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
-                    f"🔧 {self._s('panel_commands_used')}: **{st.get('commands_used', 0)}**\n"
-                    f"📦 {self._s('panel_installed_mods')}: **{len(self.bot.config.get('installed_modules', {}))}**\n"
-                )
-                await event.edit(t, buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:main")]])
+    async def _cb_modules(self, event, arg):
+        page = int(arg) if arg.isdigit() else 0
+        mods = self.bot.module_manager.modules
+        dis = set(self.bot.config.disabled_modules)
+        items, page, pages = self._page_slice(list(mods.items()), page)
+        t = (
+            f"📋 **{self._s('modules_list')}** ({len(mods)})\n"
+            f"━━━━━━━━━━━━━━━━━━━━━\n"
+            f"🔵 {self._s('panel_builtin')} | 🟢 {self._s('panel_user')} | 🔴 {self._s('panel_disabled')}\n\n"
+        )
+        for n, m in items:
+            t += f"{self._module_icon(n, dis)} **{n}** `v{m.version}` — _{m.description}_\n"
+        await event.edit(truncate(t), buttons=self._modules_buttons(page))
 
-            elif data == "p:prefix":
-                self._states[event.sender_id] = {"w": "prefix"}
-                await event.edit(
-                    f"🔧 {self._s('panel_current')}: `{self.bot.config.prefix}`\n{self._s('panel_send_new_prefix')}",
-                    buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:settings")]]
-                )
+    async def _cb_usermods(self, event, arg):
+        page = int(arg) if arg.isdigit() else 0
+        um = self.bot.module_manager.get_user_modules()
+        inst = self.bot.config.get("installed_modules", {})
+        p = self.bot.config.prefix
+        items, page, pages = self._page_slice(list(um.items()), page)
+        t = f"🔌 **{self._s('user_modules')}** ({len(um)})\n━━━━━━━━━━━━━━━━━━━━━\n\n"
+        if um:
+            for n, m in items:
+                info = inst.get(n, {})
+                src = {"file": "📎", "url": "🌐"}.get(info.get("source", ""), "❓")
+                reqs = info.get("requirements", [])
+                t += f"🟢 **{n}** `v{m.version}` {src}\n"
+                if reqs:
+                    t += f"   📦 {self._s('panel_dependencies')}: `{', '.join(reqs)}`\n"
+                if m.settings_schema:
+                    t += f"   ⚙️ {len(m.settings_schema)} {self._s('panel_settings_count')}\n"
+        else:
+            t += f"📭 {self._s('empty')}\n`{p}im` / `{p}dlm <url>`\n"
+        await event.edit(truncate(t), buttons=self._usermods_buttons(page))
 
-            elif data == "p:alive":
-                self._states[event.sender_id] = {"w": "alive"}
-                await event.edit(self._s("panel_send_alive"),
-                                 buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:settings")]])
-
-            elif data == "p:kinfo":
-                ki = self.bot.config.data.get("kinfo", {})
-                cl = ki.get("custom_lines", [])
-                await event.edit(
-                    f"🎨 **{self._s('panel_kinfo')}**\n━━━━━━━━━━━━━━━━━━━━━\n{self._s('panel_additional_lines')}: {len(cl)}",
-                    buttons=self._kinfo_buttons(),
-                )
-            elif data == "ki:emoji":
-                self._states[event.sender_id] = {"w": "kinfo_emoji"}
-                await event.edit(f"😀 {self._s('panel_send_emoji')}", buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:kinfo")]])
-            elif data == "ki:photo":
-                self._states[event.sender_id] = {"w": "kinfo_photo"}
-                ki = self.bot.config.data.get("kinfo", {})
-                cur = ki.get("photo", "")
-                btns = []
-                if cur:
-                    btns.append([Button.inline("🗑 Remove photo", b"ki:rmphoto")])
-                btns.append([Button.inline(f"🔙 {self._s('back')}", b"p:kinfo")])
-                await event.edit(
-                    f"🖼 **Photo**\n{'✅' if cur else '❌'}\n{self._s('panel_send_photo')}:",
-                    buttons=btns,
-                )
-            elif data == "ki:rmphoto":
-                ki = dict(self.bot.config.data.get("kinfo", {}))
-                ki["photo"] = ""
-                self.bot.config.data["kinfo"] = ki
-                self.bot.config.save()
-                await event.answer(self._s("panel_photo_removed"), alert=True)
-                await event.edit(buttons=self._kinfo_buttons())
-            elif data == "ki:template":
-                self._states[event.sender_id] = {"w": "kinfo_template"}
-                await event.edit(
-                    "📝 **Template** (HTML)\nVariables: {emoji} {brand} {version} {owner} {ping} {uptime}\n"
-                    "{modules} {builtin} {user_mods} {commands} {prefix} {python} {telethon} {os} {custom_lines}",
-                    buttons=[
-                        [Button.inline("🔄 Reset", b"ki:resettemplate")],
-                        [Button.inline(f"🔙 {self._s('back')}", b"p:kinfo")],
-                    ],
-                )
-            elif data == "ki:resettemplate":
-                ki = dict(self.bot.config.data.get("kinfo", {}))
-                ki["template"] = get_default_kinfo_template(self.bot)
-                self.bot.config.data["kinfo"] = ki
-                self.bot.config.save()
-                await event.answer(self._s("panel_template_reset"), alert=True)
-                await event.edit(buttons=self._kinfo_buttons())
-            elif data == "ki:addline":
-                self._states[event.sender_id] = {"w": "kinfo_addline"}
-                await event.edit(f"➕ {self._s('panel_send_line')}",
-                                 buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:kinfo")]])
-            elif data == "ki:clearlines":
-                ki = dict(self.bot.config.data.get("kinfo", {}))
-                ki["custom_lines"] = []
-                self.bot.config.data["kinfo"] = ki
-                self.bot.config.save()
-                await event.answer(self._s("panel_lines_cleared"), alert=True)
-                await event.edit(buttons=self._kinfo_buttons())
-            elif data == "ki:preview":
-                text = await self.bot.build_kinfo_text()
-                ki = self.bot.config.data.get("kinfo", {})
-                if ki.get("photo"):
-                    await event.answer(self._s("panel_preview_sent"), alert=True)
-                    try:
-                        clean_text = _strip_custom_emoji(text)
-                        await self.inline_bot.send_file(event.sender_id, ki["photo"], caption=clean_text, parse_mode="html")
-                    except Exception:
-                        try:
-                            await self.inline_bot.send_message(event.sender_id, _strip_custom_emoji(text), parse_mode="html")
-                        except Exception:
-                            await self.inline_bot.send_message(event.sender_id, re.sub(r'<[^>]+>', '', text))
-                else:
-                    clean_text = _strip_custom_emoji(text)
-                    await event.edit(clean_text, buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:kinfo")]], parse_mode="html")
-            elif data.startswith("kit:"):
-                key = data[4:]
-                ki = dict(self.bot.config.data.get("kinfo", {}))
-                ki[key] = not ki.get(key, True)
-                self.bot.config.data["kinfo"] = ki
-                self.bot.config.save()
-                await event.edit(buttons=self._kinfo_buttons())
+    async def _cb_settings(self, event, arg):
+        await event.edit(
+            f"⚙️ **{self._s('panel_settings')}**\n━━━━━━━━━━━━━━━━━━━━━",
+            buttons=self._settings_buttons(),
+        )
 
-            elif data.startswith("m:"):
-                name = data[2:]
-                mod = self.bot.module_manager.modules.get(name)
-                if not mod:
-                    await event.answer(self._s("not_found"), alert=True)
-                    return
-                bi = self.bot.module_manager.is_builtin(name)
-                ct = ""
-                for cn, cmd in mod.commands.items():
-                    ct += f"  `{self.bot.config.prefix}{cn}` — {cmd.description}\n"
-                sp = ""
-                if mod.settings_schema:
-                    sp = f"\n⚙️ **{self._s('panel_settings')}:** {len(mod.settings_schema)}\n"
-                    custom = self.bot.config.data.get("custom_settings", {})
-                    for s in mod.settings_schema[:5]:
-                        k = f"{name}.{s['key']}"
-                        v = custom.get(k, s.get("default", "—"))
-                        sp += f"  `{s['key']}` = `{v}`\n"
-                deps_text = ""
-                inst = self.bot.config.get("installed_modules", {})
-                info = inst.get(name, {})
-                reqs = info.get("requirements", []) or mod.requirements
-                if reqs:
-                    deps_text = f"\n📦 **{self._s('panel_dependencies')}:** `{', '.join(reqs)}`\n"
-                bi_label = self._s("builtin") if bi else self._s("user_mod")
-                bi_icon = "🔵" if bi else "🟢"
-                none_text = self._s("panel_none")
-                cmds_label = self._s("panel_commands_word")
-                cmds_display = ct if ct else f"_{none_text}_"
-                t = (
-                    f"📦 **{mod.name}** `v{mod.version}`\n━━━━━━━━━━━━━━━━━━━━━\n"
-                    f"{bi_icon} {bi_label}\n"
-                    f"👤 {mod.author}\n📝 {mod.description}\n{deps_text}{sp}\n"
-                    f"**{cmds_label}:**\n{cmds_display}"
-                )
-                await event.edit(t, buttons=self._module_buttons(name))
+    async def _cb_status(self, event, arg):
+        up = format_uptime(time.time() - self.bot.start_time)
+        me = await self.bot.identity.me()
+        um = len(self.bot.module_manager.get_user_modules())
+        tm = len(self.bot.module_manager.modules)
+        lat = self.bot.latency.summary()
+        ping = (
+            f"🏓 `{lat['avg']:.0f}ms` (min {lat['min']:.0f} · jitter {lat['jitter']:.0f})\n"
+            if lat else ""
+        )
+        t = (
+            f"📊 **{self._s('status_word')}**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
+            f"👤 {me.first_name} `{me.id}`\n⏱ **{up}**\n{ping}"
+            f"📦 {tm} (🔵{tm - um} 🟢{um})\n🔧 {len(self.bot._command_handlers)}\n"
+            f"🔑 `{self.bot.config.prefix}`\n"
+            f"🐍 `{platform.python_version()}`\n📡 `{telethon_version.__version__}`\n"
+            f"💻 {platform.system()} {platform.release()}\n"
+            f"🤖 {self._s('inline_word')}: {'✅' if self.active else '❌'}"
+        )
+        await event.edit(t, buttons=[self._back()])
 
-            elif data.startswith("tog:"):
-                name = data[4:]
-                dis = list(self.bot.config.disabled_modules)
-                if name in dis:
-                    dis.remove(name)
-                else:
-                    dis.append(name)
-                self.bot.config.set("disabled_modules", dis)
-                await event.edit(buttons=self._module_buttons(name))
-
-            elif data.startswith("del:"):
-                name = data[4:]
-                ok, msg = self.bot.module_manager.uninstall_module(name)
-                await event.answer(f"{'✅' if ok else '❌'} {msg}", alert=True)
-                if ok:
-                    await event.edit(f"🗑 {msg}", buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:modules")]])
-
-            elif data.startswith("ms:"):
-                mn = data[3:]
-                mod = self.bot.module_manager.modules.get(mn)
-                t = f"⚙️ **{self._s('fcfg_settings_of')}: {mn}**\n━━━━━━━━━━━━━━━━━━━━━\n"
-                if mod and mod.settings_schema:
-                    t += f"\n{mod.description}\n\n"
-                    custom = self.bot.config.data.get("custom_settings", {})
-                    for s in mod.settings_schema:
-                        k = f"{mn}.{s['key']}"
-                        v = custom.get(k, s.get("default", "—"))
-                        t += f"**{s['label']}**: `{v}`\n"
-                        if "description" in s:
-                            t += f"  _{s['description']}_\n"
-                await event.edit(t, buttons=self._mod_settings_buttons(mn))
-
-            elif data.startswith("sm:"):
-                parts = data[3:].split(":", 1)
-                mn, key = parts
-                self._states[event.sender_id] = {"w": "modsetting", "mn": mn, "key": key}
-                mod = self.bot.module_manager.modules.get(mn)
-                schema = next((s for s in (mod.settings_schema if mod else []) if s["key"] == key), {})
-                desc = schema.get("description", "")
-                stype = schema.get("type", "str")
-                cur = self.bot.config.data.get("custom_settings", {}).get(f"{mn}.{key}", schema.get("default", "—"))
-                await event.edit(
-                    f"✏️ **{schema.get('label', key)}**\n"
-                    f"{self._s('panel_type')}: `{stype}`\n"
-                    f"{self._s('panel_current_value')}: `{cur}`\n"
-                    f"{f'ℹ️ {desc}' if desc else ''}\n\n"
-                    f"{self._s('panel_send_value')}",
-                    buttons=[[Button.inline(f"🔙 {self._s('back')}", f"ms:{mn}".encode())]],
-                )
+    async def _cb_stats(self, event, arg):
+        st = self.bot.config.get("stats", {})
+        t = (
+            f"📈 **{self._s('panel_stats')}**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
+            f"🔧 {self._s('panel_commands_used')}: **{st.get('commands_used', 0)}**\n"
+            f"📦 {self._s('panel_installed_mods')}: **{len(self.bot.config.get('installed_modules', {}))}**\n"
+        )
+        await event.edit(t, buttons=[self._back()])
+
+    async def _cb_perf(self, event, arg):
+        lines = format_perf_lines(self.bot.perf, n=10, markup="md")
+        http_lines = format_http_lines(self.bot.http, n=5, markup="md")
+        cache_line = format_cache_line(self.bot.cache)
+        rpc_lines = format_rpc_lines(self.bot.scheduler, markup="md")
+        render_line = format_render_line(self.bot.renderer)
+        pool_lines = format_executor_lines(self.bot.executors, markup="md")
+        t = (
+            f"⏱ **{self._s('perf_word')}**\n━━━━━━━━━━━━━━━━━━━━━\n\n"
+            + ("\n".join(lines) if lines else self._s("perf_empty"))
+            + ("\n\n🌐 **HTTP**\n" + "\n".join(http_lines) if http_lines else "")
+            + (f"\n\n🗃 **Cache**\n{cache_line}" if cache_line else "")
+            + ("\n\n📤 **RPC**\n" + "\n".join(rpc_lines) if rpc_lines else "")
+            + (f"\n\n🖋 **Render**\n{render_line}" if render_line else "")
+            + ("\n\n🧵 **Pools**\n" + "\n".join(pool_lines) if pool_lines else "")
+        )
+        await event.edit(truncate(t), buttons=[
+            [Button.inline("🔄", b"p:perf"),
+             Button.inline(f"🔙 {self._s('back')}", b"p:main")],
+        ])
+
+    async def _cb_prefix(self, event, arg):
+        self._states[event.sender_id] = {"w": "prefix"}
+        await event.edit(
+            f"🔧 {self._s('panel_current')}: `{self.bot.config.prefix}`\n{self._s('panel_send_new_prefix')}",
+            buttons=[self._back(b"p:settings")]
+        )
 
-            elif data.startswith("stoggle:"):
-                parts = data[8:].split(":", 1)
-                mn, key = parts
-                full_key = f"{mn}.{key}"
-                custom = dict(self.bot.config.data.get("custom_settings", {}))
-                cur_val = custom.get(full_key)
-                if cur_val is None:
-                    mod_obj = self.bot.module_manager.modules.get(mn)
-                    if mod_obj:
-                        for s in mod_obj.settings_schema:
-                            if s["key"] == key:
-                                cur_val = s.get("default", "true")
-                                break
-                if isinstance(cur_val, bool):
-                    cur_bool = cur_val
-                else:
-                    cur_bool = str(cur_val).lower() in ("true", "1", "yes", "да", "on")
-                custom[full_key] = "false" if cur_bool else "true"
-                self.bot.config.data["custom_settings"] = custom
-                self.bot.config.save()
-                await event.edit(buttons=self._mod_settings_buttons(mn))
-
-            elif data == "s:prefix":
-                self._states[event.sender_id] = {"w": "prefix"}
-                await event.edit(f"🔧 {self._s('panel_send_new_prefix')}", buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:settings")]])
-            elif data == "s:alive":
-                self._states[event.sender_id] = {"w": "alive"}
-                await event.edit(self._s("panel_send_alive"), buttons=[[Button.inline(f"🔙 {self._s('back')}", b"p:settings")]])
-
-            elif data == "act:reload":
-                bi = set(self.bot.module_manager._builtin_names)
-                for n in [x for x in self.bot.module_manager.modules if x not in bi]:
-                    self.bot.module_manager.unload_module(n)
-                self.bot.module_manager.load_from_directory()
-                mc = len(self.bot.module_manager.modules)
-                await event.answer(f"✅ {mc} {self._s('reloaded')}", alert=True)
-                await event.edit(f"{self._s('panel_reloaded')} ({mc})", buttons=self._main_buttons())
+    async def _cb_alive(self, event, arg):
+        self._states[event.sender_id] = {"w": "alive"}
+        await event.edit(self._s("panel_send_alive"), buttons=[self._back(b"p:settings")])
 
-        except Exception as e:
-            log.error(f"CB: {e}")
-            traceback.print_exc()
+    async def _cb_kinfo(self, event, arg):
+        ki = self.bot.config.data.get("kinfo", {})
+        cl = ki.get("custom_lines", [])
+        await event.edit(
+            f"🎨 **{self._s('panel_kinfo')}**\n━━━━━━━━━━━━━━━━━━━━━\n{self._s('panel_additional_lines')}: {len(cl)}",
+            buttons=self._kinfo_buttons(),
+        )
+
+    async def _cb_ki_emoji(self, event, arg):
+        self._states[event.sender_id] = {"w": "kinfo_emoji"}
+        await event.edit(f"😀 {self._s('panel_send_emoji')}", buttons=[self._back(b"p:kinfo")])
+
+    async def _cb_ki_photo(self, event, arg):
+        self._states[event.sender_id] = {"w": "kinfo_photo"}
+        ki = self.bot.config.data.get("kinfo", {})
+        cur = ki.get("photo", "")
+        btns = []
+        if cur:
+            btns.append([Button.inline("🗑 Remove photo", b"ki:rmphoto")])
+        btns.append(self._back(b"p:kinfo"))
+        await event.edit(
+            f"🖼 **Photo**\n{'✅' if cur else '❌'}\n{self._s('panel_send_photo')}:",
+            buttons=btns,
+        )
+
+    def _set_kinfo(self, key: str, value):
+        ki = dict(self.bot.config.data.get("kinfo", {}))
+        ki[key] = value
+        self.bot.config.data["kinfo"] = ki
+        self.bot.config.save()
+
+    async def _cb_ki_rmphoto(self, event, arg):
+        self._set_kinfo("photo", "")
+        await event.answer(self._s("panel_photo_removed"), alert=True)
+        await event.edit(buttons=self._kinfo_buttons())
+
+    async def _cb_ki_template(self, event, arg):
+        self._states[event.sender_id] = {"w": "kinfo_template"}
+        await event.edit(
+            "📝 **Template** (HTML)\nVariables: {emoji} {brand} {version} {owner} {ping} {uptime}\n"
+            "{modules} {builtin} {user_mods} {commands} {prefix} {python} {telethon} {os} {custom_lines}",
+            buttons=[
+                [Button.inline("🔄 Reset", b"ki:resettemplate")],
+                self._back(b"p:kinfo"),
+            ],
+        )
+
+    async def _cb_ki_resettemplate(self, event, arg):
+        self._set_kinfo("template", get_default_kinfo_template(self.bot))
+        await event.answer(self._s("panel_template_reset"), alert=True)
+        await event.edit(buttons=self._kinfo_buttons())
+
+    async def _cb_ki_addline(self, event, arg):
+        self._states[event.sender_id] = {"w": "kinfo_addline"}
+        await event.edit(f"➕ {self._s('panel_send_line')}", buttons=[self._back(b"p:kinfo")])
+
+    async def _cb_ki_clearlines(self, event, arg):
+        self._set_kinfo("custom_lines", [])
+        await event.answer(self._s("panel_lines_cleared"), alert=True)
+        await event.edit(buttons=self._kinfo_buttons())
+
+    async def _cb_ki_preview(self, event, arg):
+        text = await self.bot.build_kinfo_text()
+        ki = self.bot.config.data.get("kinfo", {})
+        if ki.get("photo"):
+            await event.answer(self._s("panel_preview_sent"), alert=True)
             try:
-                await event.answer(str(e)[:150], alert=True)
+                clean_text = _strip_custom_emoji(text)
+                await self.inline_bot.send_file(event.sender_id, ki["photo"], caption=clean_text, parse_mode="html")
             except Exception:
-                pass
+                try:
+                    await self.inline_bot.send_message(event.sender_id, _strip_custom_emoji(text), parse_mode="html")
+                except Exception:
+                    await self.inline_bot.send_message(event.sender_id, re.sub(r'<[^>]+>', '', text))
+        else:
+            clean_text = _strip_custom_emoji(text)
+            await event.edit(clean_text, buttons=[self._back(b"p:kinfo")], parse_mode="html")
+
+    async def _cb_kinfo_toggle(self, event, key):
+        ki = self.bot.config.data.get("kinfo", {})
+        self._set_kinfo(key, not ki.get(key, True))
+        await event.edit(buttons=self._kinfo_buttons())
+
+    async def _cb_module(self, event, name):
+        mod = self.bot.module_manager.modules.get(name)
+        if not mod:
+            await event.answer(self._s("not_found"), alert=True)
+            return
+        bi = self.bot.module_manager.is_builtin(name)
+        ct = ""
+        for cn, cmd in mod.commands.items():
+            ct += f"  `{self.bot.config.prefix}{cn}` — {cmd.description}\n"
+        sp = ""
+        if mod.settings_schema:
+            sp = f"\n⚙️ **{self._s('panel_settings')}:** {len(mod.settings_schema)}\n"
+            custom = self.bot.config.data.get("custom_settings", {})
+            for s in mod.settings_schema[:5]:
+                k = f"{name}.{s['key']}"
+                v = custom.get(k, s.get("default", "—"))
+                sp += f"  `{s['key']}` = `{v}`\n"
+        deps_text = ""
+        inst = self.bot.config.get("installed_modules", {})
+        info = inst.get(name, {})
+        reqs = info.get("requirements", []) or mod.requirements
+        if reqs:
+            deps_text = f"\n📦 **{self._s('panel_dependencies')}:** `{', '.join(reqs)}`\n"
+        bi_label = self._s("builtin") if bi else self._s("user_mod")
+        bi_icon = "🔵" if bi else "🟢"
+        none_text = self._s("panel_none")
+        cmds_label = self._s("panel_commands_word")
+        cmds_display = ct if ct else f"_{none_text}_"
+        t = (
+            f"📦 **{mod.name}** `v{mod.version}`\n━━━━━━━━━━━━━━━━━━━━━\n"
+            f"{bi_icon} {bi_label}\n"
+            f"👤 {mod.author}\n📝 {mod.description}\n{deps_text}{sp}\n"
+            f"**{cmds_label}:**\n{cmds_display}"
+        )
+        await event.edit(truncate(t), buttons=self._module_buttons(name))
+
+    async def _cb_toggle(self, event, name):
+        dis = list(self.bot.config.disabled_modules)
+        if name in dis:
+            dis.remove(name)
+        else:
+            dis.append(name)
+        self.bot.config.set("disabled_modules", dis)
+        await event.edit(buttons=self._module_buttons(name))
+
+    async def _cb_delete(self, event, name):
+        ok, msg = self.bot.module_manager.uninstall_module(name)
+        await event.answer(f"{'✅' if ok else '❌'} {msg}", alert=True)
+        if ok:
+            await event.edit(f"🗑 {msg}", buttons=[self._back(b"p:modules")])
+
+    async def _cb_mod_settings(self, event, mn):
+        mod = self.bot.module_manager.modules.get(mn)
+        t = f"⚙️ **{self._s('fcfg_settings_of')}: {mn}**\n━━━━━━━━━━━━━━━━━━━━━\n"
+        if mod and mod.settings_schema:
+            t += f"\n{mod.description}\n\n"
+            custom = self.bot.config.data.get("custom_settings", {})
+            for s in mod.settings_schema:
+                k = f"{mn}.{s['key']}"
+                v = custom.get(k, s.get("default", "—"))
+                t += f"**{s['label']}**: `{v}`\n"
+                if "description" in s:
+                    t += f"  _{s['description']}_\n"
+        await event.edit(truncate(t), buttons=self._mod_settings_buttons(mn))
+
+    async def _cb_mod_setting_edit(self, event, arg):
+        mn, key = arg.split(":", 1)
+        self._states[event.sender_id] = {"w": "modsetting", "mn": mn, "key": key}
+        mod = self.bot.module_manager.modules.get(mn)
+        schema = next((s for s in (mod.settings_schema if mod else []) if s["key"] == key), {})
+        desc = schema.get("description", "")
+        stype = schema.get("type", "str")
+        cur = self.bot.config.data.get("custom_settings", {}).get(f"{mn}.{key}", schema.get("default", "—"))
+        await event.edit(
+            f"✏️ **{schema.get('label', key)}**\n"
+            f"{self._s('panel_type')}: `{stype}`\n"
+            f"{self._s('panel_current_value')}: `{cur}`\n"
+            f"{f'ℹ️ {desc}' if desc else ''}\n\n"
+            f"{self._s('panel_send_value')}",
+            buttons=[self._back(f"ms:{mn}".encode())],
+        )
+
+    async def _cb_mod_setting_toggle(self, event, arg):
+        mn, key = arg.split(":", 1)
+        full_key = f"{mn}.{key}"
+        custom = dict(self.bot.config.data.get("custom_settings", {}))
+        cur_val = custom.get(full_key)
+        if cur_val is None:
+            mod_obj = self.bot.module_manager.modules.get(mn)
+            if mod_obj:
+                for s in mod_obj.settings_schema:
+                    if s["key"] == key:
+                        cur_val = s.get("default", "true")
+                        break
+        if isinstance(cur_val, bool):
+            cur_bool = cur_val
+        else:
+            cur_bool = str(cur_val).lower() in ("true", "1", "yes", "да", "on")
+        custom[full_key] = "false" if cur_bool else "true"
+        self.bot.config.data["custom_settings"] = custom
+        self.bot.config.save()
+        await event.edit(buttons=self._mod_settings_buttons(mn))
+
+    async def _cb_reload(self, event, arg):
+        await self.bot.module_manager.reload_changed_async()
+        mc = len(self.bot.module_manager.modules)
+        await event.answer(f"✅ {mc} {self._s('reloaded')}", alert=True)
+        await event.edit(f"{self._s('panel_reloaded')} ({mc})", buttons=self._main_buttons())
+
+    async def _cb_page(self, event, arg):
+        key, _, sub = arg.partition(":")
+        pg = self._pages.get(key)
+        if pg is None:
+            await event.answer(self._s("not_found"), alert=True)
+            return
+        res = pg.render(sub)
+        if asyncio.iscoroutine(res):
+            res = await res
+        text, buttons = res if isinstance(res, tuple) else (res, None)
+        await event.edit(truncate(text), buttons=list(buttons or []) + [self._back(f"m:{pg.module}".encode())])
 
     async def _on_message(self, event):
         if not await self._is_owner(event.sender_id):
@@ -1631,7 +4801,7 @@ class InlinePanel:
         st = self._states.get(event.sender_id)
         if not st:
             if self.inline_bot:
-                me = await self.inline_bot.get_me()
+                me = await self.bot.identity.inline_me()
                 hint = self._s("panel_inline_type_hint").replace("{bot}", me.username)
                 await event.reply(hint)
             return
@@ -1697,6 +4867,11 @@ class InlinePanel:
 
         elif w == "kinfo_template":
             ki = dict(self.bot.config.data.get("kinfo", {}))
+            err = template_error(txt, self.bot._kinfo_providers(ki))
+            if err:
+                # состояние не сбрасываем — можно сразу прислать исправленный шаблон
+                await event.reply(f"{self._s('panel_template_invalid')}: `{err}`")
+                return
             ki["template"] = txt
             self.bot.config.data["kinfo"] = ki
             self.bot.config.save()
@@ -1726,24 +4901,17 @@ def load_core_module(bot):
     p = bot.config.prefix
 
     async def cmd_alive(event):
-        up = format_uptime(time.time() - bot.start_time)
-        me = await bot.client.get_me()
         t = bot.config.alive_message or get_default_alive_msg(bot)
+        providers = bot._template_vars()
+        providers["emoji"] = BRAND_EMOJI
         try:
-            t = t.format(
-                uptime=up, modules=len(bot.module_manager.modules),
-                commands=len(bot._command_handlers),
-                python=platform.python_version(),
-                owner=await get_user_link(me),
-                emoji=BRAND_EMOJI, brand=BRAND_NAME, version=BRAND_VERSION,
-            )
-        except (KeyError, IndexError):
-            pass
+            t = await render_template(compile_template(t), providers)
+        except (KeyError, IndexError, ValueError) as e:
+            _log_template_fallback("alive", t, f"{type(e).__name__}: {e}; sent as plain text")
         await safe_edit(event, t)
 
     async def cmd_kinfo(event):
-        start = time.time()
-        text = await bot.build_kinfo_text(ping_start=start)
+        text = await bot.build_kinfo_text()
         ki = bot.config.data.get("kinfo", {})
         photo = ki.get("photo", "")
         if photo:
@@ -1856,11 +5024,17 @@ def load_core_module(bot):
         await safe_edit(event, truncate(t))
 
     async def cmd_ping(event):
-        s = time.time()
-        await safe_edit(event, f"{CE.BRAND} ...")
-        e = (time.time() - s) * 1000
+        lat = await bot.latency.ensure()
+        if lat:
+            rtt = (
+                f"<code>{lat['avg']:.1f}ms</code>\n"
+                f"{CE.SIGNAL} min <code>{lat['min']:.1f}</code> · jitter <code>{lat['jitter']:.1f}</code> "
+                f"· n={lat['n']}"
+            )
+        else:
+            rtt = "<code>?</code>"
         await safe_edit(event,
-            f"{CE.PING} <b>{S('pong', bot)}</b> <code>{e:.1f}ms</code>\n{CE.CLOCK} {format_uptime(time.time() - bot.start_time)}"
+            f"{CE.PING} <b>{S('pong', bot)}</b> {rtt}\n{CE.CLOCK} {format_uptime(time.time() - bot.start_time)}"
         )
 
     async def cmd_prefix(event):
@@ -1909,17 +5083,24 @@ def load_core_module(bot):
             tc += cc
             sc = f" {CE.GEAR}{len(m.settings_schema)}" if m.settings_schema else ""
             deps = f" {CE.PACKAGE}{len(m.requirements)}" if m.requirements else ""
-            t += f"{i} <b>{html_escape(n)}</b> <code>v{m.version}</code> [{cc}cmd{sc}{deps}]\n"
+            lz = " 💤" if bot.module_manager.is_lazy(n) else ""
+            t += f"{i} <b>{html_escape(n)}</b> <code>v{m.version}</code> [{cc}cmd{sc}{deps}]{lz}\n"
         t += f"\n{CE.CHART} {tc} {S('commands', bot)}, {len(um)} {S('user_mod', bot)}."
         await safe_edit(event, t)
 
     async def cmd_reload(event):
         await safe_edit(event, f"{CE.RELOAD} ...")
-        bi = set(bot.module_manager._builtin_names)
-        for n in [x for x in list(bot.module_manager.modules) if x not in bi]:
-            bot.module_manager.unload_module(n)
-        bot.module_manager.load_from_directory()
-        await safe_edit(event, f"{CE.CHECK} {len(bot.module_manager.modules)} {S('reloaded', bot)} | {len(bot._command_handlers)} {S('commands', bot)}")
+        args = event.raw_text.split()
+        if len(args) > 1 and args[1].lower() == "full":
+            await bot.module_manager.reload_all_async()
+            await safe_edit(event, f"{CE.CHECK} {len(bot.module_manager.modules)} {S('reloaded', bot)} | {len(bot._command_handlers)} {S('commands', bot)}")
+            return
+        sm = await bot.module_manager.reload_changed_async()
+        t = f"{CE.CHECK} {len(bot.module_manager.modules)} {S('reloaded', bot)} | {len(bot._command_handlers)} {S('commands', bot)}"
+        for kind, mark in (("added", "➕"), ("changed", "✏️"), ("removed", "➖"), ("failed", "❌")):
+            if sm[kind]:
+                t += f"\n{mark} " + ", ".join(f"<code>{html_escape(n)}</code>" for n in sm[kind])
+        await safe_edit(event, t)
 
     async def cmd_eval(event):
         a = event.raw_text.split(maxsplit=1)
@@ -1956,7 +5137,7 @@ def load_core_module(bot):
         if not bot.inline_panel.active:
             await safe_edit(event, f"{CE.WARN} <code>{p}settoken &lt;token&gt;</code>")
             return
-        me = await bot.inline_panel.inline_bot.get_me()
+        me = await bot.identity.inline_me()
         await safe_edit(event, f"{CE.GEAR} <code>@{me.username} </code>")
 
     async def cmd_settoken(event):
@@ -1974,7 +5155,7 @@ def load_core_module(bot):
         await safe_edit(event, f"{CE.RELOAD} ...")
         bot.config.set("bot_token", tok)
         if await bot.inline_panel.restart():
-            me = await bot.inline_panel.inline_bot.get_me()
+            me = await bot.identity.inline_me()
             await safe_edit(event, f"{CE.CHECK} @{me.username}")
         else:
             bot.config.set("bot_token", "")
@@ -1982,7 +5163,7 @@ def load_core_module(bot):
 
     async def cmd_status(event):
         up = format_uptime(time.time() - bot.start_time)
-        me = await bot.client.get_me()
+        me = await bot.identity.me()
         st = bot.config.get("stats", {})
         um = len(bot.module_manager.get_user_modules())
         tm = len(bot.module_manager.modules)
@@ -1996,6 +5177,62 @@ def load_core_module(bot):
             f"{CE.BOT} {S('inline_word', bot)}: {'✅' if bot.inline_panel.active else '❌'}"
         )
 
+    async def cmd_perf(event):
+        args = event.raw_text.split(maxsplit=1)
+        if len(args) > 1 and args[1].strip().lower() == "reset":
+            bot.perf.reset()
+            bot.http.reset_stats()
+            bot.cache.reset_stats()
+            bot.scheduler.stats.clear()
+            bot.renderer.reset_stats()
+            bot.executors.reset_stats()
+            await safe_edit(event, f"{CE.CHECK} {S('perf_reset_done', bot)}")
+            return
+        lines = format_perf_lines(bot.perf)
+        since = datetime.fromtimestamp(bot.perf.since).strftime("%d.%m %H:%M")
+        body = "\n".join(lines) if lines else S("perf_empty", bot)
+        http_lines = format_http_lines(bot.http)
+        if http_lines:
+            body += f"\n\n{CE.GLOBE} <b>HTTP</b>\n" + "\n".join(http_lines)
+        cache_line = format_cache_line(bot.cache)
+        if cache_line:
+            body += f"\n\n{CE.PACKAGE} <b>Cache</b>\n{cache_line}"
+        rpc_lines = format_rpc_lines(bot.scheduler)
+        if rpc_lines:
+            body += f"\n\n{CE.SIGNAL} <b>RPC</b>\n" + "\n".join(rpc_lines)
+        render_line = format_render_line(bot.renderer)
+        if render_line:
+            body += f"\n\n{CE.PAINT} <b>Render</b>\n{render_line}"
+        pool_lines = format_executor_lines(bot.executors)
+        if pool_lines:
+            body += f"\n\n{CE.GEAR} <b>Pools</b>\n" + "\n".join(pool_lines)
+        await safe_edit(event, truncate(
+            f"{CE.CLOCK} <b>{S('perf_word', bot)}</b> ({S('perf_since', bot)} {since})\n"
+            f"━━━━━━━━━━━━━━━━━━━━━\n{body}"
+        ))
+
+    async def cmd_lag(event):
+        mon = bot.loop_monitor
+        args = event.raw_text.split(maxsplit=1)
+        if len(args) > 1 and args[1].strip().lower() == "reset":
+            mon.reset()
+            await safe_edit(event, f"{CE.CHECK} {S('perf_reset_done', bot)}")
+            return
+        lines = format_loop_lines(mon, n=8)
+        since = datetime.fromtimestamp(mon.since).strftime("%d.%m %H:%M")
+        body = "\n".join(lines) if lines else S("perf_empty", bot)
+        if mon.stalls:
+            st = mon.stalls[-1]
+            body += (
+                f"\n\n{CE.WARN} <b>{S('lag_last_stall', bot)}</b>: {st.lag * 1000:.0f}ms — "
+                f"<code>{html_escape(st.where)}</code>\n"
+                f"<pre>{html_escape(''.join(st.stack[-6:]).rstrip())}</pre>"
+            )
+        await safe_edit(event, truncate(
+            f"{CE.CLOCK} <b>{S('lag_word', bot)}</b> ({S('perf_since', bot)} {since})\n"
+            f"━━━━━━━━━━━━━━━━━━━━━\n{body}"
+        ))
+
     async def cmd_im(event):
         if not event.is_reply:
             await safe_edit(event,
@@ -2030,7 +5267,7 @@ def load_core_module(bot):
                     f"{CE.DOWNLOAD} <code>{html_escape(fn)}</code>\n{CE.PACKAGE} {S('install_deps', bot)}: <code>{', '.join(missing)}</code>..."
                 )
 
-        ok, res = bot.module_manager.install_from_file(fn, content)
+        ok, res = await bot.module_manager.install_from_file_async(fn, content)
         if ok:
             mod_name = res.split("\n")[0]
             m = bot.module_manager.modules.get(mod_name)
@@ -2155,8 +5392,9 @@ def load_core_module(bot):
                 return
             pkg = a[2].strip()
             await safe_edit(event, f"{CE.TRASH} {S('pip_removing', bot)} <code>{html_escape(pkg)}</code>...")
-            ok, msg = uninstall_pip_package(pkg)
+            ok, msg = await offload(uninstall_pip_package, pkg, pool="pip")
             if ok:
+                bot.module_manager.resolver.forget_package(pkg)
                 await safe_edit(event, f"{CE.CHECK} <code>{html_escape(pkg)}</code> {S('removed', bot)}")
             else:
                 await safe_edit(event, f"{CE.CROSS} {html_escape(msg)}")
@@ -2446,12 +5684,14 @@ def load_core_module(bot):
         "prefix": Command("prefix", cmd_prefix, S("prefix_word", bot), "core", f"{p}prefix <new>"),
         "lang": Command("lang", cmd_lang, S("lang_cmd_desc", bot), "core", f"{p}lang <ru/en/uk>"),
         "modules": Command("modules", cmd_modules, S("modules_list", bot), "core", f"{p}modules"),
-        "reload": Command("reload", cmd_reload, S("reloading", bot), "core", f"{p}reload"),
+        "reload": Command("reload", cmd_reload, S("reloading", bot), "core", f"{p}reload [full]"),
         "eval": Command("eval", cmd_eval, "Eval", "core", f"{p}eval <code>"),
         "exec": Command("exec", cmd_exec, "Exec", "core", f"{p}exec <code>"),
         "settings": Command("settings", cmd_settings, S("inline_panel", bot), "core", f"{p}settings"),
         "settoken": Command("settoken", cmd_settoken, S("bot_token", bot), "core", f"{p}settoken"),
         "status": Command("status", cmd_status, S("status_word", bot), "core", f"{p}status"),
+        "perf": Command("perf", cmd_perf, S("perf_word", bot), "core", f"{p}perf [reset]"),
+        "lag": Command("lag", cmd_lag, S("lag_word", bot), "core", f"{p}lag [reset]"),
         "im": Command("im", cmd_im, S("install_file", bot), "core", f"{p}im"),
         "um": Command("um", cmd_um, S("uninstall_mod", bot), "core", f"{p}um <name>"),
         "dlm": Command("dlm", cmd_dlm, S("download_url", bot), "core", f"{p}dlm <url>"),
@@ -2516,25 +5756,31 @@ def load_tools_module(bot):
         await safe_edit(event, t)
 
     async def cmd_del(event):
+        ids = [event.id]
         if event.is_reply:
-            try:
-                await (await event.get_reply_message()).delete()
-            except Exception:
-                pass
-        await event.delete()
+            ids.append(event.reply_to_msg_id)
+        try:
+            await bot.client.delete_messages(event.chat_id, ids)
+        except Exception:
+            await event.delete()
 
     async def cmd_purge(event):
-        if not event.is_reply:
-            await safe_edit(event, f"{CE.CROSS} {S('reply_needed', bot)}")
+        try:
+            spec = parse_purge_args(event.raw_text.split()[1:])
+        except ValueError as e:
+            await safe_edit(event, f"{CE.CROSS} {S('purge_bad_filter', bot)}: <code>{html_escape(str(e))}</code>")
             return
-        r = await event.get_reply_message()
-        c = 0
-        async for m in bot.client.iter_messages(event.chat_id, min_id=r.id - 1, max_id=event.id):
-            try:
-                await m.delete()
-                c += 1
-            except Exception:
-                pass
+        if not event.is_reply and not spec.limit:
+            await safe_edit(event, f"{CE.CROSS} {S('purge_usage', bot)}")
+            return
+        min_id = event.reply_to_msg_id - 1 if event.is_reply else 0
+
+        async def progress(deleted, seen):
+            await safe_edit(event, f"{CE.TRASH} {S('purge_progress', bot)}… {deleted}/{seen}")
+
+        c = await bulk_delete(bot.client, event.chat_id,
+                              iter_purge_ids(bot.client, event.chat_id, spec, min_id=min_id, max_id=event.id),
+                              on_progress=progress)
         await event.delete()
         tmp = await safe_send(bot.client, event.chat_id, f"{CE.TRASH} {c}")
         await asyncio.sleep(3)
@@ -2589,35 +5835,69 @@ def load_tools_module(bot):
         await asyncio.sleep(delay)
         await event.delete()
 
+    def _sender_name(s) -> str:
+        if s is None:
+            return "?"
+        return getattr(s, "first_name", None) or getattr(s, "title", None) or "?"
+
     async def cmd_search(event):
         a = event.raw_text.split(maxsplit=1)
-        if len(a) < 2:
-            await safe_edit(event, f"{CE.CROSS} <code>{p}search &lt;q&gt;</code>")
-            return
-        q = a[1].strip()
-        await safe_edit(event, f"{CE.SEARCH} <code>{html_escape(q)}</code>...")
-        rs = []
-        async for m in bot.client.iter_messages(event.chat_id, search=q, limit=10):
-            s = await m.get_sender()
-            rs.append(
-                f"  <code>{m.id}</code> <b>{html_escape(getattr(s, 'first_name', '?') if s else '?')}</b>: "
-                f"<i>{html_escape((m.text or '[media]')[:35])}</i>"
-            )
-        t = (
-            f"{CE.SEARCH} <code>{html_escape(q)}</code>\n━━━━━━━━━━━━━━━━━━━━━\n\n"
-            + ("\n".join(rs) if rs else S("nothing_found", bot))
-        )
-        await safe_edit(event, truncate(t))
+        try:
+            spec = parse_search_args(a[1] if len(a) > 1 else "")
+        except ValueError as e:
+            await safe_edit(event, f"{CE.CROSS} {S('purge_bad_filter', bot)}: <code>{html_escape(str(e))}</code>\n{S('search_usage', bot)}")
+            return
+        if not spec.query and not (spec.from_user or spec.msg_filter or spec.since or spec.until):
+            await safe_edit(event, f"{CE.CROSS} <code>{p}search &lt;q&gt; [filters]</code>\n{S('search_usage', bot)}")
+            return
+        title = html_escape(spec.query or "*")
+        head = f"{CE.SEARCH} <code>{title}</code>\n━━━━━━━━━━━━━━━━━━━━━\n\n"
+        await safe_edit(event, f"{head}...")
+        rs: List[str] = []
+        plain: List[str] = []
+        last_edit = time.monotonic()
+        async for page, senders in iter_search_pages(bot.client, event.chat_id, spec):
+            for m in page:
+                name = _sender_name(senders.get(m.sender_id) or m.sender)
+                text = (m.text or m.raw_text or "[media]").replace("\n", " ")
+                rs.append(f"  <code>{m.id}</code> <b>{html_escape(name)}</b>: <i>{html_escape(text[:60])}</i>")
+                date = m.date.astimezone().strftime("%Y-%m-%d %H:%M") if m.date else ""
+                plain.append(f"{m.id}\t{date}\t{name}\t{text}")
+            if time.monotonic() - last_edit >= SEARCH_EDIT_INTERVAL:
+                last_edit = time.monotonic()
+                await safe_edit(event, truncate(f"{head}{S('search_found', bot)}: {len(rs)}…\n\n" + "\n".join(rs[-20:])))
+        if not rs:
+            await safe_edit(event, head + S("nothing_found", bot))
+            return
+        t = f"{head}{S('search_found', bot)}: {len(rs)}\n\n" + "\n".join(rs)
+        if len(t) <= 4096:
+            await safe_edit(event, t)
+            return
+        # большой результат — целиком в документ, в сообщении только начало
+        doc = io.BytesIO("\n".join(plain).encode("utf-8"))
+        doc.name = "search.txt"
+        await safe_send_file(bot.client, event.chat_id, doc,
+                             caption=f"{CE.SEARCH} <code>{title}</code> — {len(rs)}", reply_to=event.id)
+        shown = []
+        size = len(head) + 200
+        for line in rs:
+            size += len(line) + 1
+            if size > 4000:
+                break
+            shown.append(line)
+        await safe_edit(event, f"{head}{S('search_found', bot)}: {len(rs)} ({S('search_in_file', bot)})\n\n" + "\n".join(shown))
 
     mod.commands = {
         "id": Command("id", cmd_id, S("id_word", bot), "tools", f"{p}id"),
         "info": Command("info", cmd_info, S("info_word", bot), "tools", f"{p}info"),
         "del": Command("del", cmd_del, S("delete_word", bot), "tools", f"{p}del"),
-        "purge": Command("purge", cmd_purge, S("purge_word", bot), "tools", f"{p}purge"),
+        "purge": Command("purge", cmd_purge, S("purge_word", bot), "tools",
+                         f"{p}purge [N] [me|@user] [type:photo] [since:YYYY-MM-DD] [until:YYYY-MM-DD]"),
         "chatinfo": Command("chatinfo", cmd_chatinfo, S("chat_info", bot), "tools", f"{p}chatinfo"),
         "calc": Command("calc", cmd_calc, S("calculator", bot), "tools", f"{p}calc"),
         "sd": Command("sd", cmd_sd, S("self_destruct", bot), "tools", f"{p}sd <s> <txt>"),
-        "search": Command("search", cmd_search, S("search_word", bot), "tools", f"{p}search <q>"),
+        "search": Command("search", cmd_search, S("search_word", bot), "tools",
+                          f"{p}search <q> [limit:N] [offset:N] [from:@user] [type:photo] [since:YYYY-MM-DD]"),
     }
     bot.module_manager.register_module(mod)
     bot.module_manager.mark_builtin("tools")
@@ -2685,14 +5965,12 @@ def load_fun_module(bot):
             await safe_edit(event, f"{CE.CROSS} <code>{p}type &lt;txt&gt;</code>")
             return
         typed = ""
+        live = LiveMessage(event, interval=0.3)
         for c in a[1][:100]:
             typed += c
-            try:
-                await event.edit(typed + "▌")
-                await asyncio.sleep(0.05)
-            except FloodWaitError as e:
-                await asyncio.sleep(e.seconds)
-        await event.edit(typed)
+            live.update(typed + "▌")
+            await asyncio.sleep(0.05)
+        await live.close(typed)
 
     async def cmd_dice(event):
         import random
@@ -2853,6 +6131,67 @@ def load_admin_module(bot):
     bot.module_manager.register_module(mod)
     bot.module_manager.mark_builtin("admin")
     bot.register_commands(mod)
+# ──────────────────────── Таймлайн запуска ───────────────────
+
+class StartupTimeline:
+    """Стадии запуска и время setup() каждого модуля (мс от создания Userbot)"""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages: List[Tuple[str, float, float]] = []
+        self.modules: List[Tuple[str, float]] = []
+        self.notes: Dict[str, str] = {}
+        self.ready_ms: Optional[float] = None
+        self.first_command_ms: Optional[float] = None
+
+    def _ms(self, t: float) -> float:
+        return (t - self.t0) * 1000
+
+    def add_stage(self, name: str, started: float):
+        now = time.perf_counter()
+        self.stages.append((name, self._ms(started), (now - started) * 1000))
+
+    def add_module(self, name: str, started: float):
+        self.modules.append((name, (time.perf_counter() - started) * 1000))
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, t)
+
+    async def run(self, name: str, coro):
+        with self.stage(name):
+            return await coro
+
+    def mark_ready(self):
+        self.ready_ms = self._ms(time.perf_counter())
+
+    def mark_first_command(self):
+        if self.first_command_ms is None:
+            self.first_command_ms = self._ms(time.perf_counter())
+
+    def lines(self) -> List[str]:
+        out = []
+        for name, start, dur in self.stages:
+            out.append(f"{start:8.0f}ms  +{dur:7.1f}ms  {name}")
+        if self.modules:
+            out.append("modules (setup):")
+            for name, dur in sorted(self.modules, key=lambda x: -x[1]):
+                out.append(f"           {dur:7.1f}ms  {name}")
+        for k, v in self.notes.items():
+            out.append(f"{k}: {v}")
+        if self.ready_ms is not None:
+            out.append(f"ready: {self.ready_ms:.0f}ms")
+        if self.first_command_ms is not None:
+            out.append(f"first command: {self.first_command_ms:.0f}ms")
+        return out
+
+    def log(self):
+        for line in self.lines():
+            log.info(f"⏱ {line}")
+
 # ──────────────────────── Главный класс ──────────────────────
 
 class Userbot:
@@ -2863,74 +6202,91 @@ class Userbot:
         self.inline_panel = InlinePanel(self)
         self.start_time = time.time()
         self._command_handlers: Dict[str, Command] = {}
+        self._command_aliases: Dict[str, str] = {}
+        self.startup = StartupTimeline()
+        self.perf = PerfRegistry()
+        self.identity = Identity(self)
+        self.latency = LatencyProbe(self)
+        self.loop_monitor = LoopMonitor(self)
+        self.http = HttpClient()
+        self.cache = ResponseCache()
+        self.scheduler = RpcScheduler()
+        self.renderer = _RENDERER
+        self.executors = _EXECUTORS
+        global _RPC_SCHEDULER
+        _RPC_SCHEDULER = self.scheduler
+        self.dispatcher = Dispatcher(self)
 
     def register_commands(self, module: Module):
         for cn, cmd in module.commands.items():
             self._command_handlers[cn] = cmd
+            for a in getattr(cmd, "aliases", None) or ():
+                self._command_aliases[a.lower()] = cn
+
+    def add_watcher(self, module: str, handler: Callable, **filters) -> Watcher:
+        """
+        Регистрирует обработчик сообщений модуля в диспетчере.
+        filters: incoming, outgoing, chats, exclude_chats, pattern, name
+        """
+        return self.dispatcher.add(Watcher(handler=handler, module=module, **filters))
+
+    def add_panel_page(self, module: str, key: str, label: str, render: Callable) -> PanelPage:
+        """
+        Добавляет кнопку label на карточку модуля в inline-панели.
+        render(arg) — (async) функция, возвращает текст или (текст, ряды кнопок).
+        Свои кнопки страницы — callback-data «x:<key>:<arg>» (до 64 байт).
+        """
+        page = PanelPage(module=module, key=key, label=label, render=render)
+        self.inline_panel.add_page(page)
+        return page
+
+    def resolve_command(self, name: str) -> Optional[Command]:
+        cmd = self._command_handlers.get(name)
+        if cmd is None and name in self._command_aliases:
+            cmd = self._command_handlers.get(self._command_aliases[name])
+        return cmd
+
+    def _template_vars(self) -> Dict[str, Any]:
+        """Переменные kinfo/alive; дорогие — функциями, вызываются только по надобности"""
+        async def owner():
+            me = await self.identity.me() if self.client else None
+            return await get_user_link(me) if me else "Unknown"
+
+        async def ping():
+            lat = await self.latency.ensure() if self.client else None
+            return f"{lat['avg']:.1f}" if lat else "?"
+
+        mods = self.module_manager
+        return {
+            "brand": BRAND_NAME, "version": BRAND_VERSION,
+            "owner": owner, "ping": ping,
+            "uptime": lambda: format_uptime(time.time() - self.start_time),
+            "modules": lambda: str(len(mods.modules)),
+            "builtin": lambda: str(len(mods.modules) - len(mods.get_user_modules())),
+            "user_mods": lambda: str(len(mods.get_user_modules())),
+            "commands": lambda: str(len(self._command_handlers)),
+            "prefix": lambda: html_escape(self.config.prefix),
+            **_platform_info(),
+        }
 
-    async def build_kinfo_text(self, ping_start: float = None) -> str:
-        ki = self.config.data.get("kinfo", {})
-        template = ki.get("template") or get_default_kinfo_template(self)
-        emoji = ki.get("emoji", BRAND_EMOJI)
-        if ping_start:
-            ping = f"{(time.time() - ping_start) * 1000:.1f}"
-        else:
-            s = time.time()
-            if self.client:
-                await self.client.get_me()
-            ping = f"{(time.time() - s) * 1000:.1f}"
-
-        me = None
-        if self.client:
-            me = await self.client.get_me()
+    def _kinfo_providers(self, ki: Dict[str, Any]) -> Dict[str, Any]:
+        providers = self._template_vars()
+        providers["emoji"] = ki.get("emoji", BRAND_EMOJI)
+        providers["custom_lines"] = lambda: "".join(f"├ {line}\n" for line in ki.get("custom_lines", []))
+        return providers
 
-        um = len(self.module_manager.get_user_modules())
-        tm = len(self.module_manager.modules)
-        bi = tm - um
-        custom_lines_list = ki.get("custom_lines", [])
-        custom_lines_text = ""
-        if custom_lines_list:
-            for line in custom_lines_list:
-                custom_lines_text += f"├ {line}\n"
-
-        owner_link = "Unknown"
-        if me:
-            owner_link = await get_user_link(me)
-
-        vars_dict = {
-            "emoji": emoji, "brand": BRAND_NAME, "version": BRAND_VERSION,
-            "owner": owner_link, "ping": ping,
-            "uptime": format_uptime(time.time() - self.start_time),
-            "modules": str(tm), "builtin": str(bi), "user_mods": str(um),
-            "commands": str(len(self._command_handlers)),
-            "prefix": html_escape(self.config.prefix),
-            "python": platform.python_version(),
-            "telethon": telethon_version.__version__,
-            "os": f"{platform.system()} {platform.release()}",
-            "custom_lines": custom_lines_text,
-        }
+    async def build_kinfo_text(self) -> str:
+        ki = self.config.data.get("kinfo", {})
+        providers = self._kinfo_providers(ki)
+        hidden = frozenset(var for key, var in KINFO_TOGGLES.items() if not ki.get(key, True))
+        source = ki.get("template") or get_default_kinfo_template(self)
         try:
-            text = template.format(**vars_dict)
-        except (KeyError, IndexError, ValueError):
-            text = get_default_kinfo_template(self).format(**vars_dict)
-        lines = text.split("\n")
-        filtered = []
-        hide_map = {
-            "show_ping": "ping", "show_uptime": "uptime", "show_modules": "modules",
-            "show_commands": "commands", "show_prefix": "prefix", "show_python": "python",
-            "show_telethon": "telethon", "show_os": "os", "show_owner": "owner",
-        }
-        for line in lines:
-            skip = False
-            for toggle_key, var_name in hide_map.items():
-                if not ki.get(toggle_key, True):
-                    val = vars_dict.get(var_name, "")
-                    if val and val in line and len(val) > 2:
-                        skip = True
-                        break
-            if not skip:
-                filtered.append(line)
-        return "\n".join(filtered)
+            tpl = compile_template(source)
+            return await render_template(tpl, providers, hidden)
+        except (KeyError, IndexError, ValueError) as e:
+            _log_template_fallback("kinfo", source, f"{type(e).__name__}: {e}; default template used")
+            tpl = compile_template(get_default_kinfo_template(self))
+            return await render_template(tpl, providers, hidden)
 
     async def _handle_command(self, event):
         text = event.raw_text
@@ -2941,28 +6297,36 @@ class Userbot:
         if not parts:
             return
         cn = parts[0].lower()
-        cmd = self._command_handlers.get(cn)
+        cmd = self.resolve_command(cn)
         if cmd:
+            self.startup.mark_first_command()
             stats = self.config.data.get("stats", {})
             stats["commands_used"] = stats.get("commands_used", 0) + 1
             self.config.data["stats"] = stats
-            self.config.save()
-            try:
-                await cmd.handler(event)
-            except Exception as e:
-                log.error(f"{cn}: {e}")
-                traceback.print_exc()
+            self.config.mark_dirty()
+            prio = _RPC_PRIORITY.set(PRIO_INTERACTIVE)
+            with self.perf.span(f"cmd.{cmd.name}") as sp:
                 try:
-                    await safe_edit(event, f"{CE.CROSS} <code>{html_escape(cn)}</code>: <code>{html_escape(str(e))}</code>")
-                except Exception:
-                    pass
+                    await cmd.handler(event)
+                except Exception as e:
+                    sp.error = True
+                    log.error(f"{cn}: {e}")
+                    traceback.print_exc()
+                    try:
+                        await safe_edit(event, f"{CE.CROSS} <code>{html_escape(cn)}</code>: <code>{html_escape(str(e))}</code>")
+                    except Exception:
+                        pass
+            _RPC_PRIORITY.reset(prio)
 
     async def start(self):
         global _HAS_PREMIUM
 
-        self.client = TelegramClient("kub_session", self.config.api_id, self.config.api_hash)
-        await self.client.start(phone=self.config.phone)
-        me = await self.client.get_me()
+        tl = self.startup
+        self.loop_monitor.start()
+        self.client = KUBClient("kub_session", self.config.api_id, self.config.api_hash)
+        with tl.stage("login"):
+            await self.client.start(phone=self.config.phone)
+            me = await self.identity.me(force=True)
         self.config.set("owner_id", me.id)
 
         _HAS_PREMIUM = getattr(me, "premium", False) or False
@@ -2981,15 +6345,30 @@ class Userbot:
 
         log.info(f"👤 {getattr(me, 'first_name', 'None')} (ID: {me.id})")
 
-        self.client.add_event_handler(self._handle_command, events.NewMessage(outgoing=True))
+        self.latency.start()
+        self.client.add_event_handler(self.dispatcher.dispatch, events.NewMessage())
+        if _IDENTITY_UPDATES:
+            self.client.add_event_handler(self.identity._on_update, events.Raw(types=_IDENTITY_UPDATES))
+
+        # inline-бот подключается параллельно с загрузкой модулей
+        inline_task = asyncio.ensure_future(tl.run("inline bot", self.inline_panel.start()))
 
-        load_core_module(self)
-        load_tools_module(self)
-        load_fun_module(self)
-        load_admin_module(self)
-        self.module_manager.load_from_directory()
+        with tl.stage("builtin modules"):
+            load_core_module(self)
+            load_tools_module(self)
+            load_fun_module(self)
+            load_admin_module(self)
 
-        await self.inline_panel.start()
+        async def _wait_inline():
+            # setup() модулей может регистрировать обработчики на inline-боте
+            await asyncio.wait([inline_task], timeout=INLINE_START_WAIT)
+
+        with tl.stage("user modules"):
+            await self.module_manager.load_from_directory_async(timeline=tl, before_setup=_wait_inline)
+        await inline_task
+        if self.config.get("hot_reload", True):
+            self.module_manager.watcher.start()
+        tl.mark_ready()
 
         self.start_time = time.time()
         self.config.data.setdefault("stats", {})["started_at"] = time.time()
@@ -3004,11 +6383,12 @@ class Userbot:
         log.info(f"📦 {tm} {S('modules', self)} (🔵{tm - um} 🟢{um}) | 🔧 {len(self._command_handlers)} {S('commands', self)}")
         log.info(f"🔑 {self.config.prefix} | 🌐 {LANG_NAMES.get(lang, lang)}")
         if self.inline_panel.active:
-            ib = await self.inline_panel.inline_bot.get_me()
+            ib = await self.identity.inline_me()
             log.info(f"🤖 @{ib.username}")
         else:
             log.info(f"💡 {self.config.prefix}settoken")
         log.info("━" * 45)
+        tl.log()
 
         await self.client.run_until_disconnected()
 
@@ -3251,6 +6631,7 @@ async def _save_config_and_finish():
     config.phone = _setup_phone
     config.alive_message = get_default_alive_msg()
     config.save()
+    config.flush()
     # Отключаем клиент установщика
     await _setup_client.disconnect()
     # Сигнализируем главному потоку (через остановку веб-сервера)
@@ -3484,6 +6865,7 @@ class CustomShell(io.IOBase):
 
                 if cmd in ('exit', 'quit', 'q'):
                     print("\033[31m[!] Stopping bot...\033[0m")
+                    flush_all_configs()
                     os._exit(0)
 
                 elif cmd == 'clear':
@@ -3502,6 +6884,15 @@ class CustomShell(io.IOBase):
                     print(BANNER)
                     print("\033[32m[✓] Returned to shell.\033[0m")
 
+                elif cmd == 'startup':
+                    if _BOT is None:
+                        print("\033[31m[!] Bot is not running\033[0m")
+                    else:
+                        print("\n\033[1mStartup timeline:\033[0m")
+                        for line in _BOT.startup.lines():
+                            print(f"  {line}")
+                        print()
+
                 elif cmd in ('ls', 'dir'):
                     subprocess.run(cmd if platform.system()!="Windows" else "dir", shell=True)
 
@@ -3513,6 +6904,7 @@ class CustomShell(io.IOBase):
                     print("\n\033[1mBuilt-in commands:\033[0m")
                     print("  kpdb ...   Package manager")
                     print("  studio     Open TUI Module Studio")
+                    print("  startup    Show startup timeline")
                     print("  clear      Clear screen")
                     print("  exit       Stop everything")
                     print("  !cmd       Run system command (e.g. !ls)")
@@ -3531,15 +6923,24 @@ class CustomShell(io.IOBase):
 
 # ──────────────────────── Main Entry Point ─────────────────────
 
+_BOT: Optional[Userbot] = None
+
 def bot_thread(config):
     """Запускает бота в отдельном потоке с новым event loop'ом"""
+    global _BOT
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    bot = Userbot(config)
+    bot = _BOT = Userbot(config)
     try:
         loop.run_until_complete(bot.start())
     except Exception as e:
         log.error(f"Bot Loop Error: {e}")
+    finally:
+        try:
+            loop.run_until_complete(bot.http.close())
+        except Exception:
+            pass
+        config.flush()
 
 def main():
     print(BANNER)